@@ -0,0 +1,87 @@
+import pytest
+
+from zx64c.benchmarks.compiler import (
+    find_baseline,
+    find_regressions,
+    generate_program,
+    measure_phases,
+)
+from zx64c.benchmarks.runtime import (
+    LEVELS,
+    Measurement,
+    find_problems,
+    list_programs,
+    load_expected,
+    measure_program,
+)
+from zx64c.parser import Parser
+from zx64c.scanner import Scanner
+from zx64c.typechecker import TypecheckerVisitor
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_generated_programs_are_valid(seed):
+    source = generate_program(seed, functions=4, statements=8, expression_size=6)
+
+    ast = Parser(Scanner(source).scan()).parse()
+    ast.visit(TypecheckerVisitor())
+
+    assert len(ast.functions) == 5
+
+
+def test_programs_are_generated_from_seed():
+    assert generate_program(7, functions=3) == generate_program(7, functions=3)
+    assert generate_program(7, functions=3) != generate_program(8, functions=3)
+
+
+def test_every_phase_is_measured():
+    phases = measure_phases(generate_program(0, functions=1), repeats=1)
+
+    assert list(phases) == ["scanner", "parser", "typechecker", "codegen"]
+    assert all(result.peak_memory > 0 for result in phases.values())
+
+
+def record(seconds, peak_memory):
+    return {"phases": {"parser": {"seconds": seconds, "peak_memory": peak_memory}}}
+
+
+def test_growth_beyond_threshold_is_regression():
+    regressions = find_regressions(record(1.0, 1000), record(1.2, 1050), 0.1)
+
+    assert [(r.phase, r.metric) for r in regressions] == [("parser", "seconds")]
+    assert str(regressions[0]) == ("parser: seconds regressed by 20.0% (1 -> 1.2)")
+
+
+def test_baseline_is_last_record_of_same_config():
+    history = [
+        {"config": {"functions": 5}, "label": "old"},
+        {"config": {"functions": 10}, "label": "other"},
+        {"config": {"functions": 5}, "label": "new"},
+    ]
+
+    assert find_baseline(history, {"functions": 5})["label"] == "new"
+    assert find_baseline(history, {"functions": 20}) is None
+
+
+@pytest.mark.parametrize("level", LEVELS)
+@pytest.mark.parametrize("name", list_programs())
+def test_corpus_programs_print_expected_output(name, level):
+    expected = load_expected()[name]
+
+    assert measure_program(name, level).output == expected["output"]
+
+
+def test_slower_or_bigger_code_is_problem():
+    expected = {"output": "9", "levels": {"1": {"cycles": 100, "size": 10}}}
+
+    assert find_problems("p", 1, Measurement("9", 105, 10), expected, 0.1) == []
+    assert find_problems("p", 1, Measurement("9", 120, 11), expected, 0.05) == [
+        "p -O1: cycles grew from 100 to 120",
+        "p -O1: size grew from 10 to 11",
+    ]
+    assert find_problems("p", 1, Measurement("8", 90, 9), expected, 0.0) == [
+        "p -O1: printed '8' instead of '9'"
+    ]
+    assert find_problems("p", 2, Measurement("9", 90, 9), expected, 0.0) == [
+        "p -O2: no expected results, run with --update"
+    ]
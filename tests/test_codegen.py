@@ -0,0 +1,683 @@
+import pytest
+
+from tests.ast import (
+    ProgramTC,
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    EqualTC,
+    NotEqualTC,
+    AdditionTC,
+    SubtractionTC,
+    UnsignedintTC,
+    IdentifierTC,
+    FunctionCallTC,
+    BoolTC,
+)
+from zx64c.types import Void, U8, Bool
+from zx64c.ast import Program, Parameter, Print, Return, Function, SourceContext
+from zx64c.codegen import (
+    CodegenOptions,
+    Z80CodegenVisitor,
+    SjasmplusSnapshotVisitor,
+    FrameSavings,
+    frameless_savings,
+    generate_function,
+)
+from zx64c.codegen.frame import build_frame_layout
+from zx64c.codegen.z80 import (
+    Instruction,
+    Label,
+    Directive,
+    Comment,
+    SourceLine,
+    Opcode,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+    Address,
+    Indirect,
+    Indexed,
+    Location,
+    TimingLookupError,
+    code_size,
+    render,
+)
+
+
+def generate_code(ast):
+    if not isinstance(ast, Program):
+        return generate_function(ast)
+    codegen = Z80CodegenVisitor()
+    ast.visit(codegen)
+    return codegen.code
+
+
+def instructions(code):
+    return [item for item in code if isinstance(item, Instruction)]
+
+
+@pytest.mark.parametrize(
+    "instruction, size, cycles, cycles_not_taken",
+    [
+        (Instruction(Opcode.LD, Register.A, Register.B), 1, 4, 4),
+        (Instruction(Opcode.LD, Register.A, Immediate(1)), 2, 7, 7),
+        (Instruction(Opcode.LD, Register.A, Indexed(Register.IX, -1)), 3, 19, 19),
+        (Instruction(Opcode.LD, Register.HL, Address(0x8000)), 3, 16, 16),
+        (Instruction(Opcode.LD, Address(0x8000), Register.SP), 4, 20, 20),
+        (Instruction(Opcode.LD, Register.C, Indirect(Register.HL)), 1, 7, 7),
+        (Instruction(Opcode.PUSH, Register.AF), 1, 11, 11),
+        (Instruction(Opcode.POP, Register.IX), 2, 14, 14),
+        (Instruction(Opcode.ADD, Register.HL, Register.SP), 1, 11, 11),
+        (Instruction(Opcode.NEG), 2, 8, 8),
+        (Instruction(Opcode.JR, Condition.Z, LabelRef("L")), 2, 12, 7),
+        (Instruction(Opcode.JP, Condition.NZ, LabelRef("L")), 3, 10, 10),
+        (Instruction(Opcode.CALL, LabelRef("f")), 3, 17, 17),
+        (Instruction(Opcode.RST, Immediate(0x10)), 1, 11, 11),
+    ],
+)
+def test_instruction_timing(instruction, size, cycles, cycles_not_taken):
+    assert instruction.size == size
+    assert instruction.cycles == cycles
+    assert instruction.cycles_not_taken == cycles_not_taken
+
+
+@pytest.mark.parametrize(
+    "instruction",
+    [
+        Instruction(Opcode.LD, Register.IX, Register.HL),
+        Instruction(Opcode.LD, Register.B, Address(0x8000)),
+        Instruction(Opcode.JR, Condition.PE, LabelRef("L")),
+    ],
+)
+def test_invalid_instruction_has_no_timing(instruction):
+    with pytest.raises(TimingLookupError):
+        instruction.size
+
+
+@pytest.mark.parametrize(
+    "instruction, reads, writes",
+    [
+        (
+            Instruction(Opcode.LD, Register.A, Indexed(Register.IX, -1)),
+            {Location.IX, Location.MEMORY},
+            {Location.A},
+        ),
+        (
+            Instruction(Opcode.ADD, Register.A, Register.B),
+            {Location.A, Location.B},
+            {Location.A, Location.ZERO_FLAG, Location.CARRY_FLAG, Location.OTHER_FLAGS},
+        ),
+        (
+            Instruction(Opcode.CP, Immediate(1)),
+            {Location.A},
+            {Location.ZERO_FLAG, Location.CARRY_FLAG, Location.OTHER_FLAGS},
+        ),
+        (
+            Instruction(Opcode.PUSH, Register.HL),
+            {Location.H, Location.L, Location.SP},
+            {Location.SP, Location.MEMORY},
+        ),
+        (
+            Instruction(Opcode.JP, Condition.NZ, LabelRef("x")),
+            {Location.ZERO_FLAG},
+            set(),
+        ),
+        (
+            Instruction(Opcode.INC, Register.HL),
+            {Location.H, Location.L},
+            {Location.H, Location.L},
+        ),
+        (
+            Instruction(Opcode.RET),
+            {Location.A, Location.IX, Location.SP, Location.MEMORY},
+            {Location.SP},
+        ),
+        (
+            Instruction(Opcode.CALL, LabelRef("f")),
+            {Location.SP, Location.MEMORY},
+            set(Location) - {Location.SP, Location.IX},
+        ),
+    ],
+)
+def test_instruction_effects(instruction, reads, writes):
+    assert instruction.reads == reads
+    assert instruction.writes == writes
+
+
+def test_render_items():
+    code = [
+        Directive("org", ("$8000",)),
+        Instruction(Opcode.JP, LabelRef("main")),
+        Label("main"),
+        Comment("comment"),
+        Instruction(Opcode.LD, Register.A, Indexed(Register.IX, -1)),
+        Instruction(Opcode.LD, Indexed(Register.IX, 5), Register.A),
+        Instruction(Opcode.LD, Register.A, Immediate(48)),
+        Instruction(Opcode.RET),
+    ]
+
+    assert render(code) == (
+        "    org $8000\n"
+        "    jp main\n"
+        "\n"
+        "main:\n"
+        "    ; comment\n"
+        "    ld a, (ix - 1)\n"
+        "    ld (ix + 5), a\n"
+        "    ld a, $30\n"
+        "    ret"
+    )
+
+
+def test_code_size_counts_instructions_and_data():
+    code = [
+        Label("counter"),
+        Directive("dw", ("0",)),
+        Comment("comment"),
+        Instruction(Opcode.LD, Register.A, Immediate(1)),
+    ]
+
+    assert code_size(code) == 4
+
+
+def test_codegen_emits_instructions():
+    ast = FunctionTC(
+        "main",
+        [],
+        Void(),
+        BlockTC(
+            [
+                LetTC("x", U8(), UnsignedintTC(1)),
+                PrintTC(AdditionTC(IdentifierTC("x"), UnsignedintTC(48))),
+            ]
+        ),
+    )
+
+    code = generate_code(ast)
+
+    assert code[0] == Label("main")
+    assert instructions(code) == [
+        Instruction(Opcode.PUSH, Register.IX),
+        Instruction(Opcode.LD, Register.IX, Immediate(0)),
+        Instruction(Opcode.ADD, Register.IX, Register.SP),
+        Instruction(Opcode.LD, Register.A, Immediate(1)),
+        Instruction(Opcode.LD, Register.H, Register.A),
+        Instruction(Opcode.LD, Register.A, Register.H),
+        Instruction(Opcode.ADD, Register.A, Immediate(48)),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        Instruction(Opcode.LD, Register.SP, Register.IX),
+        Instruction(Opcode.POP, Register.IX),
+        Instruction(Opcode.RET),
+    ]
+
+
+def test_registers_are_saved_around_call():
+    ast = FunctionTC(
+        "main",
+        [],
+        Void(),
+        BlockTC(
+            [
+                LetTC("x", U8(), UnsignedintTC(1)),
+                FunctionCallTC("f", []),
+                PrintTC(IdentifierTC("x")),
+            ]
+        ),
+    )
+
+    body = instructions(generate_code(ast))[3:-3]
+
+    assert body == [
+        Instruction(Opcode.LD, Register.A, Immediate(1)),
+        Instruction(Opcode.LD, Register.H, Register.A),
+        Instruction(Opcode.PUSH, Register.HL),
+        Instruction(Opcode.CALL, LabelRef("f")),
+        Instruction(Opcode.POP, Register.HL),
+        Instruction(Opcode.LD, Register.A, Register.H),
+        Instruction(Opcode.RST, Immediate(0x10)),
+    ]
+
+
+@pytest.mark.parametrize(
+    "condition, expected",
+    [
+        (
+            EqualTC(IdentifierTC("flag"), BoolTC(True)),
+            [
+                Instruction(Opcode.LD, Register.A, Indexed(Register.IX, 5)),
+                Instruction(Opcode.CP, Immediate(1)),
+                Instruction(Opcode.JP, Condition.NZ, LabelRef(".L0")),
+            ],
+        ),
+        (
+            EqualTC(BoolTC(False), IdentifierTC("flag")),
+            [
+                Instruction(Opcode.LD, Register.A, Indexed(Register.IX, 5)),
+                Instruction(Opcode.OR, Register.A),
+                Instruction(Opcode.JP, Condition.NZ, LabelRef(".L0")),
+            ],
+        ),
+        (
+            NotEqualTC(IdentifierTC("flag"), IdentifierTC("flag")),
+            [
+                Instruction(Opcode.LD, Register.A, Indexed(Register.IX, 5)),
+                Instruction(Opcode.CP, Indexed(Register.IX, 5)),
+                Instruction(Opcode.JP, Condition.Z, LabelRef(".L0")),
+            ],
+        ),
+        (
+            IdentifierTC("flag"),
+            [
+                Instruction(Opcode.LD, Register.A, Indexed(Register.IX, 5)),
+                Instruction(Opcode.OR, Register.A),
+                Instruction(Opcode.JP, Condition.Z, LabelRef(".L0")),
+            ],
+        ),
+        (BoolTC(True), []),
+        (BoolTC(False), [Instruction(Opcode.JP, LabelRef(".L0"))]),
+    ],
+)
+def test_if_branches_on_flags(condition, expected):
+    ast = FunctionTC(
+        "f",
+        [Parameter("flag", Bool())],
+        Void(),
+        BlockTC([IfTC(condition, BlockTC([]))]),
+    )
+
+    assert instructions(generate_code(ast))[3:-3] == expected
+
+
+X = Indexed(Register.IX, 5)
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        (
+            AdditionTC(IdentifierTC("x"), UnsignedintTC(2)),
+            [Instruction(Opcode.ADD, Register.A, Immediate(2))],
+        ),
+        (
+            AdditionTC(UnsignedintTC(2), IdentifierTC("x")),
+            [Instruction(Opcode.ADD, Register.A, Immediate(2))],
+        ),
+        (
+            AdditionTC(IdentifierTC("x"), UnsignedintTC(1)),
+            [Instruction(Opcode.INC, Register.A)],
+        ),
+        (
+            AdditionTC(IdentifierTC("x"), UnsignedintTC(255)),
+            [Instruction(Opcode.DEC, Register.A)],
+        ),
+        (
+            SubtractionTC(IdentifierTC("x"), UnsignedintTC(2)),
+            [Instruction(Opcode.SUB, Immediate(2))],
+        ),
+        (
+            SubtractionTC(IdentifierTC("x"), UnsignedintTC(1)),
+            [Instruction(Opcode.DEC, Register.A)],
+        ),
+        (
+            SubtractionTC(UnsignedintTC(2), IdentifierTC("x")),
+            [
+                Instruction(Opcode.NEG),
+                Instruction(Opcode.ADD, Register.A, Immediate(2)),
+            ],
+        ),
+    ],
+)
+def test_literal_operands_are_immediate(expression, expected):
+    ast = FunctionTC(
+        "f", [Parameter("x", U8())], Void(), BlockTC([PrintTC(expression)])
+    )
+
+    body = instructions(generate_code(ast))[3:-3]
+
+    assert body == [
+        Instruction(Opcode.LD, Register.A, X),
+        *expected,
+        Instruction(Opcode.RST, Immediate(0x10)),
+    ]
+
+
+def test_operands_are_kept_in_temporary_registers():
+    lhs = AdditionTC(
+        AdditionTC(IdentifierTC("x"), UnsignedintTC(1)),
+        AdditionTC(IdentifierTC("x"), UnsignedintTC(2)),
+    )
+    rhs = AdditionTC(
+        AdditionTC(IdentifierTC("x"), UnsignedintTC(3)),
+        AdditionTC(IdentifierTC("x"), UnsignedintTC(4)),
+    )
+    ast = FunctionTC(
+        "f", [Parameter("x", U8())], Void(), BlockTC([PrintTC(SubtractionTC(lhs, rhs))])
+    )
+
+    body = instructions(generate_code(ast))[3:-3]
+
+    assert body == [
+        Instruction(Opcode.LD, Register.A, X),
+        Instruction(Opcode.ADD, Register.A, Immediate(3)),
+        Instruction(Opcode.LD, Register.B, Register.A),
+        Instruction(Opcode.LD, Register.A, X),
+        Instruction(Opcode.ADD, Register.A, Immediate(4)),
+        Instruction(Opcode.ADD, Register.A, Register.B),
+        Instruction(Opcode.LD, Register.B, Register.A),
+        Instruction(Opcode.LD, Register.A, X),
+        Instruction(Opcode.INC, Register.A),
+        Instruction(Opcode.LD, Register.C, Register.A),
+        Instruction(Opcode.LD, Register.A, X),
+        Instruction(Opcode.ADD, Register.A, Immediate(2)),
+        Instruction(Opcode.ADD, Register.A, Register.C),
+        Instruction(Opcode.SUB, Register.B),
+        Instruction(Opcode.RST, Immediate(0x10)),
+    ]
+
+
+def test_value_kept_across_call_is_spilled_to_frame():
+    expression = SubtractionTC(FunctionCallTC("f", []), FunctionCallTC("g", []))
+    ast = FunctionTC("main", [], Void(), BlockTC([PrintTC(expression)]))
+
+    body = instructions(generate_code(ast))[3:-3]
+
+    assert body == [
+        Instruction(Opcode.DEC, Register.SP),
+        Instruction(Opcode.CALL, LabelRef("f")),
+        Instruction(Opcode.LD, Indexed(Register.IX, -1), Register.A),
+        Instruction(Opcode.CALL, LabelRef("g")),
+        Instruction(Opcode.NEG),
+        Instruction(Opcode.ADD, Register.A, Indexed(Register.IX, -1)),
+        Instruction(Opcode.RST, Immediate(0x10)),
+    ]
+
+
+def make_countdown(callee):
+    return FunctionTC(
+        "countdown",
+        [Parameter("n", U8()), Parameter("acc", U8())],
+        U8(),
+        BlockTC(
+            [
+                ReturnTC(
+                    FunctionCallTC(
+                        callee,
+                        [
+                            SubtractionTC(IdentifierTC("n"), UnsignedintTC(1)),
+                            IdentifierTC("acc"),
+                        ],
+                    )
+                )
+            ]
+        ),
+    )
+
+
+def test_self_tail_call_jumps_over_prologue():
+    options = CodegenOptions(tail_calls=True)
+
+    code = generate_function(make_countdown("countdown"), options)
+
+    assert code[:6] == [
+        Label("countdown"),
+        Comment("BEGIN FUNCTION INITIALIZATION"),
+        Instruction(Opcode.PUSH, Register.IX),
+        Instruction(Opcode.LD, Register.IX, Immediate(0)),
+        Instruction(Opcode.ADD, Register.IX, Register.SP),
+        Comment("END FUNCTION INITIALIZATION"),
+    ]
+    assert code[6] == Label(".L0")
+    assert instructions(code)[-9:-3] == [
+        Instruction(Opcode.PUSH, Register.AF),
+        Instruction(Opcode.POP, Register.AF),
+        Instruction(Opcode.LD, Indexed(Register.IX, 5), Register.A),
+        Instruction(Opcode.POP, Register.AF),
+        Instruction(Opcode.LD, Indexed(Register.IX, 7), Register.A),
+        Instruction(Opcode.JP, LabelRef(".L0")),
+    ]
+    assert Instruction(Opcode.CALL, LabelRef("countdown")) not in code
+
+
+def test_tail_call_reuses_frame_of_caller():
+    options = CodegenOptions(tail_calls=True)
+
+    code = generate_function(make_countdown("other"), options)
+
+    assert instructions(code)[-6:-3] == [
+        Instruction(Opcode.LD, Register.SP, Register.IX),
+        Instruction(Opcode.POP, Register.IX),
+        Instruction(Opcode.JP, LabelRef("other")),
+    ]
+
+
+def test_tail_call_needs_room_for_arguments():
+    ast = FunctionTC(
+        "f",
+        [],
+        U8(),
+        BlockTC([ReturnTC(FunctionCallTC("g", [UnsignedintTC(1)]))]),
+    )
+
+    code = generate_function(ast, CodegenOptions(tail_calls=True))
+
+    assert Instruction(Opcode.CALL, LabelRef("g")) in code
+
+
+def test_sjasmplus_snapshot_wraps_program():
+    ast = ProgramTC([FunctionTC("main", [], Void(), BlockTC([]))])
+    codegen = SjasmplusSnapshotVisitor(Z80CodegenVisitor(), "source")
+
+    ast.visit(codegen)
+
+    assert codegen.code[0] == Directive("DEVICE", ("ZXSPECTRUM48",))
+    assert codegen.code[-1] == Directive("SAVESNA", ('"source.sna"', "main"))
+    assert all(isinstance(item.timing.size, int) for item in instructions(codegen.code))
+
+
+def make_function_with_if(name):
+    return FunctionTC(
+        name,
+        [],
+        Void(),
+        BlockTC([IfTC(EqualTC(UnsignedintTC(1), UnsignedintTC(1)), BlockTC([]))]),
+    )
+
+
+def test_labels_are_local_to_function():
+    ast = ProgramTC([make_function_with_if("f"), make_function_with_if("main")])
+
+    code = generate_code(ast)
+
+    labels = [item.name for item in code if isinstance(item, Label)]
+    assert labels == ["f", ".L0", "main", ".L0"]
+
+
+def test_codegen_is_reproducible():
+    ast = ProgramTC([make_function_with_if("main")])
+
+    assert generate_code(ast) == generate_code(ast)
+
+
+def test_parallel_codegen_keeps_source_order():
+    functions = [make_function_with_if(f"f{i}") for i in range(8)]
+    ast = ProgramTC(functions + [make_function_with_if("main")])
+    parallel_codegen = Z80CodegenVisitor(jobs=2)
+
+    ast.visit(parallel_codegen)
+
+    assert parallel_codegen.code == generate_code(ast)
+
+
+def test_frame_layout_assigns_slots():
+    ast = FunctionTC(
+        "f",
+        [Parameter("a", U8()), Parameter("b", U8())],
+        Void(),
+        BlockTC(
+            [
+                LetTC("x", U8(), UnsignedintTC(1)),
+                IfTC(BoolTC(True), BlockTC([LetTC("y", U8(), UnsignedintTC(2))])),
+                IfTC(BoolTC(True), BlockTC([LetTC("y", U8(), UnsignedintTC(3))])),
+            ]
+        ),
+    )
+
+    layout = build_frame_layout(ast)
+
+    assert layout.frame_size == 2
+    assert layout.is_parameter("a")
+    assert not layout.is_parameter("x")
+    assert [layout.get_offset(name) for name in ["a", "b", "x", "y"]] == [7, 5, -1, -2]
+
+
+def test_spill_slots_follow_local_variables():
+    ast = FunctionTC("f", [], Void(), BlockTC([LetTC("x", U8(), UnsignedintTC(1))]))
+
+    layout = build_frame_layout(ast, spill_slots=2)
+
+    assert layout.frame_size == 3
+    assert [layout.get_spill_offset(depth) for depth in range(2)] == [-2, -3]
+    with pytest.raises(IndexError):
+        layout.get_spill_offset(2)
+
+
+def test_large_frame_is_reserved_at_once():
+    lets = [LetTC(f"x{i}", U8(), UnsignedintTC(i)) for i in range(5)]
+    ast = FunctionTC("main", [], Void(), BlockTC(lets))
+    codegen = Z80CodegenVisitor(build_frame_layout(ast))
+
+    ast.visit(codegen)
+
+    assert instructions(codegen.code)[3:6] == [
+        Instruction(Opcode.LD, Register.HL, Immediate(-5)),
+        Instruction(Opcode.ADD, Register.HL, Register.SP),
+        Instruction(Opcode.LD, Register.SP, Register.HL),
+    ]
+
+
+def test_slots_out_of_displacement_range_are_addressed_through_hl():
+    lets = [LetTC(f"x{i}", U8(), UnsignedintTC(i)) for i in range(200)]
+    prints = [PrintTC(IdentifierTC(f"x{i}")) for i in range(200)]
+    ast = FunctionTC("main", [], Void(), BlockTC(lets + prints))
+
+    code = instructions(generate_code(ast))
+    store = code.index(Instruction(Opcode.LD, Indirect(Register.HL), Register.A))
+
+    assert all(
+        operand.fits_displacement
+        for instruction in code
+        for operand in instruction.operands
+        if isinstance(operand, Indexed)
+    )
+    assert code[store - 9 : store + 2] == [
+        Instruction(Opcode.PUSH, Register.HL),
+        Instruction(Opcode.PUSH, Register.DE),
+        Instruction(Opcode.PUSH, Register.AF),
+        Instruction(Opcode.PUSH, Register.IX),
+        Instruction(Opcode.POP, Register.HL),
+        Instruction(Opcode.LD, Register.DE, Immediate(-129)),
+        Instruction(Opcode.ADD, Register.HL, Register.DE),
+        Instruction(Opcode.POP, Register.AF),
+        Instruction(Opcode.POP, Register.DE),
+        Instruction(Opcode.LD, Indirect(Register.HL), Register.A),
+        Instruction(Opcode.POP, Register.HL),
+    ]
+
+
+FRAMELESS = CodegenOptions(frameless_leaves=True)
+
+
+def test_leaf_function_has_no_frame():
+    ast = FunctionTC(
+        "seven",
+        [Parameter("unused", U8())],
+        U8(),
+        BlockTC(
+            [
+                LetTC("x", U8(), UnsignedintTC(7)),
+                PrintTC(IdentifierTC("x")),
+                ReturnTC(IdentifierTC("x")),
+            ]
+        ),
+    )
+
+    code = generate_function(ast, FRAMELESS)
+
+    assert code == [
+        Label("seven"),
+        Instruction(Opcode.LD, Register.A, Immediate(7)),
+        Instruction(Opcode.LD, Register.H, Register.A),
+        Instruction(Opcode.LD, Register.A, Register.H),
+        Instruction(Opcode.PUSH, Register.HL),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        Instruction(Opcode.POP, Register.HL),
+        Instruction(Opcode.LD, Register.A, Register.H),
+        Instruction(Opcode.RET),
+        Instruction(Opcode.RET),
+    ]
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        PrintTC(IdentifierTC("n")),
+        LetTC("n2", U8(), IdentifierTC("n")),
+        FunctionCallTC("f", []),
+    ],
+)
+def test_function_that_uses_frame_keeps_it(statement):
+    ast = FunctionTC("f", [Parameter("n", U8())], Void(), BlockTC([statement]))
+
+    code = generate_function(ast, FRAMELESS)
+
+    assert instructions(code)[0] == Instruction(Opcode.PUSH, Register.IX)
+
+
+def test_frameless_savings_are_reported():
+    leaf = FunctionTC("one", [], U8(), BlockTC([ReturnTC(UnsignedintTC(1))]))
+    caller = FunctionTC(
+        "main", [], Void(), BlockTC([PrintTC(FunctionCallTC("one", []))])
+    )
+
+    savings = frameless_savings(ProgramTC([leaf, caller]))
+
+    assert savings == [FrameSavings("one", 16, 68)]
+    assert str(savings[0]) == (
+        "one: frameless, saves 16 bytes and 68 T-states per call"
+    )
+
+
+def test_statements_are_marked_with_source_lines():
+    ast = Function(
+        "seven",
+        [],
+        U8(),
+        BlockTC(
+            [
+                Print(UnsignedintTC(7), SourceContext(2, 5)),
+                Return(UnsignedintTC(7), SourceContext(3, 5)),
+            ]
+        ),
+        SourceContext(1, 1),
+    )
+    options = CodegenOptions(frameless_leaves=True, source_lines=True)
+
+    code = generate_function(ast, options)
+
+    assert code == [
+        Label("seven"),
+        SourceLine("line 1", 1),
+        SourceLine("line 2", 2),
+        Instruction(Opcode.LD, Register.A, Immediate(7)),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        SourceLine("line 3", 3),
+        Instruction(Opcode.LD, Register.A, Immediate(7)),
+        Instruction(Opcode.RET),
+        SourceLine("line 1", 1),
+        Instruction(Opcode.RET),
+    ]
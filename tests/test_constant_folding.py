@@ -0,0 +1,98 @@
+import pytest
+
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    EqualTC,
+    NotEqualTC,
+    AdditionTC,
+    SubtractionTC,
+    NegationTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+    BoolTC,
+)
+from zx64c.optimizer.constant_folding import ConstantFoldingVisitor
+from zx64c.types import Void
+
+
+@pytest.mark.parametrize(
+    "ast, expected",
+    [
+        (AdditionTC(UnsignedintTC(1), UnsignedintTC(48)), UnsignedintTC(49)),
+        (AdditionTC(UnsignedintTC(200), UnsignedintTC(100)), UnsignedintTC(44)),
+        (SubtractionTC(UnsignedintTC(1), UnsignedintTC(2)), UnsignedintTC(255)),
+        (NegationTC(UnsignedintTC(1)), UnsignedintTC(255)),
+        (NegationTC(UnsignedintTC(0)), UnsignedintTC(0)),
+        (
+            AdditionTC(
+                UnsignedintTC(1), SubtractionTC(UnsignedintTC(5), UnsignedintTC(3))
+            ),
+            UnsignedintTC(3),
+        ),
+        (EqualTC(UnsignedintTC(1), UnsignedintTC(1)), BoolTC(True)),
+        (EqualTC(UnsignedintTC(0), UnsignedintTC(256)), BoolTC(True)),
+        (EqualTC(BoolTC(True), BoolTC(False)), BoolTC(False)),
+        (NotEqualTC(UnsignedintTC(1), UnsignedintTC(2)), BoolTC(True)),
+        (NotEqualTC(BoolTC(False), BoolTC(False)), BoolTC(False)),
+    ],
+)
+def test_literals_are_folded(ast, expected):
+    assert ast.visit(ConstantFoldingVisitor()) == expected
+
+
+@pytest.mark.parametrize(
+    "ast, expected",
+    [
+        (AdditionTC(IdentifierTC("x"), UnsignedintTC(0)), IdentifierTC("x")),
+        (SubtractionTC(IdentifierTC("x"), UnsignedintTC(0)), IdentifierTC("x")),
+        (
+            SubtractionTC(UnsignedintTC(0), IdentifierTC("x")),
+            NegationTC(IdentifierTC("x")),
+        ),
+        (NegationTC(NegationTC(IdentifierTC("x"))), IdentifierTC("x")),
+        (
+            AdditionTC(
+                IdentifierTC("x"), SubtractionTC(UnsignedintTC(1), UnsignedintTC(1))
+            ),
+            IdentifierTC("x"),
+        ),
+    ],
+)
+def test_identities_are_simplified(ast, expected):
+    assert ast.visit(ConstantFoldingVisitor()) == expected
+
+
+@pytest.mark.parametrize(
+    "ast",
+    [
+        AdditionTC(IdentifierTC("x"), UnsignedintTC(1)),
+        EqualTC(IdentifierTC("x"), UnsignedintTC(1)),
+        NegationTC(FunctionCallTC("f", [])),
+    ],
+)
+def test_non_constant_expressions_are_kept(ast):
+    assert ast.visit(ConstantFoldingVisitor()) == ast
+
+
+def test_if_with_constant_condition_is_pruned():
+    taken = BlockTC([PrintTC(UnsignedintTC(1))])
+    ast = FunctionTC(
+        "main",
+        [],
+        Void(),
+        BlockTC(
+            [
+                IfTC(EqualTC(UnsignedintTC(1), UnsignedintTC(1)), taken),
+                IfTC(NotEqualTC(BoolTC(True), BoolTC(True)), BlockTC([])),
+                IfTC(IdentifierTC("x"), BlockTC([])),
+            ]
+        ),
+    )
+
+    folded = ast.visit(ConstantFoldingVisitor())
+
+    assert folded.code_block == BlockTC([taken, IfTC(IdentifierTC("x"), BlockTC([]))])
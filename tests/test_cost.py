@@ -0,0 +1,146 @@
+import json
+
+from zx64c.codegen.cost import LineCost, estimate_costs
+from zx64c.codegen.z80 import (
+    Instruction,
+    Label,
+    Directive,
+    SourceLine,
+    Opcode,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+)
+
+
+def line(number):
+    return SourceLine(f"line {number}", number)
+
+
+def test_straight_line_code_has_single_cost():
+    code = [
+        Label("f"),
+        Instruction(Opcode.LD, Register.A, Immediate(1)),
+        Instruction(Opcode.INC, Register.A),
+        Instruction(Opcode.RET),
+    ]
+
+    (function,) = estimate_costs(code).functions
+
+    assert (function.name, function.size) == ("f", 4)
+    assert function.best == function.worst == 7 + 4 + 10
+
+
+def test_conditional_jump_costs_taken_and_not_taken_paths():
+    code = [
+        Label("f"),
+        Instruction(Opcode.OR, Register.A),
+        Instruction(Opcode.JR, Condition.Z, LabelRef(".L0")),
+        Instruction(Opcode.LD, Register.A, Immediate(1)),
+        Instruction(Opcode.ADD, Register.A, Immediate(2)),
+        Label(".L0"),
+        Instruction(Opcode.RET),
+    ]
+
+    (function,) = estimate_costs(code).functions
+
+    assert function.best == 4 + 12 + 10
+    assert function.worst == 4 + 7 + 7 + 7 + 10
+
+
+def test_conditional_return_ends_path():
+    code = [
+        Label("f"),
+        Instruction(Opcode.RET, Condition.Z),
+        Instruction(Opcode.NEG),
+        Instruction(Opcode.RET),
+    ]
+
+    (function,) = estimate_costs(code).functions
+
+    assert (function.best, function.worst) == (11, 5 + 8 + 10)
+
+
+def test_backward_jump_ends_path():
+    code = [
+        Label("countdown"),
+        Label(".L0"),
+        Instruction(Opcode.DEC, Register.A),
+        Instruction(Opcode.JP, Condition.NZ, LabelRef(".L0")),
+        Instruction(Opcode.RET),
+    ]
+
+    (function,) = estimate_costs(code).functions
+
+    assert (function.best, function.worst) == (4 + 10, 4 + 10 + 10)
+
+
+def test_costs_of_lines_are_split_at_markers_and_added_up():
+    code = [
+        Label("f"),
+        line(1),
+        Instruction(Opcode.PUSH, Register.IX),
+        line(2),
+        Instruction(Opcode.OR, Register.A),
+        Instruction(Opcode.JP, Condition.Z, LabelRef(".L0")),
+        line(3),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        Label(".L0"),
+        line(1),
+        Instruction(Opcode.POP, Register.IX),
+        Instruction(Opcode.RET),
+    ]
+
+    (function,) = estimate_costs(code).functions
+
+    assert function.lines == [
+        LineCost(1, 5, 15 + 14 + 10, 15 + 14 + 10),
+        LineCost(2, 4, 14, 14),
+        LineCost(3, 1, 11, 11),
+    ]
+    assert function.best == 15 + 4 + 10 + 14 + 10
+    assert function.worst == 15 + 4 + 10 + 11 + 14 + 10
+
+
+def test_code_before_first_function_counts_only_in_total():
+    code = [
+        Directive("org", ("$8000",)),
+        Instruction(Opcode.JP, LabelRef("main")),
+        Label("main"),
+        Instruction(Opcode.RET),
+    ]
+
+    report = estimate_costs(code)
+
+    assert [function.name for function in report.functions] == ["main"]
+    assert report.size == 4
+
+
+def test_report_is_rendered_as_text_and_json():
+    code = [
+        Label("main"),
+        line(2),
+        Instruction(Opcode.RET, Condition.NZ),
+        Instruction(Opcode.RET),
+    ]
+
+    report = estimate_costs(code)
+
+    assert str(report) == (
+        "main: 2 bytes, 11-15 T-states\n"
+        "    line 2: 2 bytes, 11-15 T-states\n"
+        "total: 2 bytes"
+    )
+    assert json.loads(report.to_json()) == {
+        "size": 2,
+        "functions": [
+            {
+                "name": "main",
+                "size": 2,
+                "best": 11,
+                "worst": 15,
+                "lines": [{"line": 2, "size": 2, "best": 11, "worst": 15}],
+            }
+        ],
+    }
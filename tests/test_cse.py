@@ -0,0 +1,112 @@
+import pytest
+
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    AssignmentTC,
+    EqualTC,
+    AdditionTC,
+    NegationTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+)
+from zx64c.ast import Parameter
+from zx64c.optimizer.cse import eliminate_common_subexpressions_in_function
+from zx64c.types import Void, U8
+
+
+def make_function(statements):
+    parameters = [Parameter("x", U8()), Parameter("y", U8())]
+    return FunctionTC("f", parameters, Void(), BlockTC(statements))
+
+
+def x_plus_y():
+    return AdditionTC(IdentifierTC("x"), IdentifierTC("y"))
+
+
+def test_repeated_expression_is_computed_once():
+    function = make_function(
+        [
+            LetTC("a", U8(), AdditionTC(x_plus_y(), UnsignedintTC(1))),
+            LetTC(
+                "b",
+                U8(),
+                AdditionTC(
+                    AdditionTC(IdentifierTC("y"), IdentifierTC("x")), UnsignedintTC(2)
+                ),
+            ),
+        ]
+    )
+
+    optimized = eliminate_common_subexpressions_in_function(function)
+
+    assert optimized.code_block == BlockTC(
+        [
+            LetTC("cse.0", U8(), x_plus_y()),
+            LetTC("a", U8(), AdditionTC(IdentifierTC("cse.0"), UnsignedintTC(1))),
+            LetTC("b", U8(), AdditionTC(IdentifierTC("cse.0"), UnsignedintTC(2))),
+        ]
+    )
+
+
+def test_value_held_by_variable_is_reused():
+    function = make_function([LetTC("a", U8(), x_plus_y()), PrintTC(x_plus_y())])
+
+    optimized = eliminate_common_subexpressions_in_function(function)
+
+    assert optimized.code_block == BlockTC(
+        [LetTC("a", U8(), x_plus_y()), PrintTC(IdentifierTC("a"))]
+    )
+
+
+@pytest.mark.parametrize(
+    "statements",
+    [
+        [
+            LetTC("a", U8(), x_plus_y()),
+            AssignmentTC("x", UnsignedintTC(1)),
+            PrintTC(x_plus_y()),
+        ],
+        [
+            LetTC("a", U8(), x_plus_y()),
+            IfTC(IdentifierTC("b"), BlockTC([AssignmentTC("x", UnsignedintTC(1))])),
+            PrintTC(x_plus_y()),
+        ],
+        [
+            PrintTC(AdditionTC(FunctionCallTC("g", []), UnsignedintTC(1))),
+            PrintTC(AdditionTC(FunctionCallTC("g", []), UnsignedintTC(1))),
+        ],
+        [
+            PrintTC(EqualTC(IdentifierTC("x"), IdentifierTC("y"))),
+            PrintTC(EqualTC(IdentifierTC("x"), IdentifierTC("y"))),
+        ],
+        [
+            PrintTC(NegationTC(IdentifierTC("x"))),
+            PrintTC(NegationTC(IdentifierTC("x"))),
+        ],
+    ],
+    ids=["reassigned", "reassigned in if", "call", "comparison", "cheap"],
+)
+def test_value_is_recomputed(statements):
+    function = make_function(statements)
+
+    optimized = eliminate_common_subexpressions_in_function(function)
+
+    assert optimized == function
+
+
+def test_values_are_not_reused_across_blocks():
+    statements = [
+        LetTC("a", U8(), AdditionTC(x_plus_y(), UnsignedintTC(1))),
+        LetTC("b", U8(), AdditionTC(x_plus_y(), UnsignedintTC(2))),
+    ]
+    function = make_function([IfTC(IdentifierTC("c"), BlockTC(statements))])
+
+    optimized = eliminate_common_subexpressions_in_function(function)
+
+    consequence = optimized.code_block.statements[0].consequence
+    assert consequence.statements[0] == LetTC("cse.0", U8(), x_plus_y())
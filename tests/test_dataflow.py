@@ -0,0 +1,276 @@
+import pytest
+
+from tests.ast import (
+    ProgramTC,
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    AssignmentTC,
+    AdditionTC,
+    UnsignedintTC,
+    IdentifierTC,
+)
+from zx64c import ir
+from zx64c.ast import Parameter
+from zx64c.ir.builder import build_function_ir, build_ir
+from zx64c.ir.dataflow import (
+    DataflowProblem,
+    Liveness,
+    ReachingDefinitions,
+    Universe,
+    compute_liveness,
+    compute_reaching_definitions,
+    solve,
+)
+from zx64c.types import Void, Bool, U8
+
+
+def build(statements, return_type=Void()):
+    parameters = [Parameter("x", U8()), Parameter("flag", Bool())]
+    function = FunctionTC("f", parameters, return_type, BlockTC(statements))
+    return build_function_ir(function, {})
+
+
+def names(temps):
+    return {str(temp) for temp in temps}
+
+
+def assign_in_if():
+    """
+    b0: a.2 = x, branch flag
+    b1: %3 = a.2 + 1, a.4 = %3
+    b2: a.5 = phi(a.2, a.4), print a.5
+    """
+    return build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(
+                IdentifierTC("flag"),
+                BlockTC(
+                    [AssignmentTC("a", AdditionTC(IdentifierTC("a"), UnsignedintTC(1)))]
+                ),
+            ),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+
+@pytest.mark.parametrize("bits", [0b0, 0b1, 0b101, 0b111, 1 << 70 | 1, (1 << 71) - 1])
+def test_universe_converts_bits_back_to_items(bits):
+    universe = Universe(range(71))
+
+    assert universe.bits(universe.items(bits)) == bits
+
+
+def test_universe_numbers_items_once():
+    universe = Universe()
+
+    assert universe.add("a") == 0
+    assert universe.add("b") == 1
+    assert universe.add("a") == 0
+    assert len(universe) == 2
+    assert universe.bit("b") == 0b10
+
+
+def test_phi_uses_are_live_only_on_their_edge():
+    function = assign_in_if()
+
+    liveness = Liveness(function)
+
+    assert names(liveness.live_in("b0")) == {"%x.0", "%flag.1"}
+    assert names(liveness.live_out("b0")) == {"%a.2"}
+    assert names(liveness.live_in("b1")) == {"%a.2"}
+    assert names(liveness.live_out("b1")) == {"%a.4"}
+    assert liveness.live_in("b2") == set()
+
+
+def test_value_is_not_live_after_last_use():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("x"))])),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    liveness = Liveness(function)
+
+    assert names(liveness.live_in("b1")) == {"%x.0", "%a.2"}
+    assert names(liveness.live_out("b1")) == {"%a.2"}
+    assert names(liveness.live_in("b2")) == {"%a.2"}
+    assert liveness.live_out("b2") == set()
+
+
+def test_value_returned_in_consequence_is_not_live_at_join():
+    function = build(
+        [
+            IfTC(IdentifierTC("flag"), BlockTC([ReturnTC(IdentifierTC("x"))])),
+            ReturnTC(UnsignedintTC(1)),
+        ],
+        U8(),
+    )
+
+    liveness = Liveness(function)
+
+    assert names(liveness.live_out("b0")) == {"%x.0"}
+    assert liveness.live_in("b2") == set()
+
+
+def test_versions_of_variable_reaching_join():
+    function = assign_in_if()
+    phi = function.blocks["b2"].phis[0]
+
+    definitions = ReachingDefinitions(function)
+
+    assert names(definitions.versions("a", "b2")) == {"%a.2", "%a.4"}
+    assert names(definitions.versions("a", "b1")) == {"%a.2"}
+    assert definitions.reaching_in("b0") == set(function.parameters)
+    assert phi.dest in definitions.reaching_out("b2")
+    assert names(definitions.versions("a", "b0")) == set()
+
+
+def test_redefinition_kills_other_versions():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            AssignmentTC("a", UnsignedintTC(2)),
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("a"))])),
+        ]
+    )
+
+    definitions = ReachingDefinitions(function)
+
+    assert names(definitions.versions("a", "b1")) == {"%a.3"}
+
+
+def loop():
+    """
+    b0: jump b1
+    b1: i.2 = phi(x.0, i.3), branch flag b2 b3
+    b2: i.3 = i.2 + 1, jump b1
+    b3: print i.2
+    """
+    x, flag = ir.Temp(0, "x", U8()), ir.Temp(1, "flag", Bool())
+    function = ir.FunctionIr("f", [x, flag], Void())
+    b0, b1, b2, b3 = (function.new_block() for _ in range(4))
+    i, next_i = ir.Temp(2, "i", U8()), ir.Temp(3, "i", U8())
+    b0.terminator = ir.Jump("b1")
+    b1.phis = [ir.Phi(i, {"b0": x, "b2": next_i})]
+    b1.terminator = ir.Branch(flag, "b2", "b3")
+    b2.instructions = [ir.BinaryOp(next_i, "+", i, ir.Const(1))]
+    b2.terminator = ir.Jump("b1")
+    b3.instructions = [ir.PrintValue(i)]
+    b3.terminator = ir.Ret(None)
+    return function
+
+
+def test_values_live_in_separate_blocks_are_told_apart():
+    function = build(
+        [
+            LetTC("a", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("a"))])),
+            LetTC("b", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(2))),
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("b"))])),
+        ]
+    )
+
+    liveness = Liveness(function)
+
+    assert names(liveness.live_in("b1")) == {"%x.0", "%flag.1", "%a.3"}
+    assert names(liveness.live_in("b3")) == {"%b.5"}
+    assert names(liveness.live_out("b2")) == {"%b.5"}
+
+
+def test_liveness_around_cycles():
+    function = loop()
+
+    liveness = Liveness(function)
+
+    assert names(liveness.live_out("b0")) == {"%x.0", "%flag.1"}
+    assert names(liveness.live_in("b1")) == {"%flag.1"}
+    assert names(liveness.live_out("b2")) == {"%flag.1", "%i.3"}
+    assert names(liveness.live_in("b3")) == {"%i.2"}
+
+
+def test_reaching_definitions_around_cycles():
+    function = loop()
+
+    definitions = ReachingDefinitions(function)
+
+    assert names(definitions.versions("i", "b1")) == {"%i.3"}
+    assert names(definitions.versions("i", "b2")) == {"%i.2"}
+    assert names(definitions.reaching_out("b2")) == {"%x.0", "%flag.1", "%i.3"}
+
+
+def test_analyses_of_unreachable_blocks():
+    function = assign_in_if()
+    unreachable = function.new_block()
+    unreachable.instructions = [ir.PrintValue(function.parameters[0])]
+    unreachable.terminator = ir.Jump("b2")
+    function.blocks["b2"].phis[0].incoming[unreachable.label] = ir.Const(3)
+
+    liveness = Liveness(function)
+    definitions = ReachingDefinitions(function)
+
+    assert names(liveness.live_in(unreachable.label)) == {"%x.0"}
+    assert names(liveness.live_in("b1")) == {"%a.2"}
+    assert definitions.reaching_in(unreachable.label) == set()
+    assert names(definitions.versions("a", "b2")) == {"%a.2", "%a.4"}
+
+
+class DefinitelyPrinted(DataflowProblem):
+    """
+    Values printed on every path to the point, the meet is the intersection.
+    """
+
+    def __init__(self, universe):
+        self._universe = universe
+
+    def initial(self):
+        return (1 << len(self._universe)) - 1
+
+    def meet(self, values):
+        result = self.initial()
+        for value in values:
+            result &= value
+        return result
+
+    def transfer(self, block, value):
+        for instruction in block.instructions:
+            if isinstance(instruction, ir.PrintValue):
+                value |= self._universe.bit(instruction.value)
+        return value
+
+
+def test_problems_can_override_meet():
+    function = build(
+        [
+            PrintTC(IdentifierTC("x")),
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("flag"))])),
+            PrintTC(UnsignedintTC(0)),
+        ]
+    )
+    universe = Universe(list(function.parameters) + [ir.Const(0)])
+
+    result = solve(function, DefinitelyPrinted(universe))
+
+    assert universe.items(result.starts["b2"]) == [function.parameters[0]]
+    assert set(universe.items(result.ends["b1"])) == set(function.parameters)
+    assert len(universe.items(result.ends["b2"])) == 2
+
+
+def test_analyses_are_computed_for_every_function():
+    program = build_ir(
+        ProgramTC(
+            [
+                FunctionTC("g", [], U8(), BlockTC([ReturnTC(UnsignedintTC(1))])),
+                FunctionTC("main", [], Void(), BlockTC([])),
+            ]
+        )
+    )
+
+    assert set(compute_liveness(program)) == {"g", "main"}
+    assert set(compute_reaching_definitions(program)) == {"g", "main"}
@@ -0,0 +1,122 @@
+import pytest
+
+from tests.ast import (
+    ProgramTC,
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    AssignmentTC,
+    EqualTC,
+    AdditionTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+    BoolTC,
+)
+from zx64c.optimizer.dead_code import (
+    eliminate_dead_code,
+    eliminate_dead_code_in_function,
+    reachable_functions,
+)
+from zx64c.types import Void, U8
+
+
+def make_function(name, statements, return_type=None):
+    return FunctionTC(name, [], return_type or Void(), BlockTC(statements))
+
+
+def test_unreachable_functions_are_removed():
+    program = ProgramTC(
+        [
+            make_function("unused", [PrintTC(UnsignedintTC(1))]),
+            make_function("helper", [PrintTC(UnsignedintTC(2))]),
+            make_function("used", [FunctionCallTC("helper", [])]),
+            make_function("main", [FunctionCallTC("used", [])]),
+        ]
+    )
+
+    assert reachable_functions(program) == {"main", "used", "helper"}
+    names = [function.name for function in eliminate_dead_code(program).functions]
+    assert names == ["helper", "used", "main"]
+
+
+def test_program_without_main_is_kept():
+    program = ProgramTC([make_function("f", [PrintTC(UnsignedintTC(1))])])
+
+    assert eliminate_dead_code(program) == program
+
+
+def test_statements_after_return_are_removed():
+    function = make_function(
+        "f",
+        [
+            ReturnTC(UnsignedintTC(1)),
+            PrintTC(UnsignedintTC(2)),
+            ReturnTC(UnsignedintTC(3)),
+        ],
+        U8(),
+    )
+
+    assert eliminate_dead_code_in_function(function).code_block == BlockTC(
+        [ReturnTC(UnsignedintTC(1))]
+    )
+
+
+@pytest.mark.parametrize(
+    "statements, expected",
+    [
+        (
+            [LetTC("x", U8(), AdditionTC(UnsignedintTC(1), UnsignedintTC(2)))],
+            [],
+        ),
+        (
+            [
+                LetTC("x", U8(), UnsignedintTC(1)),
+                LetTC("y", U8(), IdentifierTC("x")),
+                AssignmentTC("y", UnsignedintTC(2)),
+            ],
+            [],
+        ),
+        (
+            [LetTC("x", U8(), FunctionCallTC("g", []))],
+            [FunctionCallTC("g", [])],
+        ),
+        (
+            [
+                LetTC("x", U8(), UnsignedintTC(1)),
+                PrintTC(IdentifierTC("x")),
+            ],
+            [
+                LetTC("x", U8(), UnsignedintTC(1)),
+                PrintTC(IdentifierTC("x")),
+            ],
+        ),
+    ],
+)
+def test_unused_variables_are_removed(statements, expected):
+    function = make_function("f", statements)
+
+    assert eliminate_dead_code_in_function(function).code_block == BlockTC(expected)
+
+
+def test_dead_if_statements_are_removed():
+    printing = BlockTC([PrintTC(UnsignedintTC(1))])
+    function = make_function(
+        "f",
+        [
+            IfTC(BoolTC(False), printing),
+            IfTC(BoolTC(True), printing),
+            IfTC(EqualTC(IdentifierTC("p"), UnsignedintTC(1)), BlockTC([])),
+            IfTC(EqualTC(FunctionCallTC("g", []), UnsignedintTC(1)), BlockTC([])),
+        ],
+    )
+
+    assert eliminate_dead_code_in_function(function).code_block == BlockTC(
+        [
+            printing,
+            IfTC(EqualTC(FunctionCallTC("g", []), UnsignedintTC(1)), BlockTC([])),
+        ]
+    )
@@ -0,0 +1,286 @@
+import pytest
+
+from zx64c.codegen import CodegenOptions, Z80CodegenVisitor
+from zx64c.codegen.z80 import (
+    Instruction,
+    Label,
+    Directive,
+    Opcode,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+    Address,
+    Indirect,
+    Indexed,
+)
+from zx64c.emulator import EmulationError, execute
+from zx64c.emulator.assembler import AssemblyError, assemble
+from zx64c.optimizer.peephole import optimize_peephole
+from zx64c.parser import Parser
+from zx64c.scanner import Scanner
+from zx64c.typechecker import TypecheckerVisitor
+
+EXAMPLE = """\
+def gen_n(n: u8) -> u8:
+    if n == 0:
+        return 0
+
+    return gen_n(n - 1) + 1
+
+def main() -> void:
+    print(gen_n(2) + 55)
+"""
+
+
+def compile_source(source, optimize):
+    ast = Parser(Scanner(source).scan()).parse()
+    ast.visit(TypecheckerVisitor())
+    options = CodegenOptions(tail_calls=optimize, frameless_leaves=optimize)
+    codegen = Z80CodegenVisitor(options=options)
+    ast.visit(codegen)
+    if optimize:
+        return optimize_peephole(codegen.code)
+    return codegen.code
+
+
+def program(*instructions):
+    return [Directive("org", ("$8000",)), Label("main"), *instructions]
+
+
+@pytest.mark.parametrize(
+    "instruction, encoding",
+    [
+        (Instruction(Opcode.LD, Register.A, Register.B), [0x78]),
+        (Instruction(Opcode.LD, Register.A, Immediate(7)), [0x3E, 0x07]),
+        (
+            Instruction(Opcode.LD, Register.A, Indexed(Register.IX, -1)),
+            [0xDD, 0x7E, 0xFF],
+        ),
+        (
+            Instruction(Opcode.LD, Indexed(Register.IX, 5), Register.A),
+            [0xDD, 0x77, 0x05],
+        ),
+        (Instruction(Opcode.LD, Register.HL, Immediate(-5)), [0x21, 0xFB, 0xFF]),
+        (Instruction(Opcode.LD, Register.SP, Register.IX), [0xDD, 0xF9]),
+        (Instruction(Opcode.LD, Address(0x5C00), Register.A), [0x32, 0x00, 0x5C]),
+        (Instruction(Opcode.PUSH, Register.AF), [0xF5]),
+        (Instruction(Opcode.POP, Register.IX), [0xDD, 0xE1]),
+        (Instruction(Opcode.ADD, Register.IX, Register.SP), [0xDD, 0x39]),
+        (Instruction(Opcode.SUB, Indirect(Register.HL)), [0x96]),
+        (Instruction(Opcode.CP, Immediate(1)), [0xFE, 0x01]),
+        (Instruction(Opcode.DEC, Register.SP), [0x3B]),
+        (Instruction(Opcode.NEG), [0xED, 0x44]),
+        (Instruction(Opcode.JP, Condition.NZ, LabelRef("main")), [0xC2, 0x00, 0x80]),
+        (Instruction(Opcode.JR, Condition.Z, LabelRef("main")), [0x28, 0xFE]),
+        (Instruction(Opcode.RST, Immediate(0x10)), [0xD7]),
+    ],
+)
+def test_instructions_are_encoded(instruction, encoding):
+    binary = assemble(program(instruction))
+
+    assert binary.memory[binary.start : binary.end] == bytes(encoding)
+
+
+def test_local_labels_are_scoped_to_functions():
+    code = [
+        Directive("org", ("$8000",)),
+        Label("f"),
+        Label(".L0"),
+        Instruction(Opcode.RET),
+        Label("main"),
+        Instruction(Opcode.NOP),
+        Label(".L0"),
+        Instruction(Opcode.JP, LabelRef(".L0")),
+    ]
+
+    binary = assemble(code)
+
+    assert binary.symbols == {
+        "f": 0x8000,
+        "f.L0": 0x8000,
+        "main": 0x8001,
+        "main.L0": 0x8002,
+    }
+    assert binary.memory[0x8002:0x8005] == bytes([0xC3, 0x02, 0x80])
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        program(Instruction(Opcode.JP, LabelRef("nowhere"))),
+        program(Instruction(Opcode.LD, Register.A, Indexed(Register.IX, 200))),
+        program(Instruction(Opcode.RST, Immediate(0x11))),
+    ],
+)
+def test_invalid_code_is_not_assembled(code):
+    with pytest.raises(AssemblyError):
+        assemble(code)
+
+
+def test_code_past_the_end_of_memory_is_not_assembled():
+    code = [
+        Directive("org", ("$FFFF",)),
+        Label("main"),
+        Instruction(Opcode.NOP),
+        Instruction(Opcode.RET),
+    ]
+
+    with pytest.raises(AssemblyError):
+        assemble(code)
+
+
+@pytest.mark.parametrize(
+    "instruction",
+    [
+        Instruction(Opcode.LD, Register.A, Register.B),
+        Instruction(Opcode.LD, Register.C, Immediate(3)),
+        Instruction(Opcode.LD, Register.A, Indexed(Register.IX, 0)),
+        Instruction(Opcode.LD, Indexed(Register.IX, 0), Immediate(1)),
+        Instruction(Opcode.LD, Register.A, Indirect(Register.HL)),
+        Instruction(Opcode.LD, Register.HL, Immediate(0x9000)),
+        Instruction(Opcode.LD, Register.IX, Immediate(0x9000)),
+        Instruction(Opcode.LD, Address(0x9000), Register.HL),
+        Instruction(Opcode.ADD, Register.A, Immediate(1)),
+        Instruction(Opcode.ADD, Register.A, Indexed(Register.IX, 1)),
+        Instruction(Opcode.ADD, Register.HL, Register.DE),
+        Instruction(Opcode.SBC, Register.HL, Register.BC),
+        Instruction(Opcode.INC, Register.A),
+        Instruction(Opcode.INC, Register.DE),
+        Instruction(Opcode.DEC, Indexed(Register.IX, 2)),
+        Instruction(Opcode.NEG),
+        Instruction(Opcode.CPL),
+        Instruction(Opcode.NOP),
+    ],
+)
+def test_instructions_take_cycles_from_timing_table(instruction):
+    ret = Instruction(Opcode.RET)
+    code = program(
+        Instruction(Opcode.LD, Register.IX, Immediate(0x9000)), instruction, ret
+    )
+
+    result = execute(code)
+
+    assert result.cycles == 14 + instruction.cycles + ret.cycles
+    assert result.instructions == 3
+
+
+@pytest.mark.parametrize(
+    "value, cycles",
+    [(0, 7 + 7 + 12 + 10), (1, 7 + 7 + 7 + 4 + 10)],
+)
+def test_branches_take_taken_or_not_taken_cycles(value, cycles):
+    code = program(
+        Instruction(Opcode.LD, Register.A, Immediate(value)),
+        Instruction(Opcode.CP, Immediate(0)),
+        Instruction(Opcode.JR, Condition.Z, LabelRef(".L0")),
+        Instruction(Opcode.INC, Register.A),
+        Label(".L0"),
+        Instruction(Opcode.RET),
+    )
+
+    assert execute(code).cycles == cycles
+
+
+def test_arithmetic_wraps_and_sets_flags():
+    code = program(
+        Instruction(Opcode.LD, Register.A, Immediate(0xFF)),
+        Instruction(Opcode.ADD, Register.A, Immediate(2)),
+        Instruction(Opcode.RET, Condition.NC),
+        Instruction(Opcode.ADD, Register.A, Immediate(0x40)),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        Instruction(Opcode.RET),
+    )
+
+    assert execute(code).output == "A"
+
+
+def test_print_appends_to_output_and_clobbers_registers():
+    code = program(
+        Instruction(Opcode.LD, Register.A, Immediate(ord("h"))),
+        Instruction(Opcode.LD, Register.B, Immediate(ord("i"))),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        Instruction(Opcode.LD, Register.A, Register.B),
+        Instruction(Opcode.RST, Immediate(0x10)),
+        Instruction(Opcode.RET),
+    )
+
+    assert execute(code).output == "h\xb5"
+
+
+def test_stack_usage_is_measured():
+    code = program(
+        Instruction(Opcode.PUSH, Register.AF),
+        Instruction(Opcode.PUSH, Register.AF),
+        Instruction(Opcode.POP, Register.AF),
+        Instruction(Opcode.POP, Register.AF),
+        Instruction(Opcode.RET),
+    )
+
+    assert execute(code).stack_usage == 4
+
+
+def test_stack_growing_into_code_is_an_error():
+    code = [
+        Directive("org", ("$FFF8",)),
+        Label("main"),
+        Instruction(Opcode.PUSH, Register.AF),
+        Instruction(Opcode.POP, Register.AF),
+        Instruction(Opcode.RET),
+        Directive("db", ("0", "0")),
+    ]
+
+    with pytest.raises(EmulationError):
+        execute(code)
+
+
+def test_endless_loop_is_stopped():
+    code = program(Label(".L0"), Instruction(Opcode.JR, LabelRef(".L0")))
+
+    with pytest.raises(EmulationError):
+        execute(code, max_cycles=1000)
+
+
+def test_unsupported_restart_is_an_error():
+    code = program(Instruction(Opcode.RST, Immediate(0x08)))
+
+    with pytest.raises(EmulationError):
+        execute(code)
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_compiled_program_is_executed(optimize):
+    code = compile_source(EXAMPLE, optimize)
+
+    result = execute(code)
+
+    assert result.output == "9"
+    assert result.stack_usage > 0
+
+
+def make_large_frame_source():
+    parameters = ", ".join(f"p{i}: u8" for i in range(70))
+    lets = [f"    let x{i}: u8 = {48 + i * 7 % 10}" for i in range(150)]
+    prints = [f"    print(x{i})" for i in range(150)]
+    arguments = ", ".join(str(i % 10) for i in range(70))
+    return "\n".join(
+        [f"def far({parameters}) -> u8:"]
+        + lets
+        + prints
+        + ["    print(p0 + 48)", "    print(p69 + 48)", "    return x140", ""]
+        + ["def main() -> void:", f"    print(far({arguments}))", ""]
+    )
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_slots_out_of_displacement_range_are_executed(optimize):
+    code = compile_source(make_large_frame_source(), optimize)
+
+    result = execute(code)
+
+    assert any(
+        Indirect(Register.HL) in item.operands
+        for item in code
+        if isinstance(item, Instruction)
+    )
+    assert result.output == ("".join(chr(48 + i * 7 % 10) for i in range(150)) + "090")
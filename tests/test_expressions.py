@@ -0,0 +1,122 @@
+import pytest
+
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    PrintTC,
+    AdditionTC,
+    SubtractionTC,
+    NegationTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+)
+from zx64c.types import Void
+from zx64c.codegen.expressions import (
+    RegisterNeed,
+    RegisterNeedVisitor,
+    count_spill_slots,
+    temporary_registers,
+)
+from zx64c.codegen.z80 import Register
+
+
+def x():
+    return IdentifierTC("x")
+
+
+def balanced(depth):
+    """
+    Returns a balanced tree of additions, which needs `depth` registers.
+    """
+    if depth == 0:
+        return NegationTC(x())
+    return AdditionTC(balanced(depth - 1), balanced(depth - 1))
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        (x(), RegisterNeed(0, False)),
+        (AdditionTC(x(), UnsignedintTC(1)), RegisterNeed(0, False)),
+        (AdditionTC(NegationTC(x()), x()), RegisterNeed(0, False)),
+        (balanced(1), RegisterNeed(1, False)),
+        (balanced(3), RegisterNeed(3, False)),
+        (AdditionTC(balanced(2), balanced(1)), RegisterNeed(2, False)),
+        (FunctionCallTC("f", [balanced(2)]), RegisterNeed(2, True)),
+        (AdditionTC(FunctionCallTC("f", []), balanced(0)), RegisterNeed(1, True)),
+        (
+            AdditionTC(FunctionCallTC("f", []), FunctionCallTC("g", [])),
+            RegisterNeed(0, True),
+        ),
+    ],
+)
+def test_register_need(expression, expected):
+    assert RegisterNeedVisitor().get_need(expression) == expected
+
+
+@pytest.mark.parametrize(
+    "lhs, rhs, lhs_first",
+    [
+        (x(), UnsignedintTC(1), True),
+        (UnsignedintTC(1), x(), False),
+        (IdentifierTC("y"), x(), True),
+        (balanced(0), IdentifierTC("y"), True),
+        (IdentifierTC("y"), balanced(0), False),
+        (balanced(0), FunctionCallTC("f", []), False),
+        (FunctionCallTC("f", []), FunctionCallTC("g", []), True),
+        (balanced(2), balanced(1), True),
+        (balanced(1), balanced(2), False),
+        (balanced(1), balanced(1), False),
+    ],
+)
+def test_evaluation_order_of_subtraction(lhs, rhs, lhs_first):
+    expected = (lhs, rhs) if lhs_first else (rhs, lhs)
+
+    first, second = RegisterNeedVisitor().evaluation_order(SubtractionTC(lhs, rhs))
+
+    assert first is expected[0]
+    assert second is expected[1]
+
+
+def test_addition_of_equal_operands_is_evaluated_left_to_right():
+    lhs, rhs = balanced(1), balanced(1)
+
+    first, _ = RegisterNeedVisitor().evaluation_order(AdditionTC(lhs, rhs))
+
+    assert first is lhs
+
+
+def test_temporary_registers_skip_registers_of_variables():
+    assert temporary_registers({Register.H, Register.C}) == (
+        Register.B,
+        Register.D,
+        Register.E,
+    )
+
+
+@pytest.mark.parametrize(
+    "expression, free_registers, expected",
+    [
+        (balanced(2), 2, 0),
+        (balanced(2), 1, 1),
+        (balanced(2), 0, 2),
+        (
+            AdditionTC(FunctionCallTC("f", []), FunctionCallTC("g", [])),
+            4,
+            1,
+        ),
+        (
+            AdditionTC(
+                FunctionCallTC("f", []),
+                AdditionTC(FunctionCallTC("g", []), FunctionCallTC("h", [])),
+            ),
+            4,
+            2,
+        ),
+    ],
+)
+def test_count_spill_slots(expression, free_registers, expected):
+    ast = FunctionTC("main", [], Void(), BlockTC([PrintTC(expression)]))
+
+    assert count_spill_slots(ast, free_registers) == expected
@@ -0,0 +1,181 @@
+import pytest
+
+from tests.ast import (
+    ProgramTC,
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    EqualTC,
+    AdditionTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+    BoolTC,
+)
+from zx64c.ast import Parameter
+from zx64c.optimizer.inlining import (
+    InliningPolicy,
+    InliningReport,
+    inline_functions,
+    recursive_functions,
+)
+from zx64c.types import Void, U8
+
+
+def add_one():
+    return FunctionTC(
+        "add_one",
+        [Parameter("x", U8())],
+        U8(),
+        BlockTC([ReturnTC(AdditionTC(IdentifierTC("x"), UnsignedintTC(1)))]),
+    )
+
+
+def print_twice():
+    return FunctionTC(
+        "print_twice",
+        [Parameter("x", U8())],
+        Void(),
+        BlockTC(
+            [
+                LetTC("y", U8(), IdentifierTC("x")),
+                PrintTC(IdentifierTC("y")),
+                PrintTC(IdentifierTC("y")),
+            ]
+        ),
+    )
+
+
+def main(statements):
+    return FunctionTC("main", [], Void(), BlockTC(statements))
+
+
+def test_call_statement_is_replaced_with_body():
+    program = ProgramTC(
+        [print_twice(), main([FunctionCallTC("print_twice", [UnsignedintTC(7)])])]
+    )
+
+    inlined = inline_functions(program)
+
+    assert inlined.functions[1].code_block == BlockTC(
+        [
+            LetTC("print_twice.0.x", U8(), UnsignedintTC(7)),
+            LetTC("print_twice.0.y", U8(), IdentifierTC("print_twice.0.x")),
+            PrintTC(IdentifierTC("print_twice.0.y")),
+            PrintTC(IdentifierTC("print_twice.0.y")),
+        ]
+    )
+
+
+def test_returned_value_replaces_call():
+    program = ProgramTC(
+        [
+            add_one(),
+            main(
+                [
+                    LetTC("a", U8(), FunctionCallTC("add_one", [UnsignedintTC(1)])),
+                    PrintTC(FunctionCallTC("add_one", [IdentifierTC("a")])),
+                ]
+            ),
+        ]
+    )
+
+    inlined = inline_functions(program)
+
+    assert inlined.functions[1].code_block == BlockTC(
+        [
+            LetTC("add_one.0.x", U8(), UnsignedintTC(1)),
+            LetTC("a", U8(), AdditionTC(IdentifierTC("add_one.0.x"), UnsignedintTC(1))),
+            LetTC("add_one.1.x", U8(), IdentifierTC("a")),
+            PrintTC(AdditionTC(IdentifierTC("add_one.1.x"), UnsignedintTC(1))),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "callee, reason",
+    [
+        (
+            FunctionTC(
+                "f",
+                [],
+                U8(),
+                BlockTC([ReturnTC(FunctionCallTC("f", []))]),
+            ),
+            "recursive",
+        ),
+        (
+            FunctionTC(
+                "f",
+                [],
+                U8(),
+                BlockTC(
+                    [
+                        IfTC(BoolTC(True), BlockTC([ReturnTC(UnsignedintTC(1))])),
+                        ReturnTC(UnsignedintTC(2)),
+                    ]
+                ),
+            ),
+            "returns before the end of its body",
+        ),
+    ],
+)
+def test_functions_that_cannot_be_inlined(callee, reason):
+    program = ProgramTC([callee, main([PrintTC(FunctionCallTC("f", []))])])
+    report = InliningReport()
+
+    assert inline_functions(program, report=report) == program
+    assert [str(decision) for decision in report.decisions] == [
+        f"main -> f: not inlined ({reason})"
+    ]
+
+
+def test_size_threshold_applies_to_functions_called_many_times():
+    call = FunctionCallTC("print_twice", [UnsignedintTC(7)])
+    program = ProgramTC([print_twice(), main([call, call])])
+    report = InliningReport()
+
+    inlined = inline_functions(program, InliningPolicy(max_size=4), report)
+
+    assert inlined == program
+    assert not report.inlined
+
+
+def test_function_called_once_is_inlined_despite_its_size():
+    program = ProgramTC(
+        [
+            print_twice(),
+            main([FunctionCallTC("print_twice", [UnsignedintTC(7)])]),
+        ]
+    )
+    report = InliningReport()
+
+    inline_functions(program, InliningPolicy(max_size=4), report)
+
+    assert str(report) == "main -> print_twice: inlined (size 6, 1 call site(s))"
+
+
+def test_recursive_functions_are_detected():
+    program = ProgramTC(
+        [
+            add_one(),
+            FunctionTC(
+                "loop",
+                [],
+                Void(),
+                BlockTC(
+                    [
+                        IfTC(
+                            EqualTC(UnsignedintTC(1), UnsignedintTC(1)),
+                            BlockTC([FunctionCallTC("loop", [])]),
+                        )
+                    ]
+                ),
+            ),
+        ]
+    )
+
+    assert recursive_functions(program) == {"loop"}
@@ -0,0 +1,177 @@
+from tests.ast import (
+    ProgramTC,
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    AssignmentTC,
+    AdditionTC,
+    NegationTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+    BoolTC,
+)
+from zx64c import ir
+from zx64c.ast import Parameter
+from zx64c.ir.builder import build_function_ir, build_ir
+from zx64c.types import Void, Bool, U8
+
+
+def make_function(statements, return_type=Void()):
+    parameters = [Parameter("x", U8()), Parameter("flag", Bool())]
+    return FunctionTC("f", parameters, return_type, BlockTC(statements))
+
+
+def build(statements, return_type=Void()):
+    return build_function_ir(make_function(statements, return_type), {})
+
+
+def test_let_defines_version_of_variable():
+    function = build(
+        [
+            LetTC("a", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            AssignmentTC("a", NegationTC(IdentifierTC("a"))),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    assert str(function) == "\n".join(
+        [
+            "function f(%x.0: u8, %flag.1: bool) -> void",
+            "b0:",
+            "    %2 = %x.0 + 1",
+            "    %a.3 = %2",
+            "    %4 = -%a.3",
+            "    %a.5 = %4",
+            "    print %a.5",
+            "    ret",
+        ]
+    )
+
+
+def test_variable_assigned_in_if_is_merged_by_phi():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(IdentifierTC("flag"), BlockTC([AssignmentTC("a", UnsignedintTC(5))])),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    assert str(function) == "\n".join(
+        [
+            "function f(%x.0: u8, %flag.1: bool) -> void",
+            "b0:",
+            "    %a.2 = %x.0",
+            "    branch %flag.1, b1, b2",
+            "b1:",
+            "    %a.3 = 5",
+            "    jump b2",
+            "b2:",
+            "    %a.4 = phi [b0: %a.2], [b1: %a.3]",
+            "    print %a.4",
+            "    ret",
+        ]
+    )
+
+
+def test_if_that_returns_needs_no_phi():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(
+                IdentifierTC("flag"),
+                BlockTC(
+                    [
+                        AssignmentTC("a", UnsignedintTC(5)),
+                        ReturnTC(IdentifierTC("a")),
+                    ]
+                ),
+            ),
+            ReturnTC(IdentifierTC("a")),
+        ],
+        U8(),
+    )
+
+    join = function.blocks["b2"]
+
+    assert join.phis == []
+    assert isinstance(join.terminator, ir.Ret)
+    assert join.terminator.value is function.blocks["b0"].instructions[0].dest
+
+
+def test_statements_after_return_are_not_built():
+    function = build(
+        [ReturnTC(IdentifierTC("x")), PrintTC(IdentifierTC("x"))],
+        U8(),
+    )
+
+    assert str(function) == "\n".join(
+        [
+            "function f(%x.0: u8, %flag.1: bool) -> u8",
+            "b0:",
+            "    ret %x.0",
+        ]
+    )
+
+
+def test_calls_are_built_with_return_types_of_program():
+    program = ProgramTC(
+        [
+            FunctionTC("g", [], U8(), BlockTC([ReturnTC(UnsignedintTC(1))])),
+            FunctionTC(
+                "main",
+                [],
+                Void(),
+                BlockTC(
+                    [
+                        PrintTC(FunctionCallTC("g", [])),
+                        IfTC(BoolTC(True), BlockTC([])),
+                    ]
+                ),
+            ),
+        ]
+    )
+
+    main = build_ir(program).functions[1]
+    call = main.entry.instructions[0]
+
+    assert str(main) == "\n".join(
+        [
+            "function main() -> void",
+            "b0:",
+            "    %0 = call g()",
+            "    print %0",
+            "    branch true, b1, b2",
+            "b1:",
+            "    jump b2",
+            "b2:",
+            "    ret",
+        ]
+    )
+    assert call.dest.type == U8()
+    assert call.has_side_effects
+
+
+def test_reverse_postorder_puts_blocks_before_successors():
+    function = build(
+        [
+            IfTC(
+                IdentifierTC("flag"),
+                BlockTC(
+                    [IfTC(IdentifierTC("flag"), BlockTC([PrintTC(UnsignedintTC(1))]))]
+                ),
+            ),
+            PrintTC(UnsignedintTC(2)),
+        ]
+    )
+
+    order = [block.label for block in function.reverse_postorder()]
+
+    assert order[0] == "b0"
+    for position, label in enumerate(order):
+        for successor in function.blocks[label].successors():
+            assert order.index(successor) > position
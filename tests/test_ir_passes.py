@@ -0,0 +1,152 @@
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    AssignmentTC,
+    AdditionTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+    BoolTC,
+)
+from zx64c.ast import Parameter
+from zx64c.ir.builder import build_function_ir
+from zx64c.ir.dataflow import Liveness
+from zx64c.ir.passes import simplify_cfg, eliminate_dead_values
+from zx64c.types import Void, Bool, U8
+
+
+def build(statements, return_type=Void()):
+    parameters = [Parameter("x", U8()), Parameter("flag", Bool())]
+    function = FunctionTC("f", parameters, return_type, BlockTC(statements))
+    return build_function_ir(function, {"g": U8()})
+
+
+def test_branch_on_true_is_merged_with_consequence():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(BoolTC(True), BlockTC([AssignmentTC("a", UnsignedintTC(5))])),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    simplify_cfg(function)
+
+    assert str(function) == "\n".join(
+        [
+            "function f(%x.0: u8, %flag.1: bool) -> void",
+            "b0:",
+            "    %a.2 = %x.0",
+            "    %a.3 = 5",
+            "    print %a.3",
+            "    ret",
+        ]
+    )
+
+
+def test_branch_on_false_removes_consequence():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(BoolTC(False), BlockTC([AssignmentTC("a", UnsignedintTC(5))])),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    simplify_cfg(function)
+
+    assert list(function.blocks) == ["b0"]
+    assert str(function.entry) == "\n".join(
+        ["b0:", "    %a.2 = %x.0", "    print %a.2", "    ret"]
+    )
+
+
+def test_returning_consequence_of_true_branch_ends_function():
+    function = build(
+        [
+            IfTC(BoolTC(True), BlockTC([ReturnTC(UnsignedintTC(1))])),
+            PrintTC(IdentifierTC("x")),
+            ReturnTC(IdentifierTC("x")),
+        ],
+        U8(),
+    )
+
+    simplify_cfg(function)
+
+    assert str(function) == "\n".join(
+        ["function f(%x.0: u8, %flag.1: bool) -> u8", "b0:", "    ret 1"]
+    )
+
+
+def test_branch_on_variable_is_kept():
+    function = build(
+        [
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("x"))])),
+        ]
+    )
+
+    simplify_cfg(function)
+
+    assert list(function.blocks) == ["b0", "b1", "b2"]
+
+
+def test_unused_values_are_removed():
+    function = build(
+        [
+            LetTC("a", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            LetTC("b", U8(), AdditionTC(IdentifierTC("a"), IdentifierTC("a"))),
+            LetTC("c", U8(), UnsignedintTC(3)),
+            PrintTC(IdentifierTC("c")),
+        ]
+    )
+
+    eliminate_dead_values(function)
+
+    assert str(function.entry) == "\n".join(
+        ["b0:", "    %c.6 = 3", "    print %c.6", "    ret"]
+    )
+
+
+def test_unused_calls_are_kept():
+    function = build([LetTC("a", U8(), FunctionCallTC("g", [IdentifierTC("x")]))])
+
+    eliminate_dead_values(function)
+
+    assert str(function.entry) == "\n".join(["b0:", "    %2 = call g(%x.0)", "    ret"])
+
+
+def test_unused_phis_are_removed():
+    function = build(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(IdentifierTC("flag"), BlockTC([AssignmentTC("a", UnsignedintTC(5))])),
+        ]
+    )
+
+    eliminate_dead_values(function)
+
+    assert [
+        instruction for block in function.blocks.values() for instruction in block.phis
+    ] == []
+    assert all(block.instructions == [] for block in function.blocks.values())
+
+
+def test_dead_values_are_found_with_given_liveness():
+    function = build(
+        [
+            LetTC("a", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            IfTC(IdentifierTC("flag"), BlockTC([PrintTC(IdentifierTC("x"))])),
+        ]
+    )
+
+    eliminate_dead_values(function, Liveness(function))
+
+    assert [str(block) for block in function.blocks.values()] == [
+        "b0:\n    branch %flag.1, b1, b2",
+        "b1:\n    print %x.0\n    jump b2",
+        "b2:\n    ret",
+    ]
@@ -0,0 +1,171 @@
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    AssignmentTC,
+    AdditionTC,
+    SubtractionTC,
+    NegationTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+)
+from zx64c import ir
+from zx64c.ast import Parameter
+from zx64c.ir.builder import build_function_ir
+from zx64c.ir.dataflow import Liveness
+from zx64c.ir.lowering import lower_function
+from zx64c.types import Void, Bool, U8
+
+
+def make_function(statements, return_type=Void()):
+    parameters = [Parameter("x", U8()), Parameter("flag", Bool())]
+    return FunctionTC("f", parameters, return_type, BlockTC(statements))
+
+
+def round_trip(function):
+    return lower_function(build_function_ir(function, {"g": U8()}))
+
+
+def make_ir():
+    x = ir.Temp(0, "x", U8())
+    function = ir.FunctionIr("f", [x], Void())
+    function.new_block()
+    return function, x
+
+
+def test_round_trip_keeps_variables():
+    function = make_function(
+        [
+            LetTC("a", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            LetTC("b", U8(), IdentifierTC("a")),
+            IfTC(
+                IdentifierTC("flag"),
+                BlockTC(
+                    [
+                        AssignmentTC(
+                            "a", AdditionTC(IdentifierTC("a"), IdentifierTC("x"))
+                        ),
+                        AssignmentTC(
+                            "b", SubtractionTC(IdentifierTC("a"), IdentifierTC("x"))
+                        ),
+                    ]
+                ),
+            ),
+            PrintTC(AdditionTC(IdentifierTC("a"), IdentifierTC("b"))),
+        ]
+    )
+
+    assert round_trip(function) == function
+
+
+def test_lowering_uses_given_liveness():
+    function = make_function(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            IfTC(IdentifierTC("flag"), BlockTC([AssignmentTC("a", UnsignedintTC(5))])),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+    function_ir = build_function_ir(function, {})
+
+    assert lower_function(function_ir, Liveness(function_ir)) == function
+
+
+def test_round_trip_keeps_nested_expressions_and_calls():
+    function = make_function(
+        [
+            IfTC(
+                IdentifierTC("flag"),
+                BlockTC(
+                    [ReturnTC(NegationTC(FunctionCallTC("g", [IdentifierTC("x")])))]
+                ),
+            ),
+            ReturnTC(
+                SubtractionTC(
+                    AdditionTC(IdentifierTC("x"), UnsignedintTC(2)),
+                    FunctionCallTC("g", [UnsignedintTC(3)]),
+                )
+            ),
+        ],
+        U8(),
+    )
+
+    assert round_trip(function) == function
+
+
+def test_parameter_assigned_in_if_keeps_its_name():
+    function = make_function(
+        [
+            IfTC(IdentifierTC("flag"), BlockTC([AssignmentTC("x", UnsignedintTC(1))])),
+            PrintTC(IdentifierTC("x")),
+        ]
+    )
+
+    assert round_trip(function) == function
+
+
+def test_value_used_twice_is_kept_in_variable():
+    function, x = make_ir()
+    sum_ = function.new_temp(None, U8())
+    block = function.entry
+    block.instructions = [
+        ir.BinaryOp(sum_, "+", x, ir.Const(1)),
+        ir.PrintValue(sum_),
+        ir.PrintValue(sum_),
+    ]
+    block.terminator = ir.Ret(None)
+
+    assert lower_function(function).code_block == BlockTC(
+        [
+            LetTC("tmp.0", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            PrintTC(IdentifierTC("tmp.0")),
+            PrintTC(IdentifierTC("tmp.0")),
+        ]
+    )
+
+
+def test_value_used_after_side_effect_is_kept_in_variable():
+    function, x = make_ir()
+    sum_ = function.new_temp(None, U8())
+    block = function.entry
+    block.instructions = [
+        ir.BinaryOp(sum_, "+", x, ir.Const(1)),
+        ir.PrintValue(x),
+        ir.PrintValue(sum_),
+    ]
+    block.terminator = ir.Ret(None)
+
+    assert lower_function(function).code_block == BlockTC(
+        [
+            LetTC("tmp.0", U8(), AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            PrintTC(IdentifierTC("x")),
+            PrintTC(IdentifierTC("tmp.0")),
+        ]
+    )
+
+
+def test_interfering_versions_of_variable_get_distinct_names():
+    function, x = make_ir()
+    first = function.new_temp("a", U8())
+    second = function.new_temp("a", U8())
+    block = function.entry
+    block.instructions = [
+        ir.Copy(first, x),
+        ir.Copy(second, ir.Const(2)),
+        ir.PrintValue(first),
+        ir.PrintValue(second),
+    ]
+    block.terminator = ir.Ret(None)
+
+    assert lower_function(function).code_block == BlockTC(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            LetTC("a.0", U8(), UnsignedintTC(2)),
+            PrintTC(IdentifierTC("a")),
+            PrintTC(IdentifierTC("a.0")),
+        ]
+    )
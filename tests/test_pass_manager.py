@@ -0,0 +1,115 @@
+import pytest
+
+from zx64c.main import build_pass_manager, compile_source
+from zx64c.optimizer.pass_manager import ALL_ANALYSES, Analysis, Pass, PassManager
+from zx64c.phases import PhaseRecorder
+
+
+class CountingAnalysis:
+    def __init__(self):
+        self.runs = 0
+
+    def __call__(self, program):
+        self.runs += 1
+        return len(program)
+
+
+def test_passes_run_in_order():
+    manager = PassManager()
+    manager.add(Pass("append-a", lambda program: program + "a"))
+    manager.add(Pass("append-b", lambda program: program + "b"))
+
+    assert manager.run("") == "ab"
+    assert manager.passes == ["append-a", "append-b"]
+
+
+def test_pass_gets_results_of_required_analyses():
+    manager = PassManager([Analysis("length", len)])
+    manager.add(Pass("repeat", lambda program, length: program * length, ("length",)))
+
+    assert manager.run("ab") == "abab"
+
+
+def test_required_pass_has_to_run_earlier():
+    manager = PassManager()
+
+    with pytest.raises(ValueError):
+        manager.add(Pass("lower", lambda program: program, requires=("build",)))
+
+
+def test_required_pass_added_earlier_is_accepted():
+    manager = PassManager()
+    manager.add(Pass("build", lambda program: program))
+    manager.add(Pass("lower", lambda program: program, requires=("build",)))
+
+    assert manager.passes == ["build", "lower"]
+
+
+@pytest.mark.parametrize(
+    ["preserves", "expected_runs"],
+    [((), 2), (("length",), 1), (ALL_ANALYSES, 1)],
+)
+def test_analysis_is_computed_again_only_after_invalidation(preserves, expected_runs):
+    analysis = CountingAnalysis()
+    manager = PassManager([Analysis("length", analysis)])
+    manager.add(
+        Pass("first", lambda program, length: program, ("length",), ALL_ANALYSES)
+    )
+    manager.add(Pass("change", lambda program: program, preserves=preserves))
+    manager.add(Pass("second", lambda program, length: program, ("length",)))
+
+    manager.run("abc")
+
+    assert analysis.runs == expected_runs
+
+
+def test_every_pass_and_analysis_is_timed():
+    manager = PassManager([Analysis("length", len)])
+    manager.add(Pass("first", lambda program, length: program, ("length",)))
+    manager.add(Pass("second", lambda program: program))
+
+    manager.run("abc")
+
+    assert [(timing.name, timing.analysis) for timing in manager.timings] == [
+        ("length", True),
+        ("first", False),
+        ("second", False),
+    ]
+    assert all(timing.seconds >= 0 for timing in manager.timings)
+    assert manager.report().splitlines()[-1].startswith("total: ")
+
+
+def test_timings_are_of_last_run():
+    manager = PassManager()
+    manager.add(Pass("only", lambda program: program))
+
+    manager.run("abc")
+    manager.run("abc")
+
+    assert [timing.name for timing in manager.timings] == ["only"]
+
+
+def test_ssa_passes_get_liveness_from_the_manager():
+    source = """def f(x: u8) -> u8:
+    let a: u8 = x + 1
+    if x == 0:
+        a = 2
+    return a
+
+def main() -> void:
+    print(f(3))
+"""
+    manager = build_pass_manager(3, "program")
+
+    assert compile_source(source, manager, PhaseRecorder()) is not None
+    names = [timing.name for timing in manager.timings]
+    start = names.index("simplify-cfg")
+    assert names[start : start + 5] == [
+        "simplify-cfg",
+        "liveness",
+        "eliminate-dead-values",
+        "liveness",
+        "lower-ir",
+    ]
+    # ^^^ eliminate-dead-values invalidates the liveness it got
+    assert "liveness (analysis): " in manager.report()
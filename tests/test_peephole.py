@@ -0,0 +1,127 @@
+import pytest
+
+from zx64c.codegen.z80 import (
+    Instruction,
+    Label,
+    Comment,
+    Opcode,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+    Indexed,
+)
+from zx64c.optimizer.peephole import PeepholeOptimizer
+
+VARIABLE = Indexed(Register.IX, -1)
+
+
+def ld(dst, src):
+    return Instruction(Opcode.LD, dst, src)
+
+
+def ret():
+    return Instruction(Opcode.RET)
+
+
+def optimize(code):
+    optimizer = PeepholeOptimizer()
+    return optimizer.optimize([Label("f")] + code)[1:], optimizer.hits
+
+
+@pytest.mark.parametrize(
+    "code, expected",
+    [
+        (
+            [
+                ld(Register.B, Register.A),
+                ld(Register.A, Immediate(2)),
+                Instruction(Opcode.ADD, Register.A, Register.B),
+                ret(),
+            ],
+            [Instruction(Opcode.ADD, Register.A, Immediate(2)), ret()],
+        ),
+        (
+            [
+                ld(Register.B, Register.A),
+                ld(Register.A, VARIABLE),
+                Instruction(Opcode.NEG),
+                Instruction(Opcode.ADD, Register.A, Register.B),
+                ret(),
+            ],
+            [Instruction(Opcode.SUB, VARIABLE), ret()],
+        ),
+        (
+            [ld(Register.A, Immediate(0)), ret()],
+            [Instruction(Opcode.XOR, Register.A), ret()],
+        ),
+        (
+            [
+                Instruction(Opcode.PUSH, Register.BC),
+                Instruction(Opcode.POP, Register.BC),
+                ret(),
+            ],
+            [ret()],
+        ),
+        (
+            [
+                Instruction(Opcode.JP, Condition.NZ, LabelRef(".L0")),
+                Comment("skip"),
+                Label(".L0"),
+                ret(),
+            ],
+            [Comment("skip"), Label(".L0"), ret()],
+        ),
+    ],
+)
+def test_rules_rewrite_code(code, expected):
+    assert optimize(code)[0] == expected
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        # `b` is used on the path taken by the jump
+        [
+            ld(Register.B, Register.A),
+            ld(Register.A, Immediate(2)),
+            Instruction(Opcode.ADD, Register.A, Register.B),
+            Instruction(Opcode.JP, Condition.Z, LabelRef(".L0")),
+            ret(),
+            Label(".L0"),
+            ld(Register.A, Register.B),
+            ret(),
+        ],
+        # flags are pushed together with `a`
+        [ld(Register.A, Immediate(0)), Instruction(Opcode.PUSH, Register.AF)],
+        # a label may be reached from another place
+        [
+            ld(VARIABLE, Register.A),
+            Label(".L0"),
+            ld(Register.A, VARIABLE),
+            ret(),
+        ],
+    ],
+)
+def test_rules_keep_code_when_unsafe(code):
+    assert optimize(code)[0] == code
+
+
+def test_rules_are_applied_until_fixpoint():
+    code = [
+        ld(VARIABLE, Register.A),
+        ld(Register.A, VARIABLE),
+        ld(Register.B, Register.A),
+        ld(Register.A, Immediate(0)),
+        Instruction(Opcode.ADD, Register.A, Register.B),
+        ret(),
+    ]
+
+    optimized, hits = optimize(code)
+
+    assert optimized == [
+        ld(VARIABLE, Register.A),
+        Instruction(Opcode.ADD, Register.A, Immediate(0)),
+        ret(),
+    ]
+    assert hits == {"reload-after-store": 1, "add-operand-directly": 1}
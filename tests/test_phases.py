@@ -0,0 +1,80 @@
+from tests.ast import (
+    ProgramTC,
+    FunctionTC,
+    BlockTC,
+    PrintTC,
+    AdditionTC,
+    IdentifierTC,
+    UnsignedintTC,
+)
+from zx64c.ast import Parameter
+from zx64c.main import build_pass_manager, compile_source
+from zx64c.phases import PhaseRecorder, PhaseStats, count_nodes
+from zx64c.types import Void, U8
+
+SOURCE = """def print_digit(digit: u8) -> void:
+    print(digit + 48)
+
+def main() -> void:
+    print_digit(1)
+"""
+
+
+def test_every_node_is_counted():
+    ast = ProgramTC(
+        [
+            FunctionTC(
+                "f",
+                [Parameter("x", U8())],
+                Void(),
+                BlockTC([PrintTC(AdditionTC(IdentifierTC("x"), UnsignedintTC(1)))]),
+            )
+        ]
+    )
+
+    assert count_nodes(ast) == 7
+
+
+def test_phases_are_measured():
+    recorder = PhaseRecorder()
+    output = compile_source(SOURCE, build_pass_manager(0, "program"), recorder)
+
+    assert output is not None
+    assert [phase.name for phase in recorder.phases] == [
+        "scanner",
+        "parser",
+        "typechecker",
+        "codegen",
+        "render",
+    ]
+    assert all(phase.peak_memory is None for phase in recorder.phases)
+    assert recorder.report().splitlines()[-1].startswith("total: ")
+
+
+def test_detailed_phases_count_results():
+    recorder = PhaseRecorder(detailed=True)
+    compile_source(SOURCE, build_pass_manager(0, "program"), recorder)
+    scanner, parser, typechecker, codegen, render = recorder.phases
+
+    assert scanner.tokens > 0
+    assert parser.nodes == 11
+    assert codegen.instructions > 0
+    assert all(phase.peak_memory > 0 for phase in recorder.phases)
+
+
+def test_phases_end_at_error():
+    recorder = PhaseRecorder()
+    output = compile_source(
+        "def main() -> void:\n    print(x)\n",
+        build_pass_manager(0, "program"),
+        recorder,
+    )
+
+    assert output is None
+    assert [phase.name for phase in recorder.phases] == ["scanner", "parser"]
+
+
+def test_stats_are_printed_when_known():
+    stats = PhaseStats("parser", 0.0015, peak_memory=2048, nodes=10)
+
+    assert str(stats) == "parser: 1.500 ms, peak 2.0 KiB, 10 nodes"
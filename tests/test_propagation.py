@@ -0,0 +1,195 @@
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    IfTC,
+    PrintTC,
+    LetTC,
+    ReturnTC,
+    AssignmentTC,
+    AdditionTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+    BoolTC,
+)
+from zx64c.ast import Parameter
+from zx64c.optimizer.propagation import propagate_values_in_function
+from zx64c.types import Void, Bool, U8
+
+
+def make_function(statements, return_type=Void()):
+    parameters = [Parameter("x", U8()), Parameter("flag", Bool())]
+    return FunctionTC("f", parameters, return_type, BlockTC(statements))
+
+
+def propagate(statements, return_type=Void()):
+    function = make_function(statements, return_type)
+    return propagate_values_in_function(function).code_block
+
+
+def test_constant_is_substituted_into_expression():
+    code_block = propagate(
+        [
+            LetTC("shift", U8(), UnsignedintTC(48)),
+            PrintTC(AdditionTC(IdentifierTC("x"), IdentifierTC("shift"))),
+        ]
+    )
+
+    assert code_block == BlockTC(
+        [
+            LetTC("shift", U8(), UnsignedintTC(48)),
+            PrintTC(AdditionTC(IdentifierTC("x"), UnsignedintTC(48))),
+        ]
+    )
+
+
+def test_constants_are_folded_through_chain_of_variables():
+    code_block = propagate(
+        [
+            LetTC("a", U8(), UnsignedintTC(1)),
+            LetTC("b", U8(), AdditionTC(IdentifierTC("a"), UnsignedintTC(2))),
+            PrintTC(IdentifierTC("b")),
+        ]
+    )
+
+    assert code_block == BlockTC(
+        [
+            LetTC("a", U8(), UnsignedintTC(1)),
+            LetTC("b", U8(), UnsignedintTC(3)),
+            PrintTC(UnsignedintTC(3)),
+        ]
+    )
+
+
+def test_copy_is_substituted():
+    code_block = propagate(
+        [LetTC("a", U8(), IdentifierTC("x")), PrintTC(IdentifierTC("a"))]
+    )
+
+    assert code_block == BlockTC(
+        [LetTC("a", U8(), IdentifierTC("x")), PrintTC(IdentifierTC("x"))]
+    )
+
+
+def test_assignment_to_source_ends_copy():
+    statements = [
+        LetTC("a", U8(), IdentifierTC("x")),
+        AssignmentTC("x", AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+        PrintTC(AdditionTC(IdentifierTC("a"), IdentifierTC("x"))),
+    ]
+
+    assert propagate(statements) == BlockTC(statements)
+
+
+def test_value_assigned_in_if_is_unknown_after_it():
+    statements = [
+        LetTC("a", U8(), UnsignedintTC(1)),
+        IfTC(IdentifierTC("flag"), BlockTC([AssignmentTC("a", UnsignedintTC(2))])),
+        PrintTC(IdentifierTC("a")),
+    ]
+
+    assert propagate(statements) == BlockTC(statements)
+
+
+def test_same_value_assigned_in_if_is_known_after_it():
+    code_block = propagate(
+        [
+            LetTC("a", U8(), UnsignedintTC(1)),
+            IfTC(IdentifierTC("flag"), BlockTC([AssignmentTC("a", UnsignedintTC(1))])),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    assert code_block == BlockTC(
+        [
+            LetTC("a", U8(), UnsignedintTC(1)),
+            IfTC(IdentifierTC("flag"), BlockTC([])),
+            PrintTC(UnsignedintTC(1)),
+        ]
+    )
+
+
+def test_value_assigned_in_if_that_returns_does_not_leave_it():
+    code_block = propagate(
+        [
+            LetTC("a", U8(), UnsignedintTC(1)),
+            IfTC(
+                IdentifierTC("flag"),
+                BlockTC(
+                    [
+                        AssignmentTC("a", UnsignedintTC(2)),
+                        ReturnTC(IdentifierTC("a")),
+                    ]
+                ),
+            ),
+            ReturnTC(IdentifierTC("a")),
+        ],
+        U8(),
+    )
+
+    assert code_block == BlockTC(
+        [
+            LetTC("a", U8(), UnsignedintTC(1)),
+            IfTC(IdentifierTC("flag"), BlockTC([ReturnTC(UnsignedintTC(2))])),
+            ReturnTC(UnsignedintTC(1)),
+        ]
+    )
+
+
+def test_if_with_known_condition_is_removed():
+    code_block = propagate(
+        [
+            LetTC("debug", Bool(), BoolTC(False)),
+            IfTC(IdentifierTC("debug"), BlockTC([PrintTC(IdentifierTC("x"))])),
+        ]
+    )
+
+    assert code_block == BlockTC([LetTC("debug", Bool(), BoolTC(False))])
+
+
+def test_overwritten_store_is_removed():
+    code_block = propagate(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            AssignmentTC("a", AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+            AssignmentTC("a", AdditionTC(IdentifierTC("x"), UnsignedintTC(2))),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+    assert code_block == BlockTC(
+        [
+            LetTC("a", U8(), IdentifierTC("x")),
+            AssignmentTC("a", AdditionTC(IdentifierTC("x"), UnsignedintTC(2))),
+            PrintTC(IdentifierTC("a")),
+        ]
+    )
+
+
+def test_removed_store_keeps_call():
+    call = FunctionCallTC("g", [IdentifierTC("x")])
+    code_block = propagate(
+        [
+            AssignmentTC("x", call),
+            AssignmentTC("x", UnsignedintTC(3)),
+            ReturnTC(AdditionTC(IdentifierTC("x"), IdentifierTC("x"))),
+        ],
+        U8(),
+    )
+
+    assert code_block == BlockTC([call, ReturnTC(UnsignedintTC(6))])
+
+
+def test_store_read_after_if_is_kept():
+    statements = [
+        AssignmentTC("x", AdditionTC(IdentifierTC("x"), UnsignedintTC(1))),
+        IfTC(
+            IdentifierTC("flag"),
+            BlockTC(
+                [AssignmentTC("x", AdditionTC(IdentifierTC("x"), IdentifierTC("x")))]
+            ),
+        ),
+        PrintTC(IdentifierTC("x")),
+    ]
+
+    assert propagate(statements) == BlockTC(statements)
@@ -0,0 +1,78 @@
+from tests.ast import (
+    FunctionTC,
+    BlockTC,
+    PrintTC,
+    LetTC,
+    AdditionTC,
+    FunctionCallTC,
+    UnsignedintTC,
+    IdentifierTC,
+)
+from zx64c.types import Void, U8
+from zx64c.codegen.registers import allocate_registers
+from zx64c.codegen.z80 import Register
+
+
+def make_function(statements):
+    return FunctionTC("main", [], Void(), BlockTC(statements))
+
+
+def test_variable_is_kept_in_register():
+    ast = make_function(
+        [LetTC("x", U8(), UnsignedintTC(1)), PrintTC(IdentifierTC("x"))]
+    )
+
+    allocation = allocate_registers(ast)
+
+    assert allocation.get_register("x") is Register.H
+    assert allocation.get_saved(0) == ()
+
+
+def test_variable_live_across_print_is_saved():
+    ast = make_function(
+        [
+            LetTC("x", U8(), UnsignedintTC(1)),
+            PrintTC(IdentifierTC("x")),
+            PrintTC(IdentifierTC("x")),
+            PrintTC(IdentifierTC("x")),
+        ]
+    )
+
+    allocation = allocate_registers(ast)
+
+    assert allocation.get_register("x") is Register.H
+    assert [allocation.get_saved(site) for site in range(3)] == [
+        (Register.HL,),
+        (Register.HL,),
+        (),
+    ]
+
+
+def test_rarely_used_variable_stays_in_frame():
+    ast = make_function(
+        [
+            LetTC("x", U8(), UnsignedintTC(1)),
+            PrintTC(UnsignedintTC(2)),
+            FunctionCallTC("f", []),
+            PrintTC(IdentifierTC("x")),
+        ]
+    )
+
+    allocation = allocate_registers(ast)
+
+    assert allocation.variables == frozenset()
+
+
+def test_variables_are_spilled_when_registers_run_out():
+    names = [f"x{i}" for i in range(6)]
+    lets = [LetTC(name, U8(), UnsignedintTC(1)) for name in names]
+    total = IdentifierTC(names[0])
+    for name in names[1:]:
+        total = AdditionTC(IdentifierTC(name), total)
+    ast = make_function(lets + [LetTC("y", U8(), total)])
+
+    allocation = allocate_registers(ast)
+
+    assert allocation.variables == frozenset(names[:5] + ["y"])
+    assert allocation.get_register("x5") is None
+    assert allocation.get_register("y") is not None
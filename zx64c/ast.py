@@ -493,3 +493,140 @@ def _(self, rhs: Bool) -> bool:
         and self.value == rhs.value
         and self.context == self.context
     )
+
+
+class AstTransformer(AstVisitor[Ast]):
+    """
+    Visitor that rebuilds the visited tree. Each method returns a new node
+    made of transformed children, so subclasses only need to override methods
+    for nodes they want to change.
+    """
+
+    def visit_program(self, node: Program) -> Ast:
+        functions = [function.visit(self) for function in node.functions]
+        return Program(functions, node.context)
+
+    def visit_function(self, node: Function) -> Ast:
+        return Function(
+            node.name,
+            node.parameters,
+            node.return_type,
+            node.code_block.visit(self),
+            node.context,
+        )
+
+    def visit_block(self, node: Block) -> Ast:
+        statements = [statement.visit(self) for statement in node.statements]
+        return Block(statements, node.context)
+
+    def visit_if(self, node: If) -> Ast:
+        return If(
+            node.condition.visit(self), node.consequence.visit(self), node.context
+        )
+
+    def visit_print(self, node: Print) -> Ast:
+        return Print(node.expression.visit(self), node.context)
+
+    def visit_let(self, node: Let) -> Ast:
+        return Let(node.name, node.var_type, node.rhs.visit(self), node.context)
+
+    def visit_return(self, node: Return) -> Ast:
+        return Return(node.expr.visit(self), node.context)
+
+    def visit_assignment(self, node: Assignment) -> Ast:
+        return Assignment(node.name, node.rhs.visit(self), node.context)
+
+    def visit_equal(self, node: Equal) -> Ast:
+        return Equal(node.lhs.visit(self), node.rhs.visit(self), node.context)
+
+    def visit_not_equal(self, node: NotEqual) -> Ast:
+        return NotEqual(node.lhs.visit(self), node.rhs.visit(self), node.context)
+
+    def visit_addition(self, node: Addition) -> Ast:
+        return Addition(node.lhs.visit(self), node.rhs.visit(self), node.context)
+
+    def visit_subtraction(self, node: Subtraction) -> Ast:
+        return Subtraction(node.lhs.visit(self), node.rhs.visit(self), node.context)
+
+    def visit_negation(self, node: Negation) -> Ast:
+        return Negation(node.expression.visit(self), node.context)
+
+    def visit_function_call(self, node: FunctionCall) -> Ast:
+        arguments = [argument.visit(self) for argument in node.arguments]
+        return FunctionCall(node.function_name, arguments, node.context)
+
+    def visit_identifier(self, node: Identifier) -> Ast:
+        return Identifier(node.value, node.context)
+
+    def visit_unsignedint(self, node: Unsignedint) -> Ast:
+        return Unsignedint(node.value, node.context)
+
+    def visit_bool(self, node: Bool) -> Ast:
+        return Bool(node.value, node.context)
+
+
+class AstWalker(AstVisitor[None]):
+    """
+    Visitor that visits every node of the tree without changing it.
+    Subclasses override methods for nodes they want to inspect and call the
+    base method to continue into children.
+    """
+
+    def visit_program(self, node: Program) -> None:
+        for function in node.functions:
+            function.visit(self)
+
+    def visit_function(self, node: Function) -> None:
+        node.code_block.visit(self)
+
+    def visit_block(self, node: Block) -> None:
+        for statement in node.statements:
+            statement.visit(self)
+
+    def visit_if(self, node: If) -> None:
+        node.condition.visit(self)
+        node.consequence.visit(self)
+
+    def visit_print(self, node: Print) -> None:
+        node.expression.visit(self)
+
+    def visit_let(self, node: Let) -> None:
+        node.rhs.visit(self)
+
+    def visit_return(self, node: Return) -> None:
+        node.expr.visit(self)
+
+    def visit_assignment(self, node: Assignment) -> None:
+        node.rhs.visit(self)
+
+    def visit_equal(self, node: Equal) -> None:
+        node.lhs.visit(self)
+        node.rhs.visit(self)
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        node.lhs.visit(self)
+        node.rhs.visit(self)
+
+    def visit_addition(self, node: Addition) -> None:
+        node.lhs.visit(self)
+        node.rhs.visit(self)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        node.lhs.visit(self)
+        node.rhs.visit(self)
+
+    def visit_negation(self, node: Negation) -> None:
+        node.expression.visit(self)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        for argument in node.arguments:
+            argument.visit(self)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        pass
+
+    def visit_unsignedint(self, node: Unsignedint) -> None:
+        pass
+
+    def visit_bool(self, node: Bool) -> None:
+        pass
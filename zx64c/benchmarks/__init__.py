@@ -0,0 +1,4 @@
+"""
+Benchmarks of the compiler. Every module is a script run with
+`python -m zx64c.benchmarks.<module>`.
+"""
@@ -0,0 +1,352 @@
+"""
+Measures the time and memory taken by every phase of the compiler on large
+generated programs.
+
+Programs are made of functions with many `let` statements, assignments,
+prints, nested `if` statements and long expressions calling previously
+defined functions. They are generated from a seed, so the same options
+always give the same program.
+
+Results are appended to a JSON history file and compared with the last
+result of the same configuration in a baseline history. A phase that got
+slower or used more memory than the threshold allows is reported as a
+regression and the command fails.
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import click
+
+from zx64c.ast import Ast
+from zx64c.codegen import Z80CodegenVisitor
+from zx64c.codegen.z80 import Item
+from zx64c.parser import Parser
+from zx64c.scanner import Scanner, Token
+from zx64c.typechecker import TypecheckerVisitor
+
+INDENTATION = "    "
+
+Record = Dict[str, Any]
+# ^^^ result of a single benchmark as stored in the history
+
+
+class ProgramGenerator:
+    """
+    Generates source code of valid programs. All values are `u8`, functions
+    take one to three parameters and return a value computed from them.
+
+    Expressions are chains of additions and subtractions, and as the parser
+    groups them to the right, only the last operand of a chain may be a
+    literal for the typechecker to accept it.
+    """
+
+    def __init__(
+        self, seed: int, statements: int, max_depth: int, expression_size: int
+    ):
+        self._random = random.Random(seed)
+        self._statements = statements
+        self._max_depth = max_depth
+        self._expression_size = expression_size
+        self._functions: List[Tuple[str, int]] = []
+        self._scopes: List[List[str]] = []
+        self._variables = 0
+
+    def program(self, functions: int) -> str:
+        sources = [self._function(f"f{index}") for index in range(functions)]
+        sources.append(self._main())
+        return "\n".join(sources)
+
+    def _function(self, name: str) -> str:
+        parameters = [f"p{index}" for index in range(self._random.randint(1, 3))]
+        self._scopes = [list(parameters)]
+        self._variables = 0
+        header = ", ".join(f"{parameter}: u8" for parameter in parameters)
+        lines = [f"def {name}({header}) -> u8:"]
+        lines.extend(self._block(1))
+        lines.append(f"{INDENTATION}return {self._expression()}")
+        self._functions.append((name, len(parameters)))
+        return "\n".join(lines) + "\n"
+
+    def _main(self) -> str:
+        self._scopes = [[]]
+        self._variables = 0
+        lines = ["def main() -> void:", self._let(1, str(self._random.randrange(256)))]
+        lines.extend(self._block(1))
+        return "\n".join(lines) + "\n"
+
+    def _block(self, depth: int) -> List[str]:
+        indentation = INDENTATION * depth
+        lines: List[str] = []
+        statements = max(1, self._statements >> (depth - 1))
+        # ^^^ nested blocks are shorter, so functions do not grow exponentially
+        #     with the depth
+        for _ in range(self._random.randint(1, statements)):
+            choice = self._random.random()
+            if choice < 0.2 and depth <= self._max_depth:
+                condition = f"{self._expression()} == {self._expression()}"
+                lines.append(f"{indentation}if {condition}:")
+                self._scopes.append([])
+                lines.extend(self._block(depth + 1))
+                self._scopes.pop()
+            elif choice < 0.3:
+                lines.append(f"{indentation}print({self._expression()})")
+            elif choice < 0.5:
+                name = self._random.choice(self._visible())
+                lines.append(f"{indentation}{name} = {self._expression()}")
+            else:
+                lines.append(self._let(depth, self._expression()))
+        return lines
+
+    def _let(self, depth: int, rhs: str) -> str:
+        name = f"v{self._variables}"
+        self._variables += 1
+        self._scopes[-1].append(name)
+        return f"{INDENTATION * depth}let {name}: u8 = {rhs}"
+
+    def _visible(self) -> List[str]:
+        return [name for scope in self._scopes for name in scope]
+
+    def _operand(self) -> str:
+        if self._functions and self._random.random() < 0.1:
+            name, parameters = self._random.choice(self._functions)
+            arguments = ", ".join(
+                self._random.choice(self._visible()) for _ in range(parameters)
+            )
+            return f"{name}({arguments})"
+        return self._random.choice(self._visible())
+
+    def _expression(self) -> str:
+        size = self._random.randint(1, self._expression_size)
+        operands = [self._operand() for _ in range(size)]
+        if self._random.random() < 0.5:
+            operands.append(str(self._random.randrange(256)))
+        expression = operands[0]
+        for operand in operands[1:]:
+            expression += f" {self._random.choice('+-')} {operand}"
+        return expression
+
+
+def generate_program(
+    seed: int,
+    functions: int,
+    statements: int = 16,
+    max_depth: int = 3,
+    expression_size: int = 8,
+) -> str:
+    generator = ProgramGenerator(seed, statements, max_depth, expression_size)
+    return generator.program(functions)
+
+
+def _scan(source: str) -> List[Token]:
+    return Scanner(source).scan()
+
+
+def _parse(tokens: List[Token]) -> Ast:
+    return Parser(tokens).parse()
+
+
+def _typecheck(ast: Ast) -> Ast:
+    ast.visit(TypecheckerVisitor())
+    return ast
+
+
+def _generate_code(ast: Ast) -> List[Item]:
+    codegen = Z80CodegenVisitor()
+    ast.visit(codegen)
+    return codegen.code
+
+
+PHASES: List[Tuple[str, Callable[[Any], Any]]] = [
+    ("scanner", _scan),
+    ("parser", _parse),
+    ("typechecker", _typecheck),
+    ("codegen", _generate_code),
+]
+# ^^^ every phase is given the result of the previous one
+
+
+@dataclass
+class PhaseResult:
+    seconds: float
+    peak_memory: int
+    # ^^^ bytes, the largest amount of memory allocated during the phase
+
+
+def measure_phases(source: str, repeats: int) -> Dict[str, PhaseResult]:
+    """
+    Runs the phases `repeats` times and takes the best time of every phase.
+    Memory is traced in a separate run, as tracing slows Python down.
+    """
+    best = {name: float("inf") for name, _ in PHASES}
+    for _ in range(repeats):
+        value: Any = source
+        for name, phase in PHASES:
+            start = time.perf_counter()
+            value = phase(value)
+            best[name] = min(best[name], time.perf_counter() - start)
+
+    peaks = {}
+    value = source
+    for name, phase in PHASES:
+        tracemalloc.start()
+        try:
+            value = phase(value)
+            _, peaks[name] = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {name: PhaseResult(best[name], peaks[name]) for name, _ in PHASES}
+
+
+@dataclass
+class Regression:
+    phase: str
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self):
+        change = (self.current / self.baseline - 1) * 100
+        return (
+            f"{self.phase}: {self.metric} regressed by {change:.1f}%"
+            f" ({self.baseline:.6g} -> {self.current:.6g})"
+        )
+
+
+def find_regressions(
+    baseline: Record, current: Record, threshold: float
+) -> List[Regression]:
+    """
+    Compares every phase of the records, a metric that grew by more than the
+    threshold (a fraction, e.g. 0.1 for 10%) is a regression.
+    """
+    regressions = []
+    for phase, result in current["phases"].items():
+        if phase not in baseline["phases"]:
+            continue
+        for metric, value in result.items():
+            reference = baseline["phases"][phase].get(metric)
+            if reference and value > reference * (1 + threshold):
+                regressions.append(Regression(phase, metric, reference, value))
+    return regressions
+
+
+def load_history(path: str) -> List[Record]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def save_history(path: str, history: List[Record]) -> None:
+    with open(path, "w") as file:
+        json.dump(history, file, indent=2)
+
+
+def find_baseline(history: List[Record], config: Record) -> Optional[Record]:
+    for record in reversed(history):
+        if record["config"] == config:
+            return record
+    return None
+
+
+@click.command()
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--statements", type=click.IntRange(min=1), default=16, show_default=True)
+@click.option("--max-depth", type=click.IntRange(min=0), default=3, show_default=True)
+@click.option(
+    "--expression-size", type=click.IntRange(min=1), default=8, show_default=True
+)
+@click.option("--repeats", type=click.IntRange(min=1), default=5, show_default=True)
+@click.option(
+    "--history",
+    type=click.Path(dir_okay=False),
+    help="JSON file the results are appended to.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    help="JSON history the results are compared with.",
+)
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.1,
+    show_default=True,
+    help="Allowed growth of time and memory relative to the baseline.",
+)
+@click.option("--label", default="", help="Label stored with the results.")
+@click.argument("sizes", type=click.IntRange(min=0), nargs=-1)
+def benchmark(
+    seed: int,
+    statements: int,
+    max_depth: int,
+    expression_size: int,
+    repeats: int,
+    history: Optional[str],
+    baseline: Optional[str],
+    threshold: float,
+    label: str,
+    sizes,
+):
+    """
+    Prints the best time and the peak memory of every compilation phase for
+    programs with the given numbers of functions besides `main`.
+    """
+    baseline_history = load_history(baseline) if baseline else []
+    records = []
+    regressions = []
+    click.echo(
+        f"{'functions':>9} {'lines':>7} {'phase':>12} {'ms':>10} {'peak KiB':>10}"
+    )
+    for size in sizes or (5, 10, 20):
+        config = {
+            "seed": seed,
+            "functions": size,
+            "statements": statements,
+            "max_depth": max_depth,
+            "expression_size": expression_size,
+        }
+        source = generate_program(seed, size, statements, max_depth, expression_size)
+        lines = source.count("\n")
+        phases = measure_phases(source, repeats)
+        for name, result in phases.items():
+            click.echo(
+                f"{size:>9} {lines:>7} {name:>12} {result.seconds * 1000:>10.2f}"
+                f" {result.peak_memory / 1024:>10.1f}"
+            )
+        record = {
+            "label": label,
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "config": config,
+            "lines": lines,
+            "phases": {
+                name: {"seconds": result.seconds, "peak_memory": result.peak_memory}
+                for name, result in phases.items()
+            },
+        }
+        records.append(record)
+        reference = find_baseline(baseline_history, config)
+        if reference is not None:
+            regressions.extend(find_regressions(reference, record, threshold))
+
+    if history:
+        save_history(history, load_history(history) + records)
+    for regression in regressions:
+        click.echo(f"regression with {regression}", err=True)
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,210 @@
+"""
+Measures the time taken by dataflow analyses of large generated functions.
+
+Functions are sequences of `let` statements, assignments, prints and `if`
+statements nested up to a given depth, so they have many blocks, phis and
+versions of every variable.
+"""
+from __future__ import annotations
+
+import random
+import time
+
+from typing import Callable, Dict, List, Set, Tuple
+
+import click
+
+from zx64c.ast import (
+    Ast,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Assignment,
+    Equal,
+    Addition,
+    Subtraction,
+    Identifier,
+    Unsignedint,
+)
+from zx64c import ir
+from zx64c.ast import Parameter, SourceContext
+from zx64c.ir.builder import build_function_ir
+from zx64c.ir.dataflow import Liveness, ReachingDefinitions
+from zx64c.types import Void, U8
+
+CONTEXT = SourceContext(0, 0)
+
+
+class _FunctionGenerator:
+    def __init__(self, seed: int, variables: int, max_depth: int):
+        self._random = random.Random(seed)
+        self._variables = [f"v{index}" for index in range(variables)]
+        self._max_depth = max_depth
+
+    def _operand(self) -> Ast:
+        if self._random.random() < 0.3:
+            return Unsignedint(self._random.randrange(256), CONTEXT)
+        return Identifier(self._random.choice(self._variables), CONTEXT)
+
+    def _expression(self) -> Ast:
+        operator = self._random.choice((Addition, Subtraction))
+        return operator(self._operand(), self._operand(), CONTEXT)
+
+    def _statements(self, count: int, depth: int) -> List[Ast]:
+        statements: List[Ast] = []
+        while len(statements) < count:
+            choice = self._random.random()
+            if choice < 0.2 and depth < self._max_depth:
+                condition = Equal(self._operand(), self._operand(), CONTEXT)
+                consequence = self._statements(self._random.randint(1, 8), depth + 1)
+                statements.append(If(condition, Block(consequence, CONTEXT), CONTEXT))
+            elif choice < 0.3:
+                statements.append(Print(self._operand(), CONTEXT))
+            else:
+                name = self._random.choice(self._variables)
+                statements.append(Assignment(name, self._expression(), CONTEXT))
+        return statements
+
+    def function(self, statements: int) -> Function:
+        body: List[Ast] = [
+            Let(name, U8(), Unsignedint(0, CONTEXT), CONTEXT)
+            for name in self._variables
+        ]
+        body.extend(self._statements(statements, 0))
+        parameters = [Parameter("p", U8())]
+        return Function("f", parameters, Void(), Block(body, CONTEXT), CONTEXT)
+
+
+Sets = Dict[str, Set[ir.Temp]]
+
+
+def _set_liveness(function: ir.FunctionIr) -> Tuple[Sets, Sets]:
+    """
+    Returns temporaries live at the start and at the end of every block,
+    walking the blocks of the acyclic graph once in postorder.
+    """
+    live_in: Sets = {}
+    live_out: Sets = {}
+    for block in reversed(function.reverse_postorder()):
+        live: Set[ir.Temp] = set()
+        for successor in block.successors():
+            live |= live_in[successor]
+            for phi in function.blocks[successor].phis:
+                value = phi.incoming.get(block.label)
+                if isinstance(value, ir.Temp):
+                    live.add(value)
+        live_out[block.label] = set(live)
+        live.update(
+            value for value in block.terminator.uses() if isinstance(value, ir.Temp)
+        )
+        for instruction in reversed(block.instructions):
+            live.discard(instruction.dest)
+            live.update(
+                value for value in instruction.uses() if isinstance(value, ir.Temp)
+            )
+        live.difference_update(phi.dest for phi in block.phis)
+        live_in[block.label] = live
+    return live_in, live_out
+
+
+def _set_reaching_definitions(function: ir.FunctionIr) -> Tuple[Sets, Sets]:
+    """
+    Returns definitions of variables reaching the start and the end of every
+    block, walking the blocks of the acyclic graph once in reverse postorder.
+    """
+    reaching_in: Sets = {}
+    reaching_out: Sets = {}
+    predecessors = function.predecessors()
+    for block in function.reverse_postorder():
+        reaching: Set[ir.Temp] = set()
+        if block is function.entry:
+            reaching.update(function.parameters)
+        for predecessor in predecessors[block.label]:
+            reaching |= reaching_out[predecessor]
+        reaching_in[block.label] = reaching
+        last_versions: Dict[str, ir.Temp] = {}
+        for instruction in block:
+            temp = instruction.dest
+            if temp is not None and temp.name is not None:
+                last_versions[temp.name] = temp
+        if last_versions:
+            reaching = {
+                version for version in reaching if version.name not in last_versions
+            }
+            reaching.update(last_versions.values())
+        reaching_out[block.label] = reaching
+    return reaching_in, reaching_out
+
+
+def _check(function: ir.FunctionIr, analysis: str, found, expected) -> None:
+    for label in function.blocks:
+        if (
+            found[0](label) != expected[0][label]
+            or found[1](label) != expected[1][label]
+        ):
+            raise click.ClickException(
+                f"{analysis} differs from the set walk in block {label}"
+            )
+
+
+def _best_time(run: Callable[[], object], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@click.command()
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--variables", type=click.IntRange(min=1), default=32, show_default=True)
+@click.option("--max-depth", type=click.IntRange(min=0), default=4, show_default=True)
+@click.option("--repeats", type=click.IntRange(min=1), default=5, show_default=True)
+@click.argument("sizes", type=click.IntRange(min=1), nargs=-1)
+def benchmark(seed: int, variables: int, max_depth: int, repeats: int, sizes):
+    """
+    Prints the best time of liveness and reaching definitions of functions
+    with the given numbers of top level statements, and of the set walks
+    they are checked against.
+    """
+    click.echo(
+        f"{'statements':>10} {'blocks':>7} {'temps':>7}"
+        f" {'liveness ms':>12} {'sets ms':>8} {'reaching ms':>12} {'sets ms':>8}"
+    )
+    for size in sizes or (100, 1000, 5000):
+        generator = _FunctionGenerator(seed, variables, max_depth)
+        function = build_function_ir(generator.function(size), {})
+        temps = len(function.parameters) + sum(
+            1 for instruction in function.instructions() if instruction.dest is not None
+        )
+
+        liveness = Liveness(function)
+        expected = _set_liveness(function)
+        _check(function, "Liveness", (liveness.live_in, liveness.live_out), expected)
+        reaching = ReachingDefinitions(function)
+        found = (reaching.reaching_in, reaching.reaching_out)
+        _check(
+            function, "Reaching definitions", found, _set_reaching_definitions(function)
+        )
+
+        times = [
+            _best_time(lambda: Liveness(function), repeats),
+            _best_time(lambda: _set_liveness(function), repeats),
+            _best_time(lambda: ReachingDefinitions(function), repeats),
+            _best_time(lambda: _set_reaching_definitions(function), repeats),
+        ]
+        liveness_ms, live_sets_ms, reaching_ms, reaching_sets_ms = (
+            seconds * 1000 for seconds in times
+        )
+        click.echo(
+            f"{size:>10} {len(function.blocks):>7} {temps:>7}"
+            f" {liveness_ms:>12.2f} {live_sets_ms:>8.2f}"
+            f" {reaching_ms:>12.2f} {reaching_sets_ms:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,165 @@
+"""
+Measures the speed and the size of the code generated for the programs in
+the `programs` directory at every optimization level.
+
+Programs are executed by the emulator, which counts T-states, and their
+output is checked against the expected one. Expected outputs, T-states and
+sizes are kept in `programs/expected.json`. The command fails if a program
+prints something else or its code got slower or bigger than expected by
+more than the threshold, and `--update` records the current results as the
+expected ones.
+"""
+from __future__ import annotations
+
+import json
+import os
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import click
+
+from zx64c.codegen.z80 import Item, code_size
+from zx64c.emulator import execute
+from zx64c.main import build_pass_manager
+from zx64c.parser import Parser
+from zx64c.scanner import Scanner
+from zx64c.typechecker import TypecheckerVisitor
+
+PROGRAMS_DIRECTORY = os.path.join(os.path.dirname(__file__), "programs")
+EXPECTED_PATH = os.path.join(PROGRAMS_DIRECTORY, "expected.json")
+LEVELS = (0, 1, 2, 3)
+
+
+@dataclass(frozen=True)
+class Measurement:
+    output: str
+    cycles: int
+    size: int
+
+
+def compile_program(source: str, optimization_level: int, name: str) -> List[Item]:
+    ast = Parser(Scanner(source).scan()).parse()
+    ast.visit(TypecheckerVisitor())
+    return build_pass_manager(optimization_level, name).run(ast)
+
+
+def measure_program(name: str, optimization_level: int) -> Measurement:
+    with open(os.path.join(PROGRAMS_DIRECTORY, f"{name}.zx64"), "r") as file:
+        source = file.read()
+    code = compile_program(source, optimization_level, name)
+    result = execute(code)
+    return Measurement(result.output, result.cycles, code_size(code))
+
+
+def list_programs() -> List[str]:
+    return sorted(
+        os.path.splitext(entry)[0]
+        for entry in os.listdir(PROGRAMS_DIRECTORY)
+        if entry.endswith(".zx64")
+    )
+
+
+def find_problems(
+    name: str,
+    optimization_level: int,
+    measurement: Measurement,
+    expected: Optional[dict],
+    threshold: float,
+) -> List[str]:
+    """
+    Compares the measurement with the expected results of the program, which
+    are stored as `{"output": ..., "levels": {"1": {"cycles": ..., ...}}}`.
+    """
+    where = f"{name} -O{optimization_level}"
+    if expected is None or str(optimization_level) not in expected["levels"]:
+        return [f"{where}: no expected results, run with --update"]
+    problems = []
+    if measurement.output != expected["output"]:
+        problems.append(
+            f"{where}: printed {measurement.output!r}"
+            f" instead of {expected['output']!r}"
+        )
+    limits = expected["levels"][str(optimization_level)]
+    for metric in ("cycles", "size"):
+        value, limit = getattr(measurement, metric), limits[metric]
+        if value > limit * (1 + threshold):
+            problems.append(f"{where}: {metric} grew from {limit} to {value}")
+    return problems
+
+
+def load_expected() -> Dict[str, dict]:
+    if not os.path.exists(EXPECTED_PATH):
+        return {}
+    with open(EXPECTED_PATH, "r") as file:
+        return json.load(file)
+
+
+def save_expected(
+    expected: Dict[str, dict], measurements: Dict[str, Dict[int, Measurement]]
+) -> None:
+    """
+    Replaces the expected results of the measured programs, results of the
+    other programs are kept.
+    """
+    expected = dict(expected)
+    for name, levels in measurements.items():
+        expected[name] = {
+            "output": levels[LEVELS[0]].output,
+            "levels": {
+                str(level): {"cycles": result.cycles, "size": result.size}
+                for level, result in levels.items()
+            },
+        }
+    with open(EXPECTED_PATH, "w") as file:
+        json.dump(expected, file, indent=2)
+        file.write("\n")
+
+
+@click.command()
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    show_default=True,
+    help="Allowed growth of T-states and size relative to the expected ones.",
+)
+@click.option("--update", is_flag=True, help="Record the results as expected.")
+@click.argument("programs", nargs=-1)
+def benchmark(threshold: float, update: bool, programs):
+    """
+    Prints T-states and sizes of the programs at every optimization level,
+    with the change relative to -O0.
+    """
+    expected = load_expected()
+    measurements: Dict[str, Dict[int, Measurement]] = {}
+    problems = []
+    click.echo(f"{'program':>12} {'level':>5} {'T-states':>10} {'':>7} {'bytes':>6}")
+    for name in programs or list_programs():
+        levels = measurements[name] = {}
+        for level in LEVELS:
+            result = levels[level] = measure_program(name, level)
+            base = levels[LEVELS[0]]
+            cycles_change = (result.cycles / base.cycles - 1) * 100
+            size_change = (result.size / base.size - 1) * 100
+            click.echo(
+                f"{name:>12} {'-O' + str(level):>5} {result.cycles:>10}"
+                f" {cycles_change:>+6.1f}% {result.size:>6} {size_change:>+6.1f}%"
+            )
+            if not update:
+                problems.extend(
+                    find_problems(name, level, result, expected.get(name), threshold)
+                )
+        if update and len(set(result.output for result in levels.values())) > 1:
+            problems.append(f"{name}: output differs between optimization levels")
+
+    for problem in problems:
+        click.echo(problem, err=True)
+    if problems:
+        raise SystemExit(1)
+    if update:
+        save_expected(expected, measurements)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,669 @@
+from __future__ import annotations
+
+import functools
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from zx64c.ast import (
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import Ast, AstVisitor
+from zx64c.codegen.expressions import (
+    RegisterNeedVisitor,
+    count_spill_slots,
+    is_operand,
+    temporary_registers,
+)
+from zx64c.codegen.frame import (
+    FrameLayout,
+    FrameUsageVisitor,
+    argument_offset,
+    build_frame_layout,
+    is_frameless,
+)
+from zx64c.codegen.registers import RegisterAllocation, allocate_registers
+from zx64c.codegen.z80 import (
+    Item,
+    Instruction,
+    Label,
+    Directive,
+    Comment,
+    SourceLine,
+    Opcode,
+    Operand,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+    Indirect,
+    Indexed,
+)
+
+
+BYTE_MASK = 0xFF
+
+
+def _literal_value(node: Ast) -> Optional[int]:
+    """
+    Returns the byte that a literal evaluates to, or None for other nodes.
+    """
+    if isinstance(node, Unsignedint):
+        return node.value & BYTE_MASK
+    if isinstance(node, Bool):
+        return int(node.value)
+    return None
+
+
+@dataclass(frozen=True)
+class CodegenOptions:
+    """
+    :param tail_calls: calls in `return` statements jump to the called
+                       function and reuse the frame of the caller, if the
+                       caller has room for all the arguments
+    :param frameless_leaves: leaf functions that do not use the frame get
+                             neither the prologue nor the epilogue
+    :param source_lines: code of every statement is preceded by a
+                         `SourceLine` marker, the prologue and the epilogue
+                         belong to the line of the function definition
+    """
+
+    tail_calls: bool = False
+    frameless_leaves: bool = False
+    source_lines: bool = False
+
+
+FRAME_PROLOGUE = (
+    Instruction(Opcode.PUSH, Register.IX),
+    Instruction(Opcode.LD, Register.IX, Immediate(0)),
+    Instruction(Opcode.ADD, Register.IX, Register.SP),
+)
+FRAME_EPILOGUE = (
+    Instruction(Opcode.LD, Register.SP, Register.IX),
+    Instruction(Opcode.POP, Register.IX),
+)
+# ^^^ the epilogue is followed by `ret`, or by `jp` in case of a tail call
+
+
+@dataclass(frozen=True)
+class FrameSavings:
+    """
+    Code that a frameless function does without. Bytes count the prologue and
+    the epilogue at every exit, T-states count a single call.
+    """
+
+    function: str
+    size: int
+    cycles: int
+
+    def __str__(self):
+        return (
+            f"{self.function}: frameless, saves {self.size} bytes"
+            f" and {self.cycles} T-states per call"
+        )
+
+
+class LabelAllocator:
+    """
+    Hands out labels that are local to a single function. The labels are
+    rendered as sjasmplus local labels (e.g. `.L0`), which the assembler
+    prefixes with the name of the enclosing function (`main.L0`). Thanks to
+    that code generated for a function does not depend on what was generated
+    before it.
+    """
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def make_label(self) -> str:
+        return f".L{next(self._counter)}"
+
+
+class SjasmplusSnapshotVisitor(AstVisitor[None]):
+    def __init__(self, codegen: Z80CodegenVisitor, source_name: str):
+        self._codegen = codegen
+        self._source_name = source_name
+
+    @property
+    def code(self) -> List[Item]:
+        return self._codegen.code
+
+    def visit_program(self, node: Program) -> None:
+        self._codegen.emit(Directive("DEVICE", ("ZXSPECTRUM48",)))
+        self._codegen.visit_program(node)
+        self._codegen.emit(Directive("SAVESNA", (f'"{self._source_name}.sna"', "main")))
+
+    def visit_function(self, node: Function) -> None:
+        self._codegen.visit_function(node)
+
+    def visit_block(self, node: Block) -> None:
+        self._codegen.visit_block(node)
+
+    def visit_if(self, node: If) -> None:
+        self._codegen.visit_if(node)
+
+    def visit_print(self, node: Print) -> None:
+        self._codegen.visit_print(node)
+
+    def visit_let(self, node: Let) -> None:
+        self._codegen.visit_let(node)
+
+    def visit_return(self, node: Return) -> None:
+        self._codegen.visit_return(node)
+
+    def visit_assignment(self, node: Assignment) -> None:
+        self._codegen.visit_assignment(node)
+
+    def visit_equal(self, node: Equal) -> None:
+        self._codegen.visit_equal(node)
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        self._codegen.visit_not_equal(node)
+
+    def visit_addition(self, node: Addition) -> None:
+        self._codegen.visit_addition(node)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        self._codegen.visit_subtraction(node)
+
+    def visit_negation(self, node: Negation) -> None:
+        self._codegen.visit_negation(node)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        self._codegen.visit_function_call(node)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self._codegen.visit_identifier(node)
+
+    def visit_unsignedint(self, node: Unsignedint) -> None:
+        self._codegen.visit_unsignedint(node)
+
+    def visit_bool(self, node: Bool) -> None:
+        self._codegen.visit_bool(node)
+
+
+class Z80CodegenVisitor(AstVisitor[None]):
+    """
+    Translates the typechecked AST into a list of Z80 code items. The code is
+    collected in `code` and can be rendered as text with `z80.render`.
+    """
+
+    def __init__(
+        self,
+        layout: Optional[FrameLayout] = None,
+        labels: Optional[LabelAllocator] = None,
+        jobs: int = 1,
+        registers: Optional[RegisterAllocation] = None,
+        options: Optional[CodegenOptions] = None,
+    ):
+        """
+        :param layout: frame layout of the function the visitor generates code
+                       for, it is not needed to generate code for a program
+        :param registers: local variables of the function kept in registers,
+                          by default all variables are kept in the frame
+        :param jobs: number of worker processes used to generate code for
+                     the functions of a program, 1 generates code serially
+        :param options: code generation options
+        """
+        if labels is None:
+            labels = LabelAllocator()
+        if registers is None:
+            registers = RegisterAllocation({})
+        if options is None:
+            options = CodegenOptions()
+        self._layout = layout
+        self._labels = labels
+        self._jobs = jobs
+        self._registers = registers
+        self._options = options
+        self._clobber_sites = itertools.count()
+        self._needs = RegisterNeedVisitor()
+        self._temporaries = list(temporary_registers(registers.registers))
+        self._spill_depth = 0
+        self._function: Optional[Function] = None
+        self._body_position = 0
+        self._body_label: Optional[str] = None
+        self._frameless = False
+        self._code: List[Item] = []
+
+    @property
+    def code(self) -> List[Item]:
+        return self._code
+
+    def emit(self, item: Item) -> None:
+        self._code.append(item)
+
+    def _emit(self, opcode: Opcode, *operands: Operand) -> None:
+        for operand in operands:
+            if isinstance(operand, Indexed) and not operand.fits_displacement:
+                self._emit_through_hl(opcode, operands, operand)
+                return
+        self._code.append(Instruction(opcode, *operands))
+
+    def _emit_through_hl(
+        self, opcode: Opcode, operands: Iterable[Operand], slot: Indexed
+    ) -> None:
+        """
+        Emits an instruction that accesses a frame slot out of the reach of
+        `(ix + d)`, which happens in frames larger than 128 bytes. The slot is
+        addressed as `(hl)` instead. All registers and flags the computation
+        of the address uses are saved around it, so the instruction behaves
+        the same as with `(ix + d)`.
+        """
+        self._code.extend(
+            [
+                Instruction(Opcode.PUSH, Register.HL),
+                Instruction(Opcode.PUSH, Register.DE),
+                Instruction(Opcode.PUSH, Register.AF),
+                Instruction(Opcode.PUSH, slot.register),
+                Instruction(Opcode.POP, Register.HL),
+                Instruction(Opcode.LD, Register.DE, Immediate(slot.offset)),
+                Instruction(Opcode.ADD, Register.HL, Register.DE),
+                Instruction(Opcode.POP, Register.AF),
+                Instruction(Opcode.POP, Register.DE),
+            ]
+        )
+        operands = [
+            Indirect(Register.HL) if operand == slot else operand
+            for operand in operands
+        ]
+        self._code.append(Instruction(opcode, *operands))
+        self._code.append(Instruction(Opcode.POP, Register.HL))
+
+    def _mark_line(self, node: Ast) -> None:
+        if self._options.source_lines and node.context is not None:
+            line = node.context.line
+            self.emit(SourceLine(f"line {line}", line))
+
+    def _init_function(self) -> None:
+        """
+        Saves frame pointer of the caller, which is kept in `ix`, onto the
+        stack. Then sets `ix` to the stack pointer so it will act as a new
+        frame pointer for the whole body of the function.
+        After this stack should look as follow:
+        ------- $02
+        |     |
+        ------- $01
+        |     |
+        ------- ...
+        |     |
+        ------- <- sp points here after finishing this method
+        | $?? | = local variables, `frame_size` bytes reserved at once
+        ------- <- ix points here after finishing this method
+        | $?? | = frame pointer of the caller
+        -------
+        | $?? | = address where to return (push pc result of the caller)
+        -------
+        | $?? | = argument for the second parameter
+        -------
+        | $?? | = argument for the first parameter ...
+        -------
+
+        """
+        if self._frameless:
+            return
+        self.emit(Comment("BEGIN FUNCTION INITIALIZATION"))
+        self._code.extend(FRAME_PROLOGUE)
+        self._reserve_frame(self._layout.frame_size)
+        self.emit(Comment("END FUNCTION INITIALIZATION"))
+
+    def _reserve_frame(self, size: int) -> None:
+        if size == 0:
+            return
+        if size <= 4:
+            for _ in range(size):
+                self._emit(Opcode.DEC, Register.SP)
+            return
+        self._emit(Opcode.LD, Register.HL, Immediate(-size))
+        self._emit(Opcode.ADD, Register.HL, Register.SP)
+        self._emit(Opcode.LD, Register.SP, Register.HL)
+
+    def _deinit_function(self) -> None:
+        """
+        We dealloacte the stack first by loading the frame pointer to it. Then
+        whats on top of the stack is the frame pointer of the caller, so we
+        pop it back to `ix`. Frameless functions only return.
+        """
+        if self._frameless:
+            self._emit(Opcode.RET)
+            return
+        self.emit(Comment("BEGIN FUNCTION DEINITIALIZATION"))
+        self._code.extend(FRAME_EPILOGUE)
+        self._emit(Opcode.RET)
+        self.emit(Comment("END FUNCTION DEINITIALIZATION"))
+
+    def _variable(self, name: str) -> Operand:
+        register = self._registers.get_register(name)
+        if register is not None:
+            return register
+        return Indexed(Register.IX, self._layout.get_offset(name))
+
+    def _save_registers(self, site: int) -> None:
+        for pair in self._registers.get_saved(site):
+            self._emit(Opcode.PUSH, pair)
+
+    def _restore_registers(self, site: int) -> None:
+        for pair in reversed(self._registers.get_saved(site)):
+            self._emit(Opcode.POP, pair)
+
+    def _store_variable(self, name: str) -> None:
+        self._emit(Opcode.LD, self._variable(name), Register.A)
+
+    def visit_program(self, node: Program) -> None:
+        self.emit(Directive("org", ("$8000",)))
+        self._emit(Opcode.JP, LabelRef("main"))
+        generate = functools.partial(generate_function, options=self._options)
+        if self._jobs > 1 and len(node.functions) > 1:
+            chunksize = max(1, len(node.functions) // (self._jobs * 4))
+            with ProcessPoolExecutor(self._jobs) as executor:
+                self._extend(
+                    executor.map(generate, node.functions, chunksize=chunksize)
+                )
+        else:
+            self._extend(map(generate, node.functions))
+
+    def _extend(self, functions_code: Iterable[List[Item]]) -> None:
+        # Functions code arrives in the source order, no matter if it was
+        # generated in worker processes or not
+        for code in functions_code:
+            self._code.extend(code)
+
+    def visit_function(self, node: Function) -> None:
+        self._function = node
+        self._frameless = self._options.frameless_leaves and is_frameless(
+            node, self._layout
+        )
+        self.emit(Label(node.name))
+        self._mark_line(node)
+        self._init_function()
+        self._body_position = len(self._code)
+        node.code_block.visit(self)
+        self._mark_line(node)
+        self._deinit_function()
+
+    def visit_block(self, node: Block) -> None:
+        for statement in node.statements:
+            self._mark_line(statement)
+            statement.visit(self)
+
+    def visit_if(self, node: If) -> None:
+        label = self._labels.make_label()
+        self._jump_unless(node.condition, label)
+        node.consequence.visit(self)
+        self.emit(Label(label))
+
+    def _jump_unless(self, condition: Ast, label: str) -> None:
+        """
+        Emits a jump to the label taken when the condition does not hold.
+        Comparisons and bool variables branch on the flags directly instead
+        of materialising the condition in `a` first.
+        """
+        if isinstance(condition, Bool):
+            if not condition.value:
+                self._emit(Opcode.JP, LabelRef(label))
+            return
+        if isinstance(condition, (Equal, NotEqual)):
+            self._compare(condition)
+            skip = Condition.NZ if isinstance(condition, Equal) else Condition.Z
+            self._emit(Opcode.JP, skip, LabelRef(label))
+            return
+        if isinstance(condition, Identifier):
+            condition.visit(self)
+            self._emit(Opcode.OR, Register.A)
+            self._emit(Opcode.JP, Condition.Z, LabelRef(label))
+            return
+        condition.visit(self)
+        self._emit(Opcode.CP, Immediate(1))
+        self._emit(Opcode.JP, Condition.NZ, LabelRef(label))
+
+    def visit_print(self, node: Print) -> None:
+        site = next(self._clobber_sites)
+        node.expression.visit(self)
+        self._save_registers(site)
+        self._emit(Opcode.RST, Immediate(0x10))
+        self._restore_registers(site)
+
+    def visit_let(self, node: Let) -> None:
+        node.rhs.visit(self)
+        self._store_variable(node.name)
+
+    def visit_return(self, node: Return) -> None:
+        if self._is_tail_call(node.expr):
+            self._tail_call(node.expr)
+            return
+        node.expr.visit(self)
+        self._deinit_function()
+
+    def _is_tail_call(self, expression: Ast) -> bool:
+        return (
+            self._options.tail_calls
+            and isinstance(expression, FunctionCall)
+            and len(expression.arguments) <= len(self._function.parameters)
+        )
+
+    def _tail_call(self, node: FunctionCall) -> None:
+        """
+        Overwrites arguments of the current function with the arguments of the
+        call and jumps to the called function instead of calling it. The
+        called function then returns directly to our caller, which removes
+        all the arguments it pushed, so the called function may have fewer
+        parameters than the current one. A call of the current function
+        itself jumps over the prologue, so recursion becomes a loop.
+        """
+        next(self._clobber_sites)
+        # ^ nothing is live after the call, so no registers need to be saved
+        count = len(node.arguments)
+        for arg_expression in node.arguments:
+            arg_expression.visit(self)
+            self._emit(Opcode.PUSH, Register.AF)
+        for index in reversed(range(count)):
+            self._emit(Opcode.POP, Register.AF)
+            offset = argument_offset(index, count)
+            self._emit(Opcode.LD, Indexed(Register.IX, offset), Register.A)
+        if node.function_name == self._function.name:
+            self._emit(Opcode.JP, LabelRef(self._get_body_label()))
+            return
+        self._code.extend(FRAME_EPILOGUE)
+        self._emit(Opcode.JP, LabelRef(node.function_name))
+
+    def _get_body_label(self) -> str:
+        """
+        Returns label placed after the prologue of the current function.
+        """
+        if self._body_label is None:
+            self._body_label = self._labels.make_label()
+            self._code.insert(self._body_position, Label(self._body_label))
+        return self._body_label
+
+    def visit_assignment(self, node: Assignment) -> None:
+        node.rhs.visit(self)
+        self._store_variable(node.name)
+
+    def _binary(self, node: Ast, combine: Callable[[Operand, bool], None]) -> None:
+        """
+        Evaluates operands of the binary operator in the order given by
+        `RegisterNeedVisitor` and calls `combine` with one of them in `a` and
+        the other one as an operand. The flag passed to `combine` tells that
+        `a` holds the right operand instead of the left one.
+
+        The first evaluated value is kept in a temporary register, or in a
+        spill slot of the frame if there is no free register or the second
+        operand calls a function, which clobbers all registers.
+        """
+        first, second = self._needs.evaluation_order(node)
+        first.visit(self)
+        if is_operand(second):
+            combine(self._operand(second), first is node.rhs)
+            return
+
+        if self._needs.is_spilled(node, len(self._temporaries)):
+            offset = self._layout.get_spill_offset(self._spill_depth)
+            kept: Operand = Indexed(Register.IX, offset)
+            self._emit(Opcode.LD, kept, Register.A)
+            self._spill_depth += 1
+            second.visit(self)
+            self._spill_depth -= 1
+        else:
+            kept = self._temporaries.pop(0)
+            self._emit(Opcode.LD, kept, Register.A)
+            second.visit(self)
+            self._temporaries.insert(0, kept)
+        combine(kept, second is node.rhs)
+
+    def _operand(self, node: Ast) -> Operand:
+        value = _literal_value(node)
+        if value is not None:
+            return Immediate(value)
+        return self._variable(node.value)
+
+    def _compare(self, node: Ast) -> None:
+        """
+        Emits code that sets the zero flag if operands of the comparison are
+        equal.
+        """
+        self._binary(node, self._compare_with)
+
+    def _compare_with(self, operand: Operand, swapped: bool) -> None:
+        if operand == Immediate(0):
+            self._emit(Opcode.OR, Register.A)
+        else:
+            self._emit(Opcode.CP, operand)
+
+    def _add(self, operand: Operand, swapped: bool = False) -> None:
+        if isinstance(operand, Immediate):
+            self._add_immediate(operand.value)
+        else:
+            self._emit(Opcode.ADD, Register.A, operand)
+
+    def _subtract(self, operand: Operand, swapped: bool) -> None:
+        if swapped:
+            # x - y = -y + x
+            self._emit(Opcode.NEG)
+            self._add(operand)
+        elif isinstance(operand, Immediate) and operand.value in (0, 1, BYTE_MASK):
+            self._add_immediate(-operand.value & BYTE_MASK)
+        else:
+            self._emit(Opcode.SUB, operand)
+
+    def _add_immediate(self, value: int) -> None:
+        if value == 0:
+            return
+        if value == 1:
+            self._emit(Opcode.INC, Register.A)
+        elif value == BYTE_MASK:
+            self._emit(Opcode.DEC, Register.A)
+        else:
+            self._emit(Opcode.ADD, Register.A, Immediate(value))
+
+    def visit_equal(self, node: Equal) -> None:
+        self._compare(node)
+        label = self._labels.make_label()
+        self._emit(Opcode.LD, Register.A, Immediate(1))  # We assume it is true
+        self._emit(Opcode.JR, Condition.Z, LabelRef(label))
+        self._emit(Opcode.LD, Register.A, Immediate(0))
+        # ^ In case operands are not equal
+        self.emit(Label(label))
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        self._compare(node)
+        label = self._labels.make_label()
+        self._emit(Opcode.LD, Register.A, Immediate(1))  # We assume it is true
+        self._emit(Opcode.JP, Condition.NZ, LabelRef(label))
+        self._emit(Opcode.LD, Register.A, Immediate(0))  # In case operands are equal
+        self.emit(Label(label))
+
+    def visit_addition(self, node: Addition) -> None:
+        self._binary(node, self._add)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        self._binary(node, self._subtract)
+
+    def visit_negation(self, node: Negation) -> None:
+        node.expression.visit(self)
+        self._emit(Opcode.NEG)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        site = next(self._clobber_sites)
+        self._save_registers(site)
+        for arg_expression in node.arguments:
+            arg_expression.visit(self)
+            self._emit(Opcode.PUSH, Register.AF)
+        self._emit(Opcode.CALL, LabelRef(node.function_name))
+        for arg_expression in node.arguments:
+            # after the call we need to deallocate all the arguments
+            # that we previously pushed onto the stack
+            self._emit(Opcode.POP, Register.BC)
+        self._restore_registers(site)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self._emit(Opcode.LD, Register.A, self._variable(node.value))
+
+    def visit_unsignedint(self, node: Unsignedint) -> None:
+        self._emit(Opcode.LD, Register.A, Immediate(node.value))
+
+    def visit_bool(self, node: Bool) -> None:
+        value = 1 if node.value else 0
+        self._emit(Opcode.LD, Register.A, Immediate(value))
+
+
+def _build_layout(function: Function, registers: RegisterAllocation) -> FrameLayout:
+    temporaries = temporary_registers(registers.registers)
+    spill_slots = count_spill_slots(function, len(temporaries))
+    return build_frame_layout(function, registers.variables, spill_slots)
+
+
+def generate_function(
+    function: Function, options: Optional[CodegenOptions] = None
+) -> List[Item]:
+    """
+    Generates code for a single function. It does not depend on any state
+    shared with other functions, so it can be run in a separate process.
+    """
+    registers = allocate_registers(function)
+    layout = _build_layout(function, registers)
+    visitor = Z80CodegenVisitor(
+        layout, LabelAllocator(), registers=registers, options=options
+    )
+    function.visit(visitor)
+    return visitor.code
+
+
+def frameless_savings(program: Program) -> List[FrameSavings]:
+    """
+    Returns savings for every function of the program that is generated
+    without a frame when `frameless_leaves` is enabled.
+    """
+    prologue_size = sum(instruction.size for instruction in FRAME_PROLOGUE)
+    epilogue_size = sum(instruction.size for instruction in FRAME_EPILOGUE)
+    cycles = sum(instruction.cycles for instruction in FRAME_PROLOGUE + FRAME_EPILOGUE)
+
+    savings = []
+    for function in program.functions:
+        layout = _build_layout(function, allocate_registers(function))
+        if not is_frameless(function, layout):
+            continue
+        usage = FrameUsageVisitor()
+        function.visit(usage)
+        exits = usage.returns + 1
+        # ^^^ the epilogue is generated at the end of the body as well
+        size = prologue_size + epilogue_size * exits
+        savings.append(FrameSavings(function.name, size, cycles))
+    return savings
@@ -0,0 +1,186 @@
+"""
+Static cost model of the generated code. It applies the timing table of
+`z80` to the code of every function and of every source line, so the size
+and the speed of the code can be inspected without running it.
+
+Cycles are counted along straight-line paths, that is paths through the code
+that do not jump backwards. A path ends at `ret`, at a jump to another
+function, at a backward jump (tail recursion) or when it leaves the code
+being measured. The best case takes the cheapest path and the worst case the
+most expensive one, a conditional jump costs its taken or not taken T-states
+depending on the way the path goes. Called functions and the ROM print
+routine are not included, only the instructions calling them.
+
+Lines are known only if the code was generated with `source_lines` enabled.
+"""
+from __future__ import annotations
+
+import json
+
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from zx64c.codegen.z80 import (
+    Item,
+    Instruction,
+    Label,
+    SourceLine,
+    Opcode,
+    LabelRef,
+    code_size,
+    split_functions,
+)
+
+_Branch = Tuple[int, Optional[int]]
+# ^^^ T-states spent and position the execution continues at, None when the
+#     path leaves the function
+
+
+def _describe(size: int, best: int, worst: int) -> str:
+    cycles = str(best) if best == worst else f"{best}-{worst}"
+    return f"{size} bytes, {cycles} T-states"
+
+
+@dataclass(frozen=True)
+class LineCost:
+    line: int
+    size: int
+    best: int
+    worst: int
+
+    def __str__(self):
+        return f"line {self.line}: {_describe(self.size, self.best, self.worst)}"
+
+
+@dataclass(frozen=True)
+class FunctionCost:
+    name: str
+    size: int
+    best: int
+    worst: int
+    lines: List[LineCost] = field(default_factory=list)
+
+    def __str__(self):
+        lines = [f"{self.name}: {_describe(self.size, self.best, self.worst)}"]
+        lines.extend(f"    {line}" for line in self.lines)
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class CostReport:
+    size: int
+    functions: List[FunctionCost]
+
+    def __str__(self):
+        lines = [str(function) for function in self.functions]
+        lines.append(f"total: {self.size} bytes")
+        return "\n".join(lines)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+
+class _FunctionCode:
+    """
+    Code of a single function, from its global label up to the next global
+    label.
+    """
+
+    def __init__(self, items: Sequence[Item]):
+        self.items = items
+        self.labels = {
+            item.name: position
+            for position, item in enumerate(items)
+            if isinstance(item, Label)
+        }
+
+    def _target(self, operand: object) -> Optional[int]:
+        if isinstance(operand, LabelRef):
+            return self.labels.get(operand.name)
+        return None
+
+    def branches(self, position: int) -> List[_Branch]:
+        instruction = self.items[position]
+        next_position = position + 1
+        opcode = instruction.opcode
+        conditional = len(instruction.operands) == 2 or opcode is Opcode.DJNZ
+        if opcode in (Opcode.JP, Opcode.JR, Opcode.DJNZ):
+            taken = (instruction.cycles, self._target(instruction.operands[-1]))
+            if not conditional:
+                return [taken]
+            return [taken, (instruction.cycles_not_taken, next_position)]
+        if opcode is Opcode.RET:
+            if not instruction.operands:
+                return [(instruction.cycles, None)]
+            return [
+                (instruction.cycles, None),
+                (instruction.cycles_not_taken, next_position),
+            ]
+        if opcode is Opcode.CALL and conditional:
+            return [
+                (instruction.cycles, next_position),
+                (instruction.cycles_not_taken, next_position),
+            ]
+        return [(instruction.cycles, next_position)]
+
+    def cycles(self, start: int, end: int) -> Tuple[int, int]:
+        """
+        Returns the best and the worst T-states of straight-line paths
+        starting at `start` that end when they leave items up to `end`.
+        """
+        best = [0] * (end - start + 1)
+        worst = [0] * (end - start + 1)
+        for position in reversed(range(start, end)):
+            index = position - start
+            if not isinstance(self.items[position], Instruction):
+                best[index], worst[index] = best[index + 1], worst[index + 1]
+                continue
+            best_paths = []
+            worst_paths = []
+            for cycles, target in self.branches(position):
+                if target is None or not position < target <= end:
+                    best_paths.append(cycles)
+                    worst_paths.append(cycles)
+                else:
+                    best_paths.append(cycles + best[target - start])
+                    worst_paths.append(cycles + worst[target - start])
+            best[index] = min(best_paths)
+            worst[index] = max(worst_paths)
+        return best[0], worst[0]
+
+    def line_costs(self) -> List[LineCost]:
+        """
+        Returns costs of lines in the order of their first code. Code of a
+        line that is split in several parts, e.g. the prologue and the
+        epilogue, is added up.
+        """
+        costs: Dict[int, List[int]] = {}
+        markers = [
+            position
+            for position, item in enumerate(self.items)
+            if isinstance(item, SourceLine)
+        ]
+        for start, end in zip(markers, markers[1:] + [len(self.items)]):
+            size = code_size(self.items[start:end])
+            best, worst = self.cycles(start, end)
+            totals = costs.setdefault(self.items[start].line, [0, 0, 0])
+            totals[0] += size
+            totals[1] += best
+            totals[2] += worst
+        return [
+            LineCost(line, size, best, worst)
+            for line, (size, best, worst) in costs.items()
+        ]
+
+
+def estimate_costs(code: Sequence[Item]) -> CostReport:
+    functions = []
+    for items in split_functions(code)[1:]:
+        function = _FunctionCode(items)
+        best, worst = function.cycles(0, len(items))
+        functions.append(
+            FunctionCost(
+                items[0].name, code_size(items), best, worst, function.line_costs()
+            )
+        )
+    return CostReport(code_size(code), functions)
@@ -0,0 +1,271 @@
+"""
+Evaluation order of expressions. Every expression is evaluated into the `a`
+register. A binary operator evaluates one operand, parks its value in a
+temporary register, evaluates the other operand and combines the two.
+
+The operands are ordered with Sethi–Ullman numbering. Every expression is
+labelled with the number of temporary registers needed to evaluate it, and
+the operand that needs more is evaluated first, so that its temporaries are
+free again when the value of the other operand has to be kept. Literals and
+variables need no evaluation at all, because Z80 arithmetic instructions
+accept them directly (`add a, n`, `sub c`, `cp (ix + d)`).
+
+Temporaries are taken from a small register stack, `b`, `c`, `d` and `e`,
+leaving out registers that hold variables of the function. Calls clobber all
+registers, so an operand that calls a function is evaluated first. If both
+operands call functions, or the register stack is exhausted, the value of
+the first operand is spilled to a slot in the frame instead.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Collection, Dict, Tuple
+
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import AstVisitor, AstWalker
+from zx64c.codegen.z80 import Register
+
+EXPRESSION_REGISTERS = (Register.B, Register.C, Register.D, Register.E)
+
+BINARY_OPERATORS = (Equal, NotEqual, Addition, Subtraction)
+
+
+@dataclass(frozen=True)
+class RegisterNeed:
+    """
+    :param registers: temporary registers needed to evaluate an expression
+    :param calls: whether evaluating the expression calls a function
+    """
+
+    registers: int
+    calls: bool
+
+
+_OPERAND = RegisterNeed(0, False)
+
+_LITERALS = (Unsignedint, Bool)
+
+
+def is_operand(node: Ast) -> bool:
+    """
+    Checks whether the expression can be an operand of an arithmetic
+    instruction without being evaluated first.
+    """
+    return isinstance(node, (Identifier, Unsignedint, Bool))
+
+
+class RegisterNeedVisitor(AstVisitor[RegisterNeed]):
+    """
+    Labels expressions with their register need. Statements are not
+    evaluated into a register and need none. Labels are cached by the `id`
+    of the node, so a single visitor should only be used while the visited
+    tree does not change.
+    """
+
+    def __init__(self):
+        self._needs: Dict[int, RegisterNeed] = {}
+
+    def get_need(self, node: Ast) -> RegisterNeed:
+        need = self._needs.get(id(node))
+        if need is None:
+            need = node.visit(self)
+            self._needs[id(node)] = need
+        return need
+
+    def evaluation_order(self, node: Ast) -> Tuple[Ast, Ast]:
+        """
+        Returns operands of the binary operator in the order of evaluation.
+        If the second one is an operand (see `is_operand`), it is not
+        evaluated but used by the instruction that combines the two.
+
+        Operands are evaluated left to right, unless that would make the code
+        worse and cannot be observed: a literal or a variable is used
+        directly, literals in preference to variables, an operand that calls
+        functions goes first if the other one does not, and otherwise the
+        operand that needs more registers goes first.
+        """
+        lhs, rhs = node.lhs, node.rhs
+        if isinstance(rhs, _LITERALS):
+            return lhs, rhs
+        if isinstance(lhs, _LITERALS):
+            return rhs, lhs
+        if is_operand(rhs):
+            return lhs, rhs
+        if is_operand(lhs):
+            return rhs, lhs
+        lhs_need = self.get_need(lhs)
+        rhs_need = self.get_need(rhs)
+        if lhs_need.calls != rhs_need.calls:
+            return (lhs, rhs) if lhs_need.calls else (rhs, lhs)
+        if lhs_need.calls:
+            return lhs, rhs
+        if rhs_need.registers > lhs_need.registers or (
+            rhs_need.registers == lhs_need.registers
+            and isinstance(node, Subtraction)
+            # ^^^ with the rhs kept in a register the result is just `sub r`
+        ):
+            return rhs, lhs
+        return lhs, rhs
+
+    def is_spilled(self, node: Ast, free_registers: int) -> bool:
+        """
+        Checks whether the value of the first evaluated operand of the binary
+        operator is kept in the frame rather than in a register.
+        """
+        _, second = self.evaluation_order(node)
+        return free_registers == 0 or self.get_need(second).calls
+
+    def visit_program(self, node: Program) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_function(self, node: Function) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_block(self, node: Block) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_if(self, node: If) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_print(self, node: Print) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_let(self, node: Let) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_return(self, node: Return) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_assignment(self, node: Assignment) -> RegisterNeed:
+        return _OPERAND
+
+    def _visit_binary(self, node: Ast) -> RegisterNeed:
+        first, second = self.evaluation_order(node)
+        first_need = self.get_need(first)
+        if is_operand(second):
+            return first_need
+        second_need = self.get_need(second)
+        if second_need.calls:
+            # The first value is spilled to the frame, no register is kept
+            registers = max(first_need.registers, second_need.registers)
+        else:
+            registers = max(first_need.registers, second_need.registers + 1)
+        return RegisterNeed(registers, first_need.calls or second_need.calls)
+
+    def visit_equal(self, node: Equal) -> RegisterNeed:
+        return self._visit_binary(node)
+
+    def visit_not_equal(self, node: NotEqual) -> RegisterNeed:
+        return self._visit_binary(node)
+
+    def visit_addition(self, node: Addition) -> RegisterNeed:
+        return self._visit_binary(node)
+
+    def visit_subtraction(self, node: Subtraction) -> RegisterNeed:
+        return self._visit_binary(node)
+
+    def visit_negation(self, node: Negation) -> RegisterNeed:
+        return self.get_need(node.expression)
+
+    def visit_function_call(self, node: FunctionCall) -> RegisterNeed:
+        registers = 0
+        for argument in node.arguments:
+            registers = max(registers, self.get_need(argument).registers)
+        return RegisterNeed(registers, True)
+
+    def visit_identifier(self, node: Identifier) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_unsignedint(self, node: Unsignedint) -> RegisterNeed:
+        return _OPERAND
+
+    def visit_bool(self, node: Bool) -> RegisterNeed:
+        return _OPERAND
+
+
+def temporary_registers(in_use: Collection[Register]) -> Tuple[Register, ...]:
+    """
+    Returns the register stack for temporaries without registers that hold
+    variables.
+    """
+    return tuple(
+        register for register in EXPRESSION_REGISTERS if register not in in_use
+    )
+
+
+class SpillVisitor(AstWalker):
+    """
+    Computes the number of frame slots needed for spilled values of a
+    function with the given number of registers for temporaries.
+    """
+
+    def __init__(self, free_registers: int):
+        self._free_registers = free_registers
+        self._needs = RegisterNeedVisitor()
+        self.slots = 0
+
+    def _spills(self, node: Ast, free_registers: int) -> int:
+        if isinstance(node, BINARY_OPERATORS):
+            first, second = self._needs.evaluation_order(node)
+            spills = self._spills(first, free_registers)
+            if is_operand(second):
+                return spills
+            if self._needs.is_spilled(node, free_registers):
+                return max(spills, 1 + self._spills(second, free_registers))
+            return max(spills, self._spills(second, free_registers - 1))
+        if isinstance(node, Negation):
+            return self._spills(node.expression, free_registers)
+        if isinstance(node, FunctionCall):
+            return max(
+                (self._spills(argument, free_registers) for argument in node.arguments),
+                default=0,
+            )
+        return 0
+
+    def _expression(self, node: Ast) -> None:
+        # Statements visit whole expressions only, nested ones are handled
+        # by `_spills`
+        self.slots = max(self.slots, self._spills(node, self._free_registers))
+
+    def visit_equal(self, node: Equal) -> None:
+        self._expression(node)
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        self._expression(node)
+
+    def visit_addition(self, node: Addition) -> None:
+        self._expression(node)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        self._expression(node)
+
+    def visit_negation(self, node: Negation) -> None:
+        self._expression(node)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        self._expression(node)
+
+
+def count_spill_slots(function: Function, free_registers: int) -> int:
+    visitor = SpillVisitor(free_registers)
+    function.visit(visitor)
+    return visitor.slots
@@ -0,0 +1,202 @@
+"""
+Frame layout pass. Before code for a function is generated its body is walked
+once and every parameter and local variable is assigned a slot in the
+function's stack frame.
+
+Stack frame of a function looks as follows (offsets are relative to the
+frame pointer, which is kept in the `ix` register):
+
+    ------- +2n + 3
+    | $?? | = argument for the first parameter
+    ------- ...
+    | $?? | = argument for the last parameter
+    ------- +4
+    | $?? | = address where to return
+    ------- +2
+    | $?? | = frame pointer of the caller
+    ------- +0 <- frame pointer
+    | $?? | = first local variable
+    ------- -1
+    | $?? | = second local variable ...
+    -------
+    | $?? | = spill slots for values of expressions ...
+    -------
+
+Arguments are pushed by the caller with `push af`, so their slots are two
+bytes wide and the value occupies the upper byte, the one in which `push af`
+stores the `a` register. Local variables are packed into single byte slots,
+because the whole frame is reserved at once in the prologue.
+
+Leaf functions that keep all their local variables in registers and do not
+read or write their parameters never touch the frame, so they do not need
+one at all, see `is_frameless`.
+"""
+from __future__ import annotations
+
+from typing import Collection, Dict, Iterable, List, Set
+
+from zx64c.ast import (
+    Function,
+    If,
+    Let,
+    Return,
+    Assignment,
+    Identifier,
+    FunctionCall,
+)
+from zx64c.ast import AstWalker
+
+ARGUMENT_SLOT_SIZE = 2
+LOCAL_SLOT_SIZE = 1
+PARAMETERS_OFFSET = 4
+# ^^^ parameters are placed above the saved frame pointer and return address
+
+
+def argument_offset(index: int, count: int) -> int:
+    """
+    Returns offset of the argument for the parameter at the given index of a
+    function with `count` parameters.
+    """
+    return PARAMETERS_OFFSET + ARGUMENT_SLOT_SIZE * (count - 1 - index) + 1
+
+
+class FrameLayout:
+    """
+    Assignment of frame slots to the parameters and local variables
+    of a single function. Names are unique within a function, because the
+    language does not allow shadowing, so variables from sibling blocks that
+    share a name share a slot as well.
+    """
+
+    __slots__ = ("_offsets", "_parameters", "_frame_size", "_locals_size")
+
+    def __init__(
+        self, parameters: Iterable[str], variables: Iterable[str], spill_slots: int = 0
+    ):
+        parameters = list(parameters)
+        offsets: Dict[str, int] = {}
+        for index, name in enumerate(parameters):
+            offsets[name] = argument_offset(index, len(parameters))
+
+        frame_size = 0
+        for name in variables:
+            if name in offsets:
+                continue
+            frame_size += LOCAL_SLOT_SIZE
+            offsets[name] = -frame_size
+
+        self._offsets = offsets
+        self._parameters = frozenset(parameters)
+        self._locals_size = frame_size
+        self._frame_size = frame_size + LOCAL_SLOT_SIZE * spill_slots
+
+    @property
+    def frame_size(self) -> int:
+        """
+        Number of bytes that local variables take on the stack.
+        """
+        return self._frame_size
+
+    def is_parameter(self, name: str) -> bool:
+        return name in self._parameters
+
+    def get_offset(self, name: str) -> int:
+        """
+        Returns offset of the variable value with respect to the frame pointer.
+        """
+        return self._offsets[name]
+
+    def get_spill_offset(self, depth: int) -> int:
+        """
+        Returns offset of the slot for a value spilled at the given depth of
+        nested expressions.
+        """
+        offset = -self._locals_size - LOCAL_SLOT_SIZE * (depth + 1)
+        if offset < -self._frame_size:
+            raise IndexError(f"No spill slot at depth {depth}")
+        return offset
+
+
+class FrameLayoutVisitor(AstWalker):
+    """
+    Collects parameters and local variables of the visited function.
+    """
+
+    def __init__(self, in_registers: Collection[str] = (), spill_slots: int = 0):
+        """
+        :param in_registers: local variables kept in registers, these do not
+                             get a slot in the frame
+        :param spill_slots: number of slots for spilled values of expressions
+        """
+        self._in_registers = in_registers
+        self._spill_slots = spill_slots
+        self._parameters: List[str] = []
+        self._variables: List[str] = []
+
+    def make_layout(self) -> FrameLayout:
+        return FrameLayout(self._parameters, self._variables, self._spill_slots)
+
+    def visit_function(self, node: Function) -> None:
+        self._parameters.extend(parameter.name for parameter in node.parameters)
+        node.code_block.visit(self)
+
+    def visit_if(self, node: If) -> None:
+        node.consequence.visit(self)
+
+    def visit_let(self, node: Let) -> None:
+        if node.name not in self._in_registers:
+            self._variables.append(node.name)
+
+
+def build_frame_layout(
+    function: Function, in_registers: Collection[str] = (), spill_slots: int = 0
+) -> FrameLayout:
+    visitor = FrameLayoutVisitor(in_registers, spill_slots)
+    function.visit(visitor)
+    return visitor.make_layout()
+
+
+class FrameUsageVisitor(AstWalker):
+    """
+    Collects variables that a function reads or writes, the number of its
+    `return` statements and whether it calls other functions.
+    """
+
+    def __init__(self):
+        self.variables: Set[str] = set()
+        self.returns = 0
+        self.calls = False
+
+    def visit_let(self, node: Let) -> None:
+        self.variables.add(node.name)
+        super().visit_let(node)
+
+    def visit_return(self, node: Return) -> None:
+        self.returns += 1
+        super().visit_return(node)
+
+    def visit_assignment(self, node: Assignment) -> None:
+        self.variables.add(node.name)
+        super().visit_assignment(node)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        self.calls = True
+        super().visit_function_call(node)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self.variables.add(node.value)
+
+
+def is_frameless(function: Function, layout: FrameLayout) -> bool:
+    """
+    Checks whether the function is a leaf that does not need a frame: it has
+    no local variables in the frame, does not access its parameters and does
+    not call other functions.
+    """
+    if layout.frame_size > 0:
+        return False
+    usage = FrameUsageVisitor()
+    function.visit(usage)
+    return not usage.calls and not any(
+        layout.is_parameter(name) for name in usage.variables
+    )
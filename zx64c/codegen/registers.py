@@ -0,0 +1,282 @@
+"""
+Register allocation pass. Local variables of a function that are accessed
+often enough are kept in 8-bit registers instead of in the stack frame.
+
+The language has no loops, so statements execute in the order in which they
+appear in the source. The pass numbers every read and write of a variable
+and every call or print in that order, which gives a live interval for each
+variable. Intervals are then assigned to registers with the linear scan
+algorithm. Calls and prints (`rst $10`) clobber the registers, so variables
+that are live across them are saved on the stack around those instructions.
+Whether a variable is worth a register is decided by weighing the memory
+accesses it saves against the cost of saving it.
+"""
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from zx64c.ast import (
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import Ast, AstVisitor
+from zx64c.codegen.expressions import RegisterNeedVisitor
+from zx64c.codegen.z80 import Register
+
+ALLOCATABLE_REGISTERS = (Register.H, Register.L, Register.E, Register.D, Register.C)
+# ^^^ `b` is always kept for temporaries of expressions, and `c`, `d` and `e`
+#     are used last, so that they stay free for temporaries as well
+
+ACCESS_SAVING = 15
+# ^^^ T-states saved by `ld a, r` or `ld r, a` over `ld a, (ix + d)` or
+#     `ld (ix + d), a`
+SAVE_COST = 21
+# ^^^ T-states of `push rr` and `pop rr` around a call or a print
+
+_PAIRS = {
+    Register.B: Register.BC,
+    Register.C: Register.BC,
+    Register.D: Register.DE,
+    Register.E: Register.DE,
+    Register.H: Register.HL,
+    Register.L: Register.HL,
+}
+
+
+class LiveInterval:
+    """
+    Points of the first and the last access of a local variable together with
+    the number of its accesses.
+    """
+
+    __slots__ = ("name", "start", "end", "accesses")
+
+    def __init__(self, name: str, start: int):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.accesses = 0
+
+    def access(self, point: int) -> None:
+        self.end = point
+        self.accesses += 1
+
+    def is_live_across(self, point: int) -> bool:
+        return self.start < point < self.end
+
+    def __repr__(self) -> str:
+        return f"LiveInterval({self.name}, {self.start}, {self.end}, {self.accesses})"
+
+
+class LivenessVisitor(AstVisitor[None]):
+    """
+    Computes live intervals of local variables of a function and points at
+    which registers are clobbered. Clobber sites (calls and prints) are
+    identified by the order in which the code generator starts to generate
+    them.
+    """
+
+    def __init__(self):
+        self._point = 0
+        self._locals: Dict[str, LiveInterval] = {}
+        self._clobbers: List[int] = []
+        self._needs = RegisterNeedVisitor()
+
+    @property
+    def intervals(self) -> List[LiveInterval]:
+        return list(self._locals.values())
+
+    @property
+    def clobbers(self) -> List[int]:
+        """
+        Point of every clobber site, indexed by the site.
+        """
+        return self._clobbers
+
+    def _next_point(self) -> int:
+        self._point += 1
+        return self._point
+
+    def _start_clobber(self) -> int:
+        self._clobbers.append(-1)
+        return len(self._clobbers) - 1
+
+    def _end_clobber(self, site: int) -> None:
+        self._clobbers[site] = self._next_point()
+
+    def _access(self, name: str) -> None:
+        interval = self._locals.get(name)
+        if interval is not None:
+            interval.access(self._next_point())
+
+    def visit_program(self, node: Program) -> None:
+        raise RuntimeError("Registers are allocated for each function")
+
+    def visit_function(self, node: Function) -> None:
+        node.code_block.visit(self)
+
+    def visit_block(self, node: Block) -> None:
+        for statement in node.statements:
+            statement.visit(self)
+
+    def visit_if(self, node: If) -> None:
+        node.condition.visit(self)
+        node.consequence.visit(self)
+
+    def visit_print(self, node: Print) -> None:
+        site = self._start_clobber()
+        node.expression.visit(self)
+        self._end_clobber(site)
+
+    def visit_let(self, node: Let) -> None:
+        node.rhs.visit(self)
+        if node.name not in self._locals:
+            self._locals[node.name] = LiveInterval(node.name, self._point + 1)
+        self._access(node.name)
+
+    def visit_return(self, node: Return) -> None:
+        node.expr.visit(self)
+
+    def visit_assignment(self, node: Assignment) -> None:
+        node.rhs.visit(self)
+        self._access(node.name)
+
+    def _visit_binary(self, node: Ast) -> None:
+        # Operands are visited in the order in which they are evaluated
+        for operand in self._needs.evaluation_order(node):
+            operand.visit(self)
+
+    def visit_equal(self, node: Equal) -> None:
+        self._visit_binary(node)
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        self._visit_binary(node)
+
+    def visit_addition(self, node: Addition) -> None:
+        self._visit_binary(node)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        self._visit_binary(node)
+
+    def visit_negation(self, node: Negation) -> None:
+        node.expression.visit(self)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        site = self._start_clobber()
+        for argument in node.arguments:
+            argument.visit(self)
+        self._end_clobber(site)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self._access(node.value)
+
+    def visit_unsignedint(self, node: Unsignedint) -> None:
+        pass
+
+    def visit_bool(self, node: Bool) -> None:
+        pass
+
+
+class RegisterAllocation:
+    """
+    Registers assigned to local variables of a function and register pairs
+    that have to be saved around each clobber site.
+    """
+
+    __slots__ = ("_registers", "_saved")
+
+    def __init__(
+        self,
+        registers: Dict[str, Register],
+        saved: Iterable[Tuple[Register, ...]] = (),
+    ):
+        self._registers = registers
+        self._saved = list(saved)
+
+    @property
+    def variables(self) -> FrozenSet[str]:
+        return frozenset(self._registers)
+
+    @property
+    def registers(self) -> FrozenSet[Register]:
+        """
+        Registers that hold any of the variables.
+        """
+        return frozenset(self._registers.values())
+
+    def get_register(self, name: str) -> Optional[Register]:
+        return self._registers.get(name)
+
+    def get_saved(self, site: int) -> Tuple[Register, ...]:
+        """
+        Returns register pairs to save around the given clobber site.
+        """
+        if site >= len(self._saved):
+            return ()
+        return self._saved[site]
+
+
+def _weight(interval: LiveInterval, clobbers: List[int]) -> int:
+    saves = sum(interval.is_live_across(point) for point in clobbers)
+    return ACCESS_SAVING * interval.accesses - SAVE_COST * saves
+
+
+def allocate_registers(
+    function: Function, registers: Tuple[Register, ...] = ALLOCATABLE_REGISTERS
+) -> RegisterAllocation:
+    liveness = LivenessVisitor()
+    function.visit(liveness)
+    clobbers = liveness.clobbers
+
+    weights = {
+        interval.name: _weight(interval, clobbers) for interval in liveness.intervals
+    }
+    candidates = sorted(
+        (interval for interval in liveness.intervals if weights[interval.name] > 0),
+        key=lambda interval: interval.start,
+    )
+
+    assigned: Dict[str, Register] = {}
+    active: List[LiveInterval] = []
+    free = list(registers)
+    for interval in candidates:
+        for expired in [other for other in active if other.end < interval.start]:
+            active.remove(expired)
+            free.append(assigned[expired.name])
+        if free:
+            assigned[interval.name] = free.pop(0)
+            active.append(interval)
+            continue
+        spilled = min(active, key=lambda other: weights[other.name])
+        if weights[spilled.name] < weights[interval.name]:
+            assigned[interval.name] = assigned.pop(spilled.name)
+            active.remove(spilled)
+            active.append(interval)
+
+    in_registers = [
+        interval for interval in liveness.intervals if interval.name in assigned
+    ]
+    saved = []
+    for point in clobbers:
+        pairs = {
+            _PAIRS[assigned[interval.name]]
+            for interval in in_registers
+            if interval.is_live_across(point)
+        }
+        saved.append(tuple(sorted(pairs, key=lambda pair: pair.value)))
+    return RegisterAllocation(assigned, saved)
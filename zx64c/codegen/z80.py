@@ -0,0 +1,643 @@
+"""
+In-memory representation of the Z80 assembly produced by the code generator.
+
+Code is a flat list of items. An item is either an `Instruction`, a `Label`,
+a `Directive` or a `Comment`. Instructions are built out of an `Opcode` and
+typed operands, which makes it possible to analyse and rewrite the generated
+code before it is rendered to text with `render`. Every instruction knows its
+encoded size in bytes and the number of T-states it takes to execute.
+
+"""
+
+from __future__ import annotations
+
+import enum
+import itertools
+
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+INDENTATION = "    "
+
+
+@enum.unique
+class Register(enum.Enum):
+    A = "a"
+    B = "b"
+    C = "c"
+    D = "d"
+    E = "e"
+    H = "h"
+    L = "l"
+    AF = "af"
+    BC = "bc"
+    DE = "de"
+    HL = "hl"
+    SP = "sp"
+    IX = "ix"
+    IY = "iy"
+
+    def __str__(self):
+        return self.value
+
+    @property
+    def is_8bit(self) -> bool:
+        return len(self.value) == 1
+
+
+@enum.unique
+class Condition(enum.Enum):
+    NZ = "nz"
+    Z = "z"
+    NC = "nc"
+    C = "c"
+    PO = "po"
+    PE = "pe"
+    P = "p"
+    M = "m"
+
+    def __str__(self):
+        return self.value
+
+
+@enum.unique
+class Opcode(enum.Enum):
+    LD = "ld"
+    PUSH = "push"
+    POP = "pop"
+    EX = "ex"
+    ADD = "add"
+    ADC = "adc"
+    SUB = "sub"
+    SBC = "sbc"
+    AND = "and"
+    OR = "or"
+    XOR = "xor"
+    CP = "cp"
+    INC = "inc"
+    DEC = "dec"
+    NEG = "neg"
+    CPL = "cpl"
+    JP = "jp"
+    JR = "jr"
+    DJNZ = "djnz"
+    CALL = "call"
+    RET = "ret"
+    RST = "rst"
+    NOP = "nop"
+    HALT = "halt"
+
+    def __str__(self):
+        return self.value
+
+
+@dataclass(frozen=True)
+class Immediate:
+    value: int
+
+    def __str__(self):
+        if self.value < 0:
+            return f"-{Immediate(-self.value)}"
+        if self.value > 0xFF:
+            return f"${self.value:04X}"
+        return f"${self.value:02X}"
+
+
+@dataclass(frozen=True)
+class LabelRef:
+    """
+    Reference to a label, used as a jump/call target or as an immediate
+    address operand.
+    """
+
+    name: str
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass(frozen=True)
+class Address:
+    """
+    Memory operand addressed directly, e.g. `($8000)`.
+    """
+
+    target: Union[int, str]
+
+    def __str__(self):
+        if isinstance(self.target, int):
+            return f"({Immediate(self.target)})"
+        return f"({self.target})"
+
+
+@dataclass(frozen=True)
+class Indirect:
+    """
+    Memory operand addressed by a 16-bit register, e.g. `(hl)`.
+    """
+
+    register: Register
+
+    def __str__(self):
+        return f"({self.register})"
+
+
+@dataclass(frozen=True)
+class Indexed:
+    """
+    Memory operand addressed by an index register and a displacement,
+    e.g. `(ix + 5)`.
+    """
+
+    register: Register
+    offset: int
+
+    @property
+    def fits_displacement(self) -> bool:
+        """
+        Whether the offset fits into the signed byte displacement of the
+        instruction.
+        """
+        return -128 <= self.offset <= 127
+
+    def __str__(self):
+        sign = "-" if self.offset < 0 else "+"
+        return f"({self.register} {sign} {abs(self.offset)})"
+
+
+Operand = Union[Register, Condition, Immediate, LabelRef, Address, Indirect, Indexed]
+
+
+@dataclass(frozen=True)
+class Timing:
+    size: int
+    cycles: int
+    cycles_not_taken: Optional[int] = None
+    # ^^^ only for conditional control flow, the number of T-states spent when
+    #     the condition does not hold
+
+
+class Instruction:
+    __slots__ = ("opcode", "operands")
+
+    def __init__(self, opcode: Opcode, *operands: Operand):
+        self.opcode = opcode
+        self.operands = operands
+
+    def __eq__(self, rhs: object) -> bool:
+        return (
+            isinstance(rhs, Instruction)
+            and self.opcode is rhs.opcode
+            and self.operands == rhs.operands
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.opcode, self.operands))
+
+    def __repr__(self) -> str:
+        return f"Instruction({self})"
+
+    def __str__(self) -> str:
+        if not self.operands:
+            return str(self.opcode)
+        operands = ", ".join(str(operand) for operand in self.operands)
+        return f"{self.opcode} {operands}"
+
+    def __getstate__(self):
+        return (self.opcode, self.operands)
+
+    def __setstate__(self, state):
+        self.opcode, self.operands = state
+
+    @property
+    def timing(self) -> Timing:
+        return lookup_timing(self)
+
+    @property
+    def reads(self) -> FrozenSet[Location]:
+        return instruction_effects(self)[0]
+
+    @property
+    def writes(self) -> FrozenSet[Location]:
+        return instruction_effects(self)[1]
+
+    @property
+    def size(self) -> int:
+        return self.timing.size
+
+    @property
+    def cycles(self) -> int:
+        """
+        T-states spent executing the instruction. For conditional control flow
+        this is the count for the taken branch.
+        """
+        return self.timing.cycles
+
+    @property
+    def cycles_not_taken(self) -> int:
+        timing = self.timing
+        if timing.cycles_not_taken is None:
+            return timing.cycles
+        return timing.cycles_not_taken
+
+
+@dataclass(frozen=True)
+class Label:
+    name: str
+
+
+@dataclass(frozen=True)
+class Directive:
+    """
+    Assembler directive such as `org $8000` or `dw 0`. Only `dw` and `db`
+    occupy space in the resulting binary.
+    """
+
+    name: str
+    arguments: Tuple[str, ...] = ()
+
+    @property
+    def size(self) -> int:
+        if self.name == "dw":
+            return 2 * len(self.arguments)
+        if self.name == "db":
+            return len(self.arguments)
+        return 0
+
+
+@dataclass(frozen=True)
+class Comment:
+    text: str
+
+
+@dataclass(frozen=True)
+class SourceLine(Comment):
+    """
+    Marks the start of code generated for the given line of the source. It is
+    a comment, so optimizations of the code leave it where it is.
+    """
+
+    line: int = 0
+
+
+Item = Union[Instruction, Label, Directive, Comment]
+
+
+class TimingLookupError(Exception):
+    def __init__(self, instruction: Instruction):
+        super().__init__(f"`{instruction}` is not a valid Z80 instruction")
+        self.instruction = instruction
+
+
+def _operand_kinds(operand: Operand) -> Tuple[str, ...]:
+    """
+    Returns kinds of the operand ordered from the most specific to the most
+    general one. These are used as keys in the timing table.
+    """
+    if isinstance(operand, Register):
+        if operand is Register.A:
+            return ("A", "r")
+        if operand.is_8bit:
+            return ("r",)
+        if operand in (Register.AF, Register.IX, Register.IY):
+            return (operand.name,)
+        return (operand.name, "rr")
+    if isinstance(operand, Condition):
+        if operand in (Condition.NZ, Condition.Z, Condition.NC, Condition.C):
+            return ("jr_cc", "cc")
+        return ("cc",)
+    if isinstance(operand, (Immediate, LabelRef)):
+        return ("n",)
+    if isinstance(operand, Address):
+        return ("(nn)",)
+    if isinstance(operand, Indirect):
+        if operand.register is Register.HL:
+            return ("(HL)",)
+        if operand.register is Register.SP:
+            return ("(SP)",)
+        return ("(rr)",)
+    if isinstance(operand, Indexed):
+        return ("(ix+d)",)
+    raise TypeError(f"Unsupported operand {operand!r}")
+
+
+_ALU = {
+    ("r",): Timing(1, 4),
+    ("n",): Timing(2, 7),
+    ("(HL)",): Timing(1, 7),
+    ("(ix+d)",): Timing(3, 19),
+}
+
+TIMINGS: Dict[Tuple[Opcode, Tuple[str, ...]], Timing] = {
+    # 8-bit loads
+    (Opcode.LD, ("r", "r")): Timing(1, 4),
+    (Opcode.LD, ("r", "n")): Timing(2, 7),
+    (Opcode.LD, ("r", "(HL)")): Timing(1, 7),
+    (Opcode.LD, ("(HL)", "r")): Timing(1, 7),
+    (Opcode.LD, ("(HL)", "n")): Timing(2, 10),
+    (Opcode.LD, ("r", "(ix+d)")): Timing(3, 19),
+    (Opcode.LD, ("(ix+d)", "r")): Timing(3, 19),
+    (Opcode.LD, ("(ix+d)", "n")): Timing(4, 19),
+    (Opcode.LD, ("A", "(rr)")): Timing(1, 7),
+    (Opcode.LD, ("(rr)", "A")): Timing(1, 7),
+    (Opcode.LD, ("A", "(nn)")): Timing(3, 13),
+    (Opcode.LD, ("(nn)", "A")): Timing(3, 13),
+    # 16-bit loads
+    (Opcode.LD, ("rr", "n")): Timing(3, 10),
+    (Opcode.LD, ("IX", "n")): Timing(4, 14),
+    (Opcode.LD, ("IY", "n")): Timing(4, 14),
+    (Opcode.LD, ("HL", "(nn)")): Timing(3, 16),
+    (Opcode.LD, ("(nn)", "HL")): Timing(3, 16),
+    (Opcode.LD, ("rr", "(nn)")): Timing(4, 20),
+    (Opcode.LD, ("(nn)", "rr")): Timing(4, 20),
+    (Opcode.LD, ("IX", "(nn)")): Timing(4, 20),
+    (Opcode.LD, ("(nn)", "IX")): Timing(4, 20),
+    (Opcode.LD, ("SP", "HL")): Timing(1, 6),
+    (Opcode.LD, ("SP", "IX")): Timing(2, 10),
+    # stack
+    (Opcode.PUSH, ("rr",)): Timing(1, 11),
+    (Opcode.PUSH, ("AF",)): Timing(1, 11),
+    (Opcode.PUSH, ("IX",)): Timing(2, 15),
+    (Opcode.POP, ("rr",)): Timing(1, 10),
+    (Opcode.POP, ("AF",)): Timing(1, 10),
+    (Opcode.POP, ("IX",)): Timing(2, 14),
+    (Opcode.EX, ("DE", "HL")): Timing(1, 4),
+    (Opcode.EX, ("(SP)", "HL")): Timing(1, 19),
+    (Opcode.EX, ("(SP)", "IX")): Timing(2, 23),
+    # arithmetic and logic
+    **{(Opcode.ADD, ("A",) + kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.ADC, ("A",) + kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.SBC, ("A",) + kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.SUB, kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.AND, kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.OR, kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.XOR, kinds): timing for kinds, timing in _ALU.items()},
+    **{(Opcode.CP, kinds): timing for kinds, timing in _ALU.items()},
+    (Opcode.ADD, ("HL", "rr")): Timing(1, 11),
+    (Opcode.ADD, ("IX", "rr")): Timing(2, 15),
+    (Opcode.ADD, ("IX", "IX")): Timing(2, 15),
+    (Opcode.ADC, ("HL", "rr")): Timing(2, 15),
+    (Opcode.SBC, ("HL", "rr")): Timing(2, 15),
+    (Opcode.INC, ("r",)): Timing(1, 4),
+    (Opcode.INC, ("rr",)): Timing(1, 6),
+    (Opcode.INC, ("IX",)): Timing(2, 10),
+    (Opcode.INC, ("(HL)",)): Timing(1, 11),
+    (Opcode.INC, ("(ix+d)",)): Timing(3, 23),
+    (Opcode.DEC, ("r",)): Timing(1, 4),
+    (Opcode.DEC, ("rr",)): Timing(1, 6),
+    (Opcode.DEC, ("IX",)): Timing(2, 10),
+    (Opcode.DEC, ("(HL)",)): Timing(1, 11),
+    (Opcode.DEC, ("(ix+d)",)): Timing(3, 23),
+    (Opcode.NEG, ()): Timing(2, 8),
+    (Opcode.CPL, ()): Timing(1, 4),
+    # control flow
+    (Opcode.JP, ("n",)): Timing(3, 10),
+    (Opcode.JP, ("cc", "n")): Timing(3, 10, 10),
+    (Opcode.JP, ("(HL)",)): Timing(1, 4),
+    (Opcode.JR, ("n",)): Timing(2, 12),
+    (Opcode.JR, ("jr_cc", "n")): Timing(2, 12, 7),
+    (Opcode.DJNZ, ("n",)): Timing(2, 13, 8),
+    (Opcode.CALL, ("n",)): Timing(3, 17),
+    (Opcode.CALL, ("cc", "n")): Timing(3, 17, 10),
+    (Opcode.RET, ()): Timing(1, 10),
+    (Opcode.RET, ("cc",)): Timing(1, 11, 5),
+    (Opcode.RST, ("n",)): Timing(1, 11),
+    (Opcode.NOP, ()): Timing(1, 4),
+    (Opcode.HALT, ()): Timing(1, 4),
+}
+
+
+def lookup_timing(instruction: Instruction) -> Timing:
+    kinds = [_operand_kinds(operand) for operand in instruction.operands]
+    for key in itertools.product(*kinds):
+        try:
+            return TIMINGS[(instruction.opcode, key)]
+        except KeyError:
+            continue
+    raise TimingLookupError(instruction)
+
+
+@enum.unique
+class Location(enum.Enum):
+    """
+    Storage that instructions read and write. Register pairs are split into
+    their halves and the flags are grouped by how the generated code uses them.
+    """
+
+    A = enum.auto()
+    B = enum.auto()
+    C = enum.auto()
+    D = enum.auto()
+    E = enum.auto()
+    H = enum.auto()
+    L = enum.auto()
+    IX = enum.auto()
+    IY = enum.auto()
+    SP = enum.auto()
+    ZERO_FLAG = enum.auto()
+    CARRY_FLAG = enum.auto()
+    OTHER_FLAGS = enum.auto()
+    MEMORY = enum.auto()
+
+
+FLAGS = frozenset([Location.ZERO_FLAG, Location.CARRY_FLAG, Location.OTHER_FLAGS])
+GENERAL_PURPOSE = frozenset(
+    [
+        Location.A,
+        Location.B,
+        Location.C,
+        Location.D,
+        Location.E,
+        Location.H,
+        Location.L,
+    ]
+)
+
+_REGISTER_LOCATIONS = {
+    Register.A: frozenset([Location.A]),
+    Register.B: frozenset([Location.B]),
+    Register.C: frozenset([Location.C]),
+    Register.D: frozenset([Location.D]),
+    Register.E: frozenset([Location.E]),
+    Register.H: frozenset([Location.H]),
+    Register.L: frozenset([Location.L]),
+    Register.AF: frozenset([Location.A]) | FLAGS,
+    Register.BC: frozenset([Location.B, Location.C]),
+    Register.DE: frozenset([Location.D, Location.E]),
+    Register.HL: frozenset([Location.H, Location.L]),
+    Register.SP: frozenset([Location.SP]),
+    Register.IX: frozenset([Location.IX]),
+    Register.IY: frozenset([Location.IY]),
+}
+
+_CONDITION_FLAGS = {
+    Condition.NZ: frozenset([Location.ZERO_FLAG]),
+    Condition.Z: frozenset([Location.ZERO_FLAG]),
+    Condition.NC: frozenset([Location.CARRY_FLAG]),
+    Condition.C: frozenset([Location.CARRY_FLAG]),
+    Condition.PO: frozenset([Location.OTHER_FLAGS]),
+    Condition.PE: frozenset([Location.OTHER_FLAGS]),
+    Condition.P: frozenset([Location.OTHER_FLAGS]),
+    Condition.M: frozenset([Location.OTHER_FLAGS]),
+}
+
+_NOTHING: FrozenSet[Location] = frozenset()
+_EVERYTHING = frozenset(Location)
+_MEMORY = frozenset([Location.MEMORY])
+
+RETURN_LIVE_OUT = frozenset([Location.A, Location.IX, Location.SP, Location.MEMORY])
+# ^^^ locations the caller may still use after a function returns
+
+
+def _value_reads(operand: Operand) -> FrozenSet[Location]:
+    """
+    Locations read when the operand is used as a source of a value.
+    """
+    if isinstance(operand, Register):
+        return _REGISTER_LOCATIONS[operand]
+    return _address_reads(operand) | (
+        _MEMORY if isinstance(operand, (Address, Indirect, Indexed)) else _NOTHING
+    )
+
+
+def _address_reads(operand: Operand) -> FrozenSet[Location]:
+    """
+    Locations read to compute the address of a memory operand.
+    """
+    if isinstance(operand, (Indirect, Indexed)):
+        return _REGISTER_LOCATIONS[operand.register]
+    return _NOTHING
+
+
+def _destination_writes(operand: Operand) -> FrozenSet[Location]:
+    if isinstance(operand, Register):
+        return _REGISTER_LOCATIONS[operand]
+    return _MEMORY
+
+
+_ARITHMETIC_FLAGS = FLAGS
+_INC_DEC_FLAGS = frozenset([Location.ZERO_FLAG, Location.OTHER_FLAGS])
+_ADD16_FLAGS = frozenset([Location.CARRY_FLAG, Location.OTHER_FLAGS])
+
+
+def instruction_effects(
+    instruction: Instruction,
+) -> Tuple[FrozenSet[Location], FrozenSet[Location]]:
+    """
+    Returns locations that the instruction reads and writes. Calls follow the
+    calling convention of the compiler: arguments are passed on the stack,
+    the result is returned in `a` and all registers except `sp` and `ix` (the
+    frame pointer) are clobbered by the callee.
+    """
+    opcode = instruction.opcode
+    operands = instruction.operands
+    sp = _REGISTER_LOCATIONS[Register.SP]
+
+    if opcode is Opcode.LD:
+        dst, src = operands
+        return _value_reads(src) | _address_reads(dst), _destination_writes(dst)
+    if opcode is Opcode.PUSH:
+        return _REGISTER_LOCATIONS[operands[0]] | sp, sp | _MEMORY
+    if opcode is Opcode.POP:
+        return sp | _MEMORY, _REGISTER_LOCATIONS[operands[0]] | sp
+    if opcode is Opcode.EX:
+        lhs, rhs = operands
+        locations = _value_reads(lhs) | _value_reads(rhs)
+        return locations, locations - sp
+    if opcode in (Opcode.ADD, Opcode.ADC, Opcode.SBC):
+        dst, src = operands
+        reads = _value_reads(dst) | _value_reads(src)
+        if opcode is not Opcode.ADD:
+            reads |= frozenset([Location.CARRY_FLAG])
+        if dst is Register.A or opcode is not Opcode.ADD:
+            return reads, _REGISTER_LOCATIONS[dst] | _ARITHMETIC_FLAGS
+        return reads, _REGISTER_LOCATIONS[dst] | _ADD16_FLAGS
+    if opcode in (Opcode.SUB, Opcode.AND, Opcode.OR, Opcode.XOR):
+        reads = _REGISTER_LOCATIONS[Register.A] | _value_reads(operands[0])
+        return reads, _REGISTER_LOCATIONS[Register.A] | _ARITHMETIC_FLAGS
+    if opcode is Opcode.CP:
+        reads = _REGISTER_LOCATIONS[Register.A] | _value_reads(operands[0])
+        return reads, _ARITHMETIC_FLAGS
+    if opcode in (Opcode.INC, Opcode.DEC):
+        operand = operands[0]
+        if isinstance(operand, Register) and not operand.is_8bit:
+            return _REGISTER_LOCATIONS[operand], _REGISTER_LOCATIONS[operand]
+        return _value_reads(operand), _destination_writes(operand) | _INC_DEC_FLAGS
+    if opcode is Opcode.NEG:
+        return _REGISTER_LOCATIONS[Register.A], (
+            _REGISTER_LOCATIONS[Register.A] | _ARITHMETIC_FLAGS
+        )
+    if opcode is Opcode.CPL:
+        return _REGISTER_LOCATIONS[Register.A], (
+            _REGISTER_LOCATIONS[Register.A] | frozenset([Location.OTHER_FLAGS])
+        )
+    if opcode in (Opcode.JP, Opcode.JR):
+        if len(operands) == 2:
+            return _CONDITION_FLAGS[operands[0]], _NOTHING
+        return _address_reads(operands[0]), _NOTHING
+    if opcode is Opcode.DJNZ:
+        b = _REGISTER_LOCATIONS[Register.B]
+        return b, b
+    if opcode is Opcode.CALL:
+        reads = sp | _MEMORY
+        if len(operands) == 2:
+            reads |= _CONDITION_FLAGS[operands[0]]
+        return reads, _EVERYTHING - sp - _REGISTER_LOCATIONS[Register.IX]
+    if opcode is Opcode.RET:
+        reads = RETURN_LIVE_OUT
+        if operands:
+            reads |= _CONDITION_FLAGS[operands[0]]
+        return reads, sp
+    if opcode is Opcode.RST:
+        # The ROM print routine reads `a` and does not preserve other registers
+        return _REGISTER_LOCATIONS[Register.A], (GENERAL_PURPOSE | FLAGS | _MEMORY)
+    return _NOTHING, _NOTHING
+
+
+def code_size(code: Iterable[Item]) -> int:
+    size = 0
+    for item in code:
+        if isinstance(item, (Instruction, Directive)):
+            size += item.size
+    return size
+
+
+def split_functions(code: Iterable[Item]) -> List[List[Item]]:
+    """
+    Splits the code at global labels, so that every part but the first one
+    holds a single function. The first part holds the items before the first
+    function.
+    """
+    functions: List[List[Item]] = [[]]
+    for item in code:
+        if isinstance(item, Label) and not item.name.startswith("."):
+            functions.append([])
+        functions[-1].append(item)
+    return functions
+
+
+def render_item(item: Item) -> str:
+    if isinstance(item, Instruction):
+        return f"{INDENTATION}{item}"
+    if isinstance(item, Label):
+        return f"{item.name}:"
+    if isinstance(item, Directive):
+        if not item.arguments:
+            return f"{INDENTATION}{item.name}"
+        return f"{INDENTATION}{item.name} {', '.join(item.arguments)}"
+    if isinstance(item, Comment):
+        return f"{INDENTATION}; {item.text}"
+    raise TypeError(f"Cannot render {item!r}")
+
+
+def render(code: Iterable[Item]) -> str:
+    """
+    Renders the code as sjasmplus assembly source. Global labels are separated
+    from the preceding code by an empty line.
+    """
+    lines: List[str] = []
+    for item in code:
+        if lines and isinstance(item, Label) and not item.name.startswith("."):
+            lines.append("")
+        lines.append(render_item(item))
+    return "\n".join(lines)
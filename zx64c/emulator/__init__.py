@@ -0,0 +1,734 @@
+"""
+Cycle counting Z80 emulator for executing code produced by the compiler.
+
+The generated code is first assembled into machine code with `assemble` and
+then executed by `Z80`, which decodes instructions with tables built at import
+time. Only the subset of the instruction set that the compiler can emit is
+implemented. The ZX Spectrum ROM is not emulated, `rst $10` is stubbed so that
+it appends the character in `a` to the output and then scrambles the registers
+the ROM routine does not preserve.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from zx64c.codegen.z80 import Item
+from zx64c.emulator.assembler import assemble
+
+STACK_TOP = 0x0000
+# ^^^ the first push wraps around and stores at $FFFE
+RETURN_SENTINEL = 0x0000
+# ^^^ `main` returns here, the emulator stops when it reaches this address
+MAX_CYCLES = 100_000_000
+
+_B, _D, _H, _HL_INDIRECT, _A = 0, 2, 4, 6, 7
+
+
+class EmulationError(Exception):
+    pass
+
+
+# Flag bits
+S = 0x80
+Z = 0x40
+H = 0x10
+PV = 0x04
+N = 0x02
+C = 0x01
+
+
+def _parity(value: int) -> bool:
+    return bin(value).count("1") % 2 == 0
+
+
+def _sz(value: int) -> int:
+    return (value & S) | (Z if value == 0 else 0)
+
+
+@dataclass
+class ExecutionResult:
+    """
+    :param stack_usage: the largest number of bytes the stack grew by
+    """
+
+    output: str
+    cycles: int
+    instructions: int
+    stack_usage: int
+
+
+class Z80:
+    """
+    Interpreter for a subset of the Z80 instruction set. Each opcode is
+    dispatched through a 256 entry table (plus tables for the DD and ED
+    prefixes) to a handler that executes the instruction and returns the
+    number of T-states it took.
+    """
+
+    def __init__(self, memory: bytearray):
+        self.memory = memory
+        self.registers = bytearray(8)
+        # ^^^ 8-bit registers indexed by their encoding: b, c, d, e, h, l and a
+        #     at 7, the index 6 stands for (hl) in instructions and is unused
+        self.f = 0
+        self.ix = self.iy = 0
+        self.sp = STACK_TOP
+        self.pc = 0
+        self.output: List[str] = []
+        self.cycles = 0
+        self.instructions = 0
+        self.lowest_sp = 0x10000
+
+    def get_r(self, r: int) -> int:
+        if r == _HL_INDIRECT:
+            return self.memory[self.hl]
+        return self.registers[r]
+
+    def set_r(self, r: int, value: int) -> None:
+        if r == _HL_INDIRECT:
+            self.memory[self.hl] = value & 0xFF
+        else:
+            self.registers[r] = value & 0xFF
+
+    @property
+    def a(self) -> int:
+        return self.registers[_A]
+
+    @a.setter
+    def a(self, value: int) -> None:
+        self.registers[_A] = value
+
+    def _pair(self, high: int) -> int:
+        return self.registers[high] << 8 | self.registers[high + 1]
+
+    def _set_pair(self, high: int, value: int) -> None:
+        self.registers[high] = (value >> 8) & 0xFF
+        self.registers[high + 1] = value & 0xFF
+
+    @property
+    def bc(self) -> int:
+        return self._pair(_B)
+
+    @bc.setter
+    def bc(self, value: int) -> None:
+        self._set_pair(_B, value)
+
+    @property
+    def de(self) -> int:
+        return self._pair(_D)
+
+    @de.setter
+    def de(self, value: int) -> None:
+        self._set_pair(_D, value)
+
+    @property
+    def hl(self) -> int:
+        return self._pair(_H)
+
+    @hl.setter
+    def hl(self, value: int) -> None:
+        self._set_pair(_H, value)
+
+    @property
+    def af(self) -> int:
+        return self.a << 8 | self.f
+
+    @af.setter
+    def af(self, value: int) -> None:
+        self.a, self.f = (value >> 8) & 0xFF, value & 0xFF
+
+    def get_rr(self, dd: int) -> int:
+        return (self.bc, self.de, self.hl, self.sp)[dd]
+
+    def set_rr(self, dd: int, value: int) -> None:
+        value &= 0xFFFF
+        if dd == 0:
+            self.bc = value
+        elif dd == 1:
+            self.de = value
+        elif dd == 2:
+            self.hl = value
+        else:
+            self.sp = value
+
+    def fetch(self) -> int:
+        value = self.memory[self.pc]
+        self.pc = (self.pc + 1) & 0xFFFF
+        return value
+
+    def fetch_word(self) -> int:
+        low = self.fetch()
+        return self.fetch() << 8 | low
+
+    def fetch_displacement(self) -> int:
+        value = self.fetch()
+        return value - 0x100 if value & 0x80 else value
+
+    def read_word(self, address: int) -> int:
+        return self.memory[address] | self.memory[(address + 1) & 0xFFFF] << 8
+
+    def write_word(self, address: int, value: int) -> None:
+        self.memory[address] = value & 0xFF
+        self.memory[(address + 1) & 0xFFFF] = (value >> 8) & 0xFF
+
+    def push(self, value: int) -> None:
+        self.sp = (self.sp - 2) & 0xFFFF
+        self.lowest_sp = min(self.lowest_sp, self.sp)
+        self.write_word(self.sp, value)
+
+    def pop(self) -> int:
+        value = self.read_word(self.sp)
+        self.sp = (self.sp + 2) & 0xFFFF
+        return value
+
+    def condition(self, cc: int) -> bool:
+        flag = (Z, C, PV, S)[cc >> 1]
+        is_set = bool(self.f & flag)
+        return is_set if cc & 1 else not is_set
+
+    def ix_address(self) -> int:
+        return (self.ix + self.fetch_displacement()) & 0xFFFF
+
+    def alu(self, op: int, value: int) -> None:
+        a = self.a
+        if op in (0, 1):
+            carry = self.f & C if op == 1 else 0
+            result = a + value + carry
+            half = (a & 0xF) + (value & 0xF) + carry > 0xF
+            overflow = (~(a ^ value) & (a ^ result) & 0x80) != 0
+            self.a = result & 0xFF
+            self.f = (
+                _sz(self.a)
+                | (H if half else 0)
+                | (PV if overflow else 0)
+                | (C if result > 0xFF else 0)
+            )
+        elif op in (2, 3, 7):
+            carry = self.f & C if op == 3 else 0
+            result = a - value - carry
+            half = (a & 0xF) - (value & 0xF) - carry < 0
+            overflow = ((a ^ value) & (a ^ result) & 0x80) != 0
+            self.f = (
+                _sz(result & 0xFF)
+                | (H if half else 0)
+                | (PV if overflow else 0)
+                | N
+                | (C if result < 0 else 0)
+            )
+            if op != 7:
+                self.a = result & 0xFF
+        else:
+            if op == 4:
+                self.a = a & value
+            elif op == 5:
+                self.a = a ^ value
+            else:
+                self.a = a | value
+            self.f = (
+                _sz(self.a) | (H if op == 4 else 0) | (PV if _parity(self.a) else 0)
+            )
+
+    def inc8(self, value: int) -> int:
+        result = (value + 1) & 0xFF
+        self.f = (
+            (self.f & C)
+            | _sz(result)
+            | (H if value & 0xF == 0xF else 0)
+            | (PV if value == 0x7F else 0)
+        )
+        return result
+
+    def dec8(self, value: int) -> int:
+        result = (value - 1) & 0xFF
+        self.f = (
+            (self.f & C)
+            | _sz(result)
+            | (H if value & 0xF == 0 else 0)
+            | (PV if value == 0x80 else 0)
+            | N
+        )
+        return result
+
+    def add16(self, lhs: int, rhs: int) -> int:
+        result = lhs + rhs
+        half = (lhs & 0xFFF) + (rhs & 0xFFF) > 0xFFF
+        self.f = (
+            (self.f & (S | Z | PV)) | (H if half else 0) | (C if result > 0xFFFF else 0)
+        )
+        return result & 0xFFFF
+
+    def adc16(self, lhs: int, rhs: int, subtract: bool) -> int:
+        carry = self.f & C
+        if subtract:
+            result = lhs - rhs - carry
+            half = (lhs & 0xFFF) - (rhs & 0xFFF) - carry < 0
+            overflow = ((lhs ^ rhs) & (lhs ^ result) & 0x8000) != 0
+        else:
+            result = lhs + rhs + carry
+            half = (lhs & 0xFFF) + (rhs & 0xFFF) + carry > 0xFFF
+            overflow = (~(lhs ^ rhs) & (lhs ^ result) & 0x8000) != 0
+        value = result & 0xFFFF
+        self.f = (
+            (S if value & 0x8000 else 0)
+            | (Z if value == 0 else 0)
+            | (H if half else 0)
+            | (PV if overflow else 0)
+            | (N if subtract else 0)
+            | (C if result < 0 or result > 0xFFFF else 0)
+        )
+        return value
+
+    def rst10(self) -> None:
+        """
+        Stub of the ROM print routine. Registers that the ROM may corrupt are
+        scrambled so that code relying on them surviving the call fails.
+        """
+        self.output.append(chr(self.a))
+        self.af = 0xA5A5
+        self.bc = 0xB5B5
+        self.de = 0xD5D5
+        self.hl = 0xE5E5
+
+    def step(self) -> None:
+        opcode = self.fetch()
+        handler = _MAIN[opcode]
+        if handler is None:
+            raise EmulationError(
+                f"Unsupported opcode ${opcode:02X} at ${(self.pc - 1) & 0xFFFF:04X}"
+            )
+        self.cycles += handler(self, opcode)
+        self.instructions += 1
+
+    def run(self, start: int, max_cycles: int = MAX_CYCLES) -> ExecutionResult:
+        self.pc = start
+        self.push(RETURN_SENTINEL)
+        top = self.sp
+        while self.pc != RETURN_SENTINEL:
+            self.step()
+            if self.cycles > max_cycles:
+                raise EmulationError(f"Exceeded {max_cycles} T-states")
+        return ExecutionResult(
+            "".join(self.output), self.cycles, self.instructions, top - self.lowest_sp
+        )
+
+
+Handler = Callable[[Z80, int], int]
+_MAIN: List[Optional[Handler]] = [None] * 256
+_DD_TABLE: List[Optional[Handler]] = [None] * 256
+_ED_TABLE: List[Optional[Handler]] = [None] * 256
+
+
+def _prefixed(table: List[Optional[Handler]], prefix: int) -> Handler:
+    def handler(cpu: Z80, _: int) -> int:
+        opcode = cpu.fetch()
+        sub_handler = table[opcode]
+        if sub_handler is None:
+            raise EmulationError(f"Unsupported opcode ${prefix:02X} ${opcode:02X}")
+        return sub_handler(cpu, opcode)
+
+    return handler
+
+
+def _build_tables() -> None:
+    main, dd, ed = _MAIN, _DD_TABLE, _ED_TABLE
+    main[0xDD] = _prefixed(dd, 0xDD)
+    main[0xED] = _prefixed(ed, 0xED)
+
+    main[0x00] = lambda cpu, op: 4
+
+    # ld r, r' / ld r, (hl) / ld (hl), r
+    def ld_r_r(cpu: Z80, op: int) -> int:
+        cpu.set_r((op >> 3) & 7, cpu.get_r(op & 7))
+        return 7 if op & 7 == 6 or (op >> 3) & 7 == 6 else 4
+
+    for op in range(0x40, 0x80):
+        if op != 0x76:
+            main[op] = ld_r_r
+    main[0x76] = lambda cpu, op: _halt(cpu)
+
+    # ld r, n
+    def ld_r_n(cpu: Z80, op: int) -> int:
+        cpu.set_r((op >> 3) & 7, cpu.fetch())
+        return 10 if op == 0x36 else 7
+
+    for r in range(8):
+        main[0x06 | r << 3] = ld_r_n
+
+    # ld a, (bc) / (de) and stores
+    def ld_a_rr(cpu: Z80, op: int) -> int:
+        cpu.a = cpu.memory[cpu.bc if op == 0x0A else cpu.de]
+        return 7
+
+    def ld_rr_a(cpu: Z80, op: int) -> int:
+        cpu.memory[cpu.bc if op == 0x02 else cpu.de] = cpu.a
+        return 7
+
+    main[0x0A] = main[0x1A] = ld_a_rr
+    main[0x02] = main[0x12] = ld_rr_a
+
+    def ld_a_nn(cpu: Z80, op: int) -> int:
+        cpu.a = cpu.memory[cpu.fetch_word()]
+        return 13
+
+    def ld_nn_a(cpu: Z80, op: int) -> int:
+        cpu.memory[cpu.fetch_word()] = cpu.a
+        return 13
+
+    main[0x3A] = ld_a_nn
+    main[0x32] = ld_nn_a
+
+    # 16-bit loads
+    def ld_rr_nn(cpu: Z80, op: int) -> int:
+        cpu.set_rr((op >> 4) & 3, cpu.fetch_word())
+        return 10
+
+    for dd_code in range(4):
+        main[0x01 | dd_code << 4] = ld_rr_nn
+
+    def ld_hl_mem(cpu: Z80, op: int) -> int:
+        cpu.hl = cpu.read_word(cpu.fetch_word())
+        return 16
+
+    def ld_mem_hl(cpu: Z80, op: int) -> int:
+        cpu.write_word(cpu.fetch_word(), cpu.hl)
+        return 16
+
+    main[0x2A] = ld_hl_mem
+    main[0x22] = ld_mem_hl
+
+    def ld_sp_hl(cpu: Z80, op: int) -> int:
+        cpu.sp = cpu.hl
+        cpu.lowest_sp = min(cpu.lowest_sp, cpu.sp)
+        return 6
+
+    main[0xF9] = ld_sp_hl
+
+    def ed_ld_rr_mem(cpu: Z80, op: int) -> int:
+        cpu.set_rr((op >> 4) & 3, cpu.read_word(cpu.fetch_word()))
+        cpu.lowest_sp = min(cpu.lowest_sp, cpu.sp)
+        return 20
+
+    def ed_ld_mem_rr(cpu: Z80, op: int) -> int:
+        cpu.write_word(cpu.fetch_word(), cpu.get_rr((op >> 4) & 3))
+        return 20
+
+    for dd_code in range(4):
+        ed[0x4B | dd_code << 4] = ed_ld_rr_mem
+        ed[0x43 | dd_code << 4] = ed_ld_mem_rr
+
+    # push / pop
+    def push_qq(cpu: Z80, op: int) -> int:
+        qq = (op >> 4) & 3
+        cpu.push(cpu.af if qq == 3 else cpu.get_rr(qq))
+        return 11
+
+    def pop_qq(cpu: Z80, op: int) -> int:
+        qq = (op >> 4) & 3
+        value = cpu.pop()
+        if qq == 3:
+            cpu.af = value
+        else:
+            cpu.set_rr(qq, value)
+        return 10
+
+    for qq in range(4):
+        main[0xC5 | qq << 4] = push_qq
+        main[0xC1 | qq << 4] = pop_qq
+
+    def ex_de_hl(cpu: Z80, op: int) -> int:
+        cpu.de, cpu.hl = cpu.hl, cpu.de
+        return 4
+
+    def ex_sp_hl(cpu: Z80, op: int) -> int:
+        value = cpu.read_word(cpu.sp)
+        cpu.write_word(cpu.sp, cpu.hl)
+        cpu.hl = value
+        return 19
+
+    main[0xEB] = ex_de_hl
+    main[0xE3] = ex_sp_hl
+
+    # 8-bit arithmetic
+    def alu_r(cpu: Z80, op: int) -> int:
+        cpu.alu((op >> 3) & 7, cpu.get_r(op & 7))
+        return 7 if op & 7 == 6 else 4
+
+    def alu_n(cpu: Z80, op: int) -> int:
+        cpu.alu((op >> 3) & 7, cpu.fetch())
+        return 7
+
+    for op in range(0x80, 0xC0):
+        main[op] = alu_r
+    for alu_op in range(8):
+        main[0xC6 | alu_op << 3] = alu_n
+
+    def inc_r(cpu: Z80, op: int) -> int:
+        r = (op >> 3) & 7
+        cpu.set_r(r, cpu.inc8(cpu.get_r(r)))
+        return 11 if r == 6 else 4
+
+    def dec_r(cpu: Z80, op: int) -> int:
+        r = (op >> 3) & 7
+        cpu.set_r(r, cpu.dec8(cpu.get_r(r)))
+        return 11 if r == 6 else 4
+
+    for r in range(8):
+        main[0x04 | r << 3] = inc_r
+        main[0x05 | r << 3] = dec_r
+
+    def cpl(cpu: Z80, op: int) -> int:
+        cpu.a ^= 0xFF
+        cpu.f |= H | N
+        return 4
+
+    main[0x2F] = cpl
+
+    def neg(cpu: Z80, op: int) -> int:
+        value = cpu.a
+        cpu.a = 0
+        cpu.alu(2, value)
+        return 8
+
+    ed[0x44] = neg
+
+    # 16-bit arithmetic
+    def add_hl_rr(cpu: Z80, op: int) -> int:
+        cpu.hl = cpu.add16(cpu.hl, cpu.get_rr((op >> 4) & 3))
+        return 11
+
+    def inc_rr(cpu: Z80, op: int) -> int:
+        dd_code = (op >> 4) & 3
+        cpu.set_rr(dd_code, cpu.get_rr(dd_code) + 1)
+        return 6
+
+    def dec_rr(cpu: Z80, op: int) -> int:
+        dd_code = (op >> 4) & 3
+        cpu.set_rr(dd_code, cpu.get_rr(dd_code) - 1)
+        if dd_code == 3:
+            cpu.lowest_sp = min(cpu.lowest_sp, cpu.sp)
+        return 6
+
+    def adc_hl_rr(cpu: Z80, op: int) -> int:
+        cpu.hl = cpu.adc16(cpu.hl, cpu.get_rr((op >> 4) & 3), subtract=False)
+        return 15
+
+    def sbc_hl_rr(cpu: Z80, op: int) -> int:
+        cpu.hl = cpu.adc16(cpu.hl, cpu.get_rr((op >> 4) & 3), subtract=True)
+        return 15
+
+    for dd_code in range(4):
+        main[0x09 | dd_code << 4] = add_hl_rr
+        main[0x03 | dd_code << 4] = inc_rr
+        main[0x0B | dd_code << 4] = dec_rr
+        ed[0x4A | dd_code << 4] = adc_hl_rr
+        ed[0x42 | dd_code << 4] = sbc_hl_rr
+
+    # control flow
+    def jp_nn(cpu: Z80, op: int) -> int:
+        cpu.pc = cpu.fetch_word()
+        return 10
+
+    def jp_cc_nn(cpu: Z80, op: int) -> int:
+        target = cpu.fetch_word()
+        if cpu.condition((op >> 3) & 7):
+            cpu.pc = target
+        return 10
+
+    def jp_hl(cpu: Z80, op: int) -> int:
+        cpu.pc = cpu.hl
+        return 4
+
+    main[0xC3] = jp_nn
+    main[0xE9] = jp_hl
+    for cc in range(8):
+        main[0xC2 | cc << 3] = jp_cc_nn
+
+    def jr_e(cpu: Z80, op: int) -> int:
+        offset = cpu.fetch_displacement()
+        cpu.pc = (cpu.pc + offset) & 0xFFFF
+        return 12
+
+    def jr_cc_e(cpu: Z80, op: int) -> int:
+        offset = cpu.fetch_displacement()
+        if cpu.condition((op >> 3) & 3):
+            cpu.pc = (cpu.pc + offset) & 0xFFFF
+            return 12
+        return 7
+
+    def djnz(cpu: Z80, op: int) -> int:
+        offset = cpu.fetch_displacement()
+        cpu.registers[_B] = (cpu.registers[_B] - 1) & 0xFF
+        if cpu.registers[_B]:
+            cpu.pc = (cpu.pc + offset) & 0xFFFF
+            return 13
+        return 8
+
+    main[0x18] = jr_e
+    main[0x10] = djnz
+    for cc in range(4):
+        main[0x20 | cc << 3] = jr_cc_e
+
+    def call_nn(cpu: Z80, op: int) -> int:
+        target = cpu.fetch_word()
+        cpu.push(cpu.pc)
+        cpu.pc = target
+        return 17
+
+    def call_cc_nn(cpu: Z80, op: int) -> int:
+        target = cpu.fetch_word()
+        if cpu.condition((op >> 3) & 7):
+            cpu.push(cpu.pc)
+            cpu.pc = target
+            return 17
+        return 10
+
+    def ret(cpu: Z80, op: int) -> int:
+        cpu.pc = cpu.pop()
+        return 10
+
+    def ret_cc(cpu: Z80, op: int) -> int:
+        if cpu.condition((op >> 3) & 7):
+            cpu.pc = cpu.pop()
+            return 11
+        return 5
+
+    main[0xCD] = call_nn
+    main[0xC9] = ret
+    for cc in range(8):
+        main[0xC4 | cc << 3] = call_cc_nn
+        main[0xC0 | cc << 3] = ret_cc
+
+    def rst(cpu: Z80, op: int) -> int:
+        vector = op & 0x38
+        if vector != 0x10:
+            raise EmulationError(f"Unsupported restart ${vector:02X}")
+        cpu.rst10()
+        return 11
+
+    for p in range(8):
+        main[0xC7 | p << 3] = rst
+
+    # DD prefixed (ix)
+    def ld_r_ix(cpu: Z80, op: int) -> int:
+        cpu.set_r((op >> 3) & 7, cpu.memory[cpu.ix_address()])
+        return 19
+
+    def ld_ix_r(cpu: Z80, op: int) -> int:
+        cpu.memory[cpu.ix_address()] = cpu.get_r(op & 7)
+        return 19
+
+    def ld_ix_n(cpu: Z80, op: int) -> int:
+        address = cpu.ix_address()
+        cpu.memory[address] = cpu.fetch()
+        return 19
+
+    for r in (0, 1, 2, 3, 4, 5, 7):
+        dd[0x46 | r << 3] = ld_r_ix
+        dd[0x70 | r] = ld_ix_r
+    dd[0x36] = ld_ix_n
+
+    def alu_ix(cpu: Z80, op: int) -> int:
+        cpu.alu((op >> 3) & 7, cpu.memory[cpu.ix_address()])
+        return 19
+
+    for alu_op in range(8):
+        dd[0x86 | alu_op << 3] = alu_ix
+
+    def inc_ix_d(cpu: Z80, op: int) -> int:
+        address = cpu.ix_address()
+        cpu.memory[address] = cpu.inc8(cpu.memory[address])
+        return 23
+
+    def dec_ix_d(cpu: Z80, op: int) -> int:
+        address = cpu.ix_address()
+        cpu.memory[address] = cpu.dec8(cpu.memory[address])
+        return 23
+
+    dd[0x34] = inc_ix_d
+    dd[0x35] = dec_ix_d
+
+    def ld_ix_nn(cpu: Z80, op: int) -> int:
+        cpu.ix = cpu.fetch_word()
+        return 14
+
+    def ld_ix_mem(cpu: Z80, op: int) -> int:
+        cpu.ix = cpu.read_word(cpu.fetch_word())
+        return 20
+
+    def ld_mem_ix(cpu: Z80, op: int) -> int:
+        cpu.write_word(cpu.fetch_word(), cpu.ix)
+        return 20
+
+    def ld_sp_ix(cpu: Z80, op: int) -> int:
+        cpu.sp = cpu.ix
+        cpu.lowest_sp = min(cpu.lowest_sp, cpu.sp)
+        return 10
+
+    def push_ix(cpu: Z80, op: int) -> int:
+        cpu.push(cpu.ix)
+        return 15
+
+    def pop_ix(cpu: Z80, op: int) -> int:
+        cpu.ix = cpu.pop()
+        return 14
+
+    def ex_sp_ix(cpu: Z80, op: int) -> int:
+        value = cpu.read_word(cpu.sp)
+        cpu.write_word(cpu.sp, cpu.ix)
+        cpu.ix = value
+        return 23
+
+    def inc_ix(cpu: Z80, op: int) -> int:
+        cpu.ix = (cpu.ix + 1) & 0xFFFF
+        return 10
+
+    def dec_ix(cpu: Z80, op: int) -> int:
+        cpu.ix = (cpu.ix - 1) & 0xFFFF
+        return 10
+
+    dd[0x21] = ld_ix_nn
+    dd[0x2A] = ld_ix_mem
+    dd[0x22] = ld_mem_ix
+    dd[0xF9] = ld_sp_ix
+    dd[0xE5] = push_ix
+    dd[0xE1] = pop_ix
+    dd[0xE3] = ex_sp_ix
+    dd[0x23] = inc_ix
+    dd[0x2B] = dec_ix
+
+    def add_ix_pp(cpu: Z80, op: int) -> int:
+        pp = (op >> 4) & 3
+        value = cpu.ix if pp == 2 else cpu.get_rr(pp)
+        cpu.ix = cpu.add16(cpu.ix, value)
+        return 15
+
+    for pp in range(4):
+        dd[0x09 | pp << 4] = add_ix_pp
+
+
+def _halt(cpu: Z80) -> int:
+    raise EmulationError(f"Executed halt at ${(cpu.pc - 1) & 0xFFFF:04X}")
+
+
+_build_tables()
+
+
+def execute(
+    code: Iterable[Item], entry: str = "main", max_cycles: int = MAX_CYCLES
+) -> ExecutionResult:
+    """
+    Assembles the code and runs it starting from the `entry` label until it
+    returns.
+
+    :raises EmulationError: also if the stack grew down into the code
+    """
+    binary = assemble(code)
+    cpu = Z80(binary.memory)
+    result = cpu.run(binary.symbols[entry], max_cycles)
+    if cpu.lowest_sp < binary.end:
+        raise EmulationError(
+            f"Stack reached ${cpu.lowest_sp:04X}, below the end of the code"
+            f" at ${binary.end:04X}"
+        )
+    return result
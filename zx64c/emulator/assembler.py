@@ -0,0 +1,392 @@
+"""
+Assembler of the code produced by the compiler into machine code, so that
+the code can be executed by the emulator without sjasmplus.
+
+Only instructions in the timing table of `z80` are encoded. Every encoded
+instruction is checked to take exactly as many bytes as the table says.
+"""
+from __future__ import annotations
+
+import functools
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from zx64c.codegen.z80 import (
+    Item,
+    Instruction,
+    Label,
+    Directive,
+    Opcode,
+    Operand,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+    Address,
+    Indirect,
+    Indexed,
+)
+
+ORIGIN = 0x8000
+
+_R = {
+    Register.B: 0,
+    Register.C: 1,
+    Register.D: 2,
+    Register.E: 3,
+    Register.H: 4,
+    Register.L: 5,
+    Register.A: 7,
+}
+_HL_INDIRECT = 6
+_DD = {Register.BC: 0, Register.DE: 1, Register.HL: 2, Register.SP: 3}
+_QQ = {Register.BC: 0, Register.DE: 1, Register.HL: 2, Register.AF: 3}
+_PP = {Register.BC: 0, Register.DE: 1, Register.IX: 2, Register.SP: 3}
+_CC = {
+    Condition.NZ: 0,
+    Condition.Z: 1,
+    Condition.NC: 2,
+    Condition.C: 3,
+    Condition.PO: 4,
+    Condition.PE: 5,
+    Condition.P: 6,
+    Condition.M: 7,
+}
+_ALU = {
+    Opcode.ADD: 0,
+    Opcode.ADC: 1,
+    Opcode.SUB: 2,
+    Opcode.SBC: 3,
+    Opcode.AND: 4,
+    Opcode.XOR: 5,
+    Opcode.OR: 6,
+    Opcode.CP: 7,
+}
+
+
+_Encoding = Optional[List[int]]
+# ^^^ bytes of an instruction, None if the operands cannot be encoded
+
+
+class AssemblyError(Exception):
+    pass
+
+
+def _word(value: int) -> bytes:
+    value &= 0xFFFF
+    return bytes([value & 0xFF, value >> 8])
+
+
+def _displacement(offset: int) -> int:
+    if not -128 <= offset <= 127:
+        raise AssemblyError(f"Displacement {offset} out of range")
+    return offset & 0xFF
+
+
+class _Encoder:
+    """
+    Encodes instructions placed at the given address. Opcodes are built out
+    of the bit fields of the Z80 encoding, e.g. `ld r, r'` is `01rrrr'r'`.
+    """
+
+    def __init__(self, address: int, resolve: Callable[[str], int]):
+        self._address = address
+        self._resolve = resolve
+
+    def value(self, operand: Operand) -> int:
+        if isinstance(operand, Immediate):
+            return operand.value
+        if isinstance(operand, LabelRef):
+            return self._resolve(operand.name)
+        if isinstance(operand, Address):
+            if isinstance(operand.target, int):
+                return operand.target
+            return self._resolve(operand.target)
+        raise AssemblyError(f"{operand} is not a value")
+
+    def relative(self, operand: Operand) -> int:
+        offset = self.value(operand) - (self._address + 2)
+        return _displacement(offset)
+
+    def encode(self, instruction: Instruction) -> bytes:
+        method = getattr(self, f"_encode_{instruction.opcode.name.lower()}")
+        encoded = method(*instruction.operands)
+        if encoded is None:
+            raise AssemblyError(f"Cannot encode `{instruction}`")
+        return bytes(encoded)
+
+    @staticmethod
+    def _r(operand: Operand) -> Optional[int]:
+        if isinstance(operand, Register):
+            return _R.get(operand)
+        if isinstance(operand, Indirect) and operand.register is Register.HL:
+            return _HL_INDIRECT
+        return None
+
+    def _encode_ld(self, dst: Operand, src: Operand) -> _Encoding:
+        rd, rs = self._r(dst), self._r(src)
+        if rd is not None and rs is not None:
+            if rd == rs == _HL_INDIRECT:
+                return None
+            return [0x40 | rd << 3 | rs]
+        if rd is not None and isinstance(src, (Immediate, LabelRef)):
+            return [0x06 | rd << 3, self.value(src) & 0xFF]
+        if rd is not None and rd != _HL_INDIRECT and isinstance(src, Indexed):
+            return [0xDD, 0x46 | rd << 3, _displacement(src.offset)]
+        if isinstance(dst, Indexed) and rs is not None and rs != _HL_INDIRECT:
+            return [0xDD, 0x70 | rs, _displacement(dst.offset)]
+        if isinstance(dst, Indexed) and isinstance(src, Immediate):
+            return [0xDD, 0x36, _displacement(dst.offset), src.value & 0xFF]
+        if dst is Register.A and isinstance(src, Indirect):
+            return {Register.BC: [0x0A], Register.DE: [0x1A]}.get(src.register)
+        if isinstance(dst, Indirect) and src is Register.A:
+            return {Register.BC: [0x02], Register.DE: [0x12]}.get(dst.register)
+        if dst is Register.A and isinstance(src, Address):
+            return [0x3A, *_word(self.value(src))]
+        if isinstance(dst, Address) and src is Register.A:
+            return [0x32, *_word(self.value(dst))]
+        if dst in _DD and isinstance(src, (Immediate, LabelRef)):
+            return [0x01 | _DD[dst] << 4, *_word(self.value(src))]
+        if dst is Register.IX and isinstance(src, (Immediate, LabelRef)):
+            return [0xDD, 0x21, *_word(self.value(src))]
+        if dst is Register.HL and isinstance(src, Address):
+            return [0x2A, *_word(self.value(src))]
+        if isinstance(dst, Address) and src is Register.HL:
+            return [0x22, *_word(self.value(dst))]
+        if dst in _DD and isinstance(src, Address):
+            return [0xED, 0x4B | _DD[dst] << 4, *_word(self.value(src))]
+        if isinstance(dst, Address) and src in _DD:
+            return [0xED, 0x43 | _DD[src] << 4, *_word(self.value(dst))]
+        if dst is Register.IX and isinstance(src, Address):
+            return [0xDD, 0x2A, *_word(self.value(src))]
+        if isinstance(dst, Address) and src is Register.IX:
+            return [0xDD, 0x22, *_word(self.value(dst))]
+        if dst is Register.SP and src is Register.HL:
+            return [0xF9]
+        if dst is Register.SP and src is Register.IX:
+            return [0xDD, 0xF9]
+        return None
+
+    def _encode_push(self, register: Operand) -> _Encoding:
+        if register is Register.IX:
+            return [0xDD, 0xE5]
+        if register in _QQ:
+            return [0xC5 | _QQ[register] << 4]
+        return None
+
+    def _encode_pop(self, register: Operand) -> _Encoding:
+        if register is Register.IX:
+            return [0xDD, 0xE1]
+        if register in _QQ:
+            return [0xC1 | _QQ[register] << 4]
+        return None
+
+    def _encode_ex(self, lhs: Operand, rhs: Operand) -> _Encoding:
+        if (lhs, rhs) == (Register.DE, Register.HL):
+            return [0xEB]
+        if lhs == Indirect(Register.SP) and rhs is Register.HL:
+            return [0xE3]
+        if lhs == Indirect(Register.SP) and rhs is Register.IX:
+            return [0xDD, 0xE3]
+        return None
+
+    def _encode_alu(self, opcode: Opcode, operand: Operand) -> _Encoding:
+        op = _ALU[opcode]
+        r = self._r(operand)
+        if r is not None:
+            return [0x80 | op << 3 | r]
+        if isinstance(operand, Immediate):
+            return [0xC6 | op << 3, operand.value & 0xFF]
+        if isinstance(operand, Indexed):
+            return [0xDD, 0x86 | op << 3, _displacement(operand.offset)]
+        return None
+
+    def _encode_add(self, lhs: Operand, rhs: Operand) -> _Encoding:
+        if lhs is Register.A:
+            return self._encode_alu(Opcode.ADD, rhs)
+        if lhs is Register.HL and rhs in _DD:
+            return [0x09 | _DD[rhs] << 4]
+        if lhs is Register.IX and rhs in _PP:
+            return [0xDD, 0x09 | _PP[rhs] << 4]
+        return None
+
+    def _encode_adc(self, lhs: Operand, rhs: Operand) -> _Encoding:
+        if lhs is Register.A:
+            return self._encode_alu(Opcode.ADC, rhs)
+        if lhs is Register.HL and rhs in _DD:
+            return [0xED, 0x4A | _DD[rhs] << 4]
+        return None
+
+    def _encode_sbc(self, lhs: Operand, rhs: Operand) -> _Encoding:
+        if lhs is Register.A:
+            return self._encode_alu(Opcode.SBC, rhs)
+        if lhs is Register.HL and rhs in _DD:
+            return [0xED, 0x42 | _DD[rhs] << 4]
+        return None
+
+    def _encode_sub(self, operand: Operand) -> _Encoding:
+        return self._encode_alu(Opcode.SUB, operand)
+
+    def _encode_and(self, operand: Operand) -> _Encoding:
+        return self._encode_alu(Opcode.AND, operand)
+
+    def _encode_or(self, operand: Operand) -> _Encoding:
+        return self._encode_alu(Opcode.OR, operand)
+
+    def _encode_xor(self, operand: Operand) -> _Encoding:
+        return self._encode_alu(Opcode.XOR, operand)
+
+    def _encode_cp(self, operand: Operand) -> _Encoding:
+        return self._encode_alu(Opcode.CP, operand)
+
+    def _encode_inc_dec(
+        self,
+        operand: Operand,
+        r_base: int,
+        rr_base: int,
+        ix_code: int,
+        indexed_code: int,
+    ) -> _Encoding:
+        r = self._r(operand)
+        if r is not None:
+            return [r_base | r << 3]
+        if operand in _DD:
+            return [rr_base | _DD[operand] << 4]
+        if operand is Register.IX:
+            return [0xDD, ix_code]
+        if isinstance(operand, Indexed):
+            return [0xDD, indexed_code, _displacement(operand.offset)]
+        return None
+
+    def _encode_inc(self, operand: Operand) -> _Encoding:
+        return self._encode_inc_dec(operand, 0x04, 0x03, 0x23, 0x34)
+
+    def _encode_dec(self, operand: Operand) -> _Encoding:
+        return self._encode_inc_dec(operand, 0x05, 0x0B, 0x2B, 0x35)
+
+    def _encode_neg(self) -> _Encoding:
+        return [0xED, 0x44]
+
+    def _encode_cpl(self) -> _Encoding:
+        return [0x2F]
+
+    def _encode_jp(self, *operands: Operand) -> _Encoding:
+        if operands == (Indirect(Register.HL),):
+            return [0xE9]
+        if len(operands) == 1:
+            return [0xC3, *_word(self.value(operands[0]))]
+        condition, target = operands
+        return [0xC2 | _CC[condition] << 3, *_word(self.value(target))]
+
+    def _encode_jr(self, *operands: Operand) -> _Encoding:
+        if len(operands) == 1:
+            return [0x18, self.relative(operands[0])]
+        condition, target = operands
+        if _CC[condition] > 3:
+            return None
+        return [0x20 | _CC[condition] << 3, self.relative(target)]
+
+    def _encode_djnz(self, target: Operand) -> _Encoding:
+        return [0x10, self.relative(target)]
+
+    def _encode_call(self, *operands: Operand) -> _Encoding:
+        if len(operands) == 1:
+            return [0xCD, *_word(self.value(operands[0]))]
+        condition, target = operands
+        return [0xC4 | _CC[condition] << 3, *_word(self.value(target))]
+
+    def _encode_ret(self, *operands: Operand) -> _Encoding:
+        if not operands:
+            return [0xC9]
+        return [0xC0 | _CC[operands[0]] << 3]
+
+    def _encode_rst(self, vector: Operand) -> _Encoding:
+        if vector.value & ~0x38:
+            return None
+        return [0xC7 | vector.value]
+
+    def _encode_nop(self) -> _Encoding:
+        return [0x00]
+
+    def _encode_halt(self) -> _Encoding:
+        return [0x76]
+
+
+@dataclass
+class Binary:
+    """
+    Memory image of an assembled program, `start` and `end` delimit the code.
+    """
+
+    memory: bytearray
+    symbols: Dict[str, int]
+    start: int
+    end: int
+
+
+def _qualify(name: str, scope: str) -> str:
+    if name.startswith("."):
+        return scope + name
+    return name
+
+
+def _parse_number(text: str) -> int:
+    if text.startswith("$"):
+        return int(text[1:], 16)
+    return int(text, 0)
+
+
+def assemble(code: Iterable[Item], origin: int = ORIGIN) -> Binary:
+    """
+    Assembles the code into a 64 KB memory image. Local labels (starting with
+    a dot) are scoped to the preceding global label, like in sjasmplus.
+    """
+    symbols: Dict[str, int] = {}
+    placed: List[Tuple[int, str, Union[Instruction, Directive]]] = []
+
+    address = start = origin
+    scope = ""
+    for item in code:
+        if isinstance(item, Label):
+            if not item.name.startswith("."):
+                scope = item.name
+            name = _qualify(item.name, scope)
+            if name in symbols:
+                raise AssemblyError(f"Label {name} is defined twice")
+            symbols[name] = address
+        elif isinstance(item, Directive) and item.name == "org":
+            address = _parse_number(item.arguments[0])
+            start = min(start, address)
+        elif isinstance(item, (Instruction, Directive)):
+            placed.append((address, scope, item))
+            address += item.size
+    end = address
+    if end > 0x10000:
+        raise AssemblyError(f"Code ends at ${end:04X}, past the end of memory")
+
+    memory = bytearray(0x10000)
+    for address, scope, item in placed:
+        if isinstance(item, Instruction):
+            resolve = functools.partial(_resolve, symbols, scope)
+            encoded = _Encoder(address, resolve).encode(item)
+            if len(encoded) != item.size:
+                raise AssemblyError(
+                    f"`{item}` encoded in {len(encoded)} bytes, expected {item.size}"
+                )
+        elif item.name == "dw":
+            encoded = b"".join(_word(_parse_number(arg)) for arg in item.arguments)
+        elif item.name == "db":
+            encoded = bytes(_parse_number(arg) & 0xFF for arg in item.arguments)
+        else:
+            continue
+        memory[address : address + len(encoded)] = encoded
+
+    return Binary(memory, symbols, start, end)
+
+
+def _resolve(symbols: Dict[str, int], scope: str, name: str) -> int:
+    try:
+        return symbols[_qualify(name, scope)]
+    except KeyError:
+        raise AssemblyError(f"Undefined label {name}")
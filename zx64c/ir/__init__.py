@@ -0,0 +1,455 @@
+"""
+Mid-level intermediate representation. Functions of the typed AST are turned
+into control flow graphs of basic blocks holding three-address instructions
+in static single assignment (SSA) form. Every temporary is assigned exactly
+once, and a value of a variable that depends on the path taken through an
+`if` is merged by a phi instruction at the start of the block that follows.
+
+Every basic block ends with a terminator: a jump, a conditional branch or a
+return. The language has no loops, so control flow graphs are acyclic, and
+every branch comes from an `if`, whose consequence is the `if_true` target
+and which joins the rest of the function at the `if_false` target.
+
+The IR is built with `zx64c.ir.builder`, optimised with passes from
+`zx64c.ir.passes` and turned back into the AST with `zx64c.ir.lowering`,
+which the Z80 code generator consumes.
+"""
+from __future__ import annotations
+
+import abc
+import itertools
+
+from abc import ABC
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Union
+
+from zx64c.ast import SourceContext
+from zx64c.types import Type
+
+
+class Temp:
+    """
+    SSA temporary. Temporaries are compared by identity.
+
+    :param name: source variable of which the temporary holds a version, None
+                 for intermediate values of expressions
+    :param type: type of the value, None for number literals whose type was
+                 never inferred
+    """
+
+    __slots__ = ("index", "name", "type")
+
+    def __init__(self, index: int, name: Optional[str], type: Optional[Type]):
+        self.index = index
+        self.name = name
+        self.type = type
+
+    def __str__(self):
+        if self.name is None:
+            return f"%{self.index}"
+        return f"%{self.name}.{self.index}"
+
+    def __repr__(self):
+        return f"Temp({self})"
+
+
+@dataclass(frozen=True)
+class Const:
+    value: int
+    boolean: bool = False
+
+    def __str__(self):
+        if self.boolean:
+            return "true" if self.value else "false"
+        return str(self.value)
+
+
+Value = Union[Temp, Const]
+
+
+class Instruction(ABC):
+    """
+    Base of instructions. `dest` is the temporary defined by the instruction,
+    if any.
+    """
+
+    __slots__ = ("dest", "context")
+    has_side_effects = False
+
+    def __init__(self, dest: Optional[Temp], context: Optional[SourceContext]):
+        self.dest = dest
+        self.context = context
+
+    @abc.abstractmethod
+    def uses(self) -> List[Value]:
+        """
+        Returns operands of the instruction in the order of evaluation.
+        """
+        pass
+
+    @abc.abstractmethod
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        pass
+
+
+def _replace(value: Value, replacements: Dict[Temp, Value]) -> Value:
+    if isinstance(value, Temp):
+        return replacements.get(value, value)
+    return value
+
+
+class BinaryOp(Instruction):
+    """
+    `dest = lhs <operator> rhs`, where the operator is one of `+`, `-`, `==`
+    and `!=`.
+    """
+
+    __slots__ = ("operator", "lhs", "rhs")
+
+    def __init__(
+        self,
+        dest: Temp,
+        operator: str,
+        lhs: Value,
+        rhs: Value,
+        context: Optional[SourceContext] = None,
+    ):
+        super().__init__(dest, context)
+        self.operator = operator
+        self.lhs = lhs
+        self.rhs = rhs
+
+    def uses(self) -> List[Value]:
+        return [self.lhs, self.rhs]
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.lhs = _replace(self.lhs, replacements)
+        self.rhs = _replace(self.rhs, replacements)
+
+    def __str__(self):
+        return f"{self.dest} = {self.lhs} {self.operator} {self.rhs}"
+
+
+class Negate(Instruction):
+    __slots__ = ("operand",)
+
+    def __init__(
+        self, dest: Temp, operand: Value, context: Optional[SourceContext] = None
+    ):
+        super().__init__(dest, context)
+        self.operand = operand
+
+    def uses(self) -> List[Value]:
+        return [self.operand]
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.operand = _replace(self.operand, replacements)
+
+    def __str__(self):
+        return f"{self.dest} = -{self.operand}"
+
+
+class Copy(Instruction):
+    """
+    `dest = source`, it comes from `let` statements and assignments.
+    """
+
+    __slots__ = ("source",)
+
+    def __init__(
+        self, dest: Temp, source: Value, context: Optional[SourceContext] = None
+    ):
+        super().__init__(dest, context)
+        self.source = source
+
+    def uses(self) -> List[Value]:
+        return [self.source]
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.source = _replace(self.source, replacements)
+
+    def __str__(self):
+        return f"{self.dest} = {self.source}"
+
+
+class Call(Instruction):
+    """
+    Calls a function. Calls of `void` functions define a temporary as well,
+    it is never read but by the `ret` of a `return f()` statement.
+    """
+
+    __slots__ = ("function", "arguments")
+    has_side_effects = True
+
+    def __init__(
+        self,
+        dest: Temp,
+        function: str,
+        arguments: List[Value],
+        context: Optional[SourceContext] = None,
+    ):
+        super().__init__(dest, context)
+        self.function = function
+        self.arguments = arguments
+
+    def uses(self) -> List[Value]:
+        return list(self.arguments)
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.arguments = [_replace(value, replacements) for value in self.arguments]
+
+    def __str__(self):
+        arguments = ", ".join(str(argument) for argument in self.arguments)
+        return f"{self.dest} = call {self.function}({arguments})"
+
+
+class PrintValue(Instruction):
+    __slots__ = ("value",)
+    has_side_effects = True
+
+    def __init__(self, value: Value, context: Optional[SourceContext] = None):
+        super().__init__(None, context)
+        self.value = value
+
+    def uses(self) -> List[Value]:
+        return [self.value]
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.value = _replace(self.value, replacements)
+
+    def __str__(self):
+        return f"print {self.value}"
+
+
+class Phi(Instruction):
+    """
+    Selects the value coming from the predecessor block that control came
+    from.
+
+    :param incoming: values by the label of the predecessor block
+    """
+
+    __slots__ = ("incoming",)
+
+    def __init__(
+        self,
+        dest: Temp,
+        incoming: Dict[str, Value],
+        context: Optional[SourceContext] = None,
+    ):
+        super().__init__(dest, context)
+        self.incoming = incoming
+
+    def uses(self) -> List[Value]:
+        return list(self.incoming.values())
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.incoming = {
+            label: _replace(value, replacements)
+            for label, value in self.incoming.items()
+        }
+
+    def __str__(self):
+        incoming = ", ".join(
+            f"[{label}: {value}]" for label, value in self.incoming.items()
+        )
+        return f"{self.dest} = phi {incoming}"
+
+
+class Terminator(Instruction):
+    __slots__ = ()
+
+    def __init__(self, context: Optional[SourceContext] = None):
+        super().__init__(None, context)
+
+    @abc.abstractmethod
+    def successors(self) -> List[str]:
+        pass
+
+
+class Jump(Terminator):
+    __slots__ = ("target",)
+
+    def __init__(self, target: str, context: Optional[SourceContext] = None):
+        super().__init__(context)
+        self.target = target
+
+    def uses(self) -> List[Value]:
+        return []
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        pass
+
+    def successors(self) -> List[str]:
+        return [self.target]
+
+    def __str__(self):
+        return f"jump {self.target}"
+
+
+class Branch(Terminator):
+    __slots__ = ("condition", "if_true", "if_false")
+
+    def __init__(
+        self,
+        condition: Value,
+        if_true: str,
+        if_false: str,
+        context: Optional[SourceContext] = None,
+    ):
+        super().__init__(context)
+        self.condition = condition
+        self.if_true = if_true
+        self.if_false = if_false
+
+    def uses(self) -> List[Value]:
+        return [self.condition]
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        self.condition = _replace(self.condition, replacements)
+
+    def successors(self) -> List[str]:
+        return [self.if_true, self.if_false]
+
+    def __str__(self):
+        return f"branch {self.condition}, {self.if_true}, {self.if_false}"
+
+
+class Ret(Terminator):
+    """
+    Returns from the function. The value is None only for the return at the
+    end of the body of a `void` function.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Optional[Value], context: Optional[SourceContext] = None):
+        super().__init__(context)
+        self.value = value
+
+    def uses(self) -> List[Value]:
+        return [] if self.value is None else [self.value]
+
+    def replace_uses(self, replacements: Dict[Temp, Value]) -> None:
+        if self.value is not None:
+            self.value = _replace(self.value, replacements)
+
+    def successors(self) -> List[str]:
+        return []
+
+    def __str__(self):
+        return "ret" if self.value is None else f"ret {self.value}"
+
+
+class BasicBlock:
+    __slots__ = ("label", "phis", "instructions", "terminator")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.phis: List[Phi] = []
+        self.instructions: List[Instruction] = []
+        self.terminator: Optional[Terminator] = None
+
+    def successors(self) -> List[str]:
+        if self.terminator is None:
+            return []
+        return self.terminator.successors()
+
+    def __iter__(self) -> Iterator[Instruction]:
+        """
+        Iterates over phis, instructions and the terminator of the block.
+        """
+        yield from self.phis
+        yield from self.instructions
+        if self.terminator is not None:
+            yield self.terminator
+
+    def __str__(self):
+        lines = [f"{self.label}:"]
+        lines.extend(f"    {instruction}" for instruction in self)
+        return "\n".join(lines)
+
+
+class FunctionIr:
+    """
+    Control flow graph of a single function. Blocks are kept in the order of
+    creation, the first one is the entry block.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        parameters: List[Temp],
+        return_type: Type,
+        context: Optional[SourceContext] = None,
+    ):
+        self.name = name
+        self.parameters = parameters
+        self.return_type = return_type
+        self.context = context
+        self.blocks: Dict[str, BasicBlock] = {}
+        self._temps = itertools.count(len(parameters))
+        self._labels = itertools.count()
+
+    @property
+    def entry(self) -> BasicBlock:
+        return next(iter(self.blocks.values()))
+
+    def new_block(self) -> BasicBlock:
+        block = BasicBlock(f"b{next(self._labels)}")
+        self.blocks[block.label] = block
+        return block
+
+    def new_temp(self, name: Optional[str], type: Optional[Type]) -> Temp:
+        return Temp(next(self._temps), name, type)
+
+    def predecessors(self) -> Dict[str, List[str]]:
+        predecessors: Dict[str, List[str]] = {label: [] for label in self.blocks}
+        for block in self.blocks.values():
+            for successor in block.successors():
+                predecessors[successor].append(block.label)
+        return predecessors
+
+    def reverse_postorder(self) -> List[BasicBlock]:
+        """
+        Returns blocks reachable from the entry, every block comes before its
+        successors.
+        """
+        visited = set()
+        postorder: List[BasicBlock] = []
+        stack = [(self.entry, iter(self.entry.successors()))]
+        visited.add(self.entry.label)
+        while stack:
+            block, successors = stack[-1]
+            successor = next(successors, None)
+            if successor is None:
+                stack.pop()
+                postorder.append(block)
+            elif successor not in visited:
+                visited.add(successor)
+                following = self.blocks[successor]
+                stack.append((following, iter(following.successors())))
+        return postorder[::-1]
+
+    def instructions(self) -> Iterator[Instruction]:
+        for block in self.blocks.values():
+            yield from block
+
+    def __str__(self):
+        parameters = ", ".join(
+            f"{parameter}: {parameter.type}" for parameter in self.parameters
+        )
+        lines = [f"function {self.name}({parameters}) -> {self.return_type}"]
+        lines.extend(str(block) for block in self.blocks.values())
+        return "\n".join(lines)
+
+
+class ProgramIr:
+    def __init__(
+        self, functions: List[FunctionIr], context: Optional[SourceContext] = None
+    ):
+        self.functions = functions
+        self.context = context
+
+    def __str__(self):
+        return "\n\n".join(str(function) for function in self.functions)
@@ -0,0 +1,219 @@
+"""
+Builds the SSA IR from the typed AST.
+
+Variables are not stored anywhere in the IR. The builder tracks the value
+that every variable holds at the current point of the function, `let`
+statements and assignments define a new version of the variable with a
+`Copy`, and reading the variable refers to its current version directly.
+At the block that follows an `if`, a phi merges the versions of every
+variable that was assigned in the consequence, unless the consequence always
+returns. Statements that follow a `return` in the same block are never
+executed, so they are not built.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from zx64c import ir
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import AstVisitor
+from zx64c.types import Type, U8
+from zx64c.types import Bool as BoolT
+
+
+class IrBuilderVisitor(AstVisitor[Optional[ir.Value]]):
+    """
+    Builds the IR of a single function. Visiting an expression returns the
+    value it evaluates to.
+
+    :param return_types: return types of all functions of the program, by
+                         name
+    """
+
+    def __init__(self, return_types: Dict[str, Type]):
+        self._return_types = return_types
+        self._function: Optional[ir.FunctionIr] = None
+        self._block: Optional[ir.BasicBlock] = None
+        # ^^^ None after a terminator, until the next block starts
+        self._variables: Dict[str, ir.Value] = {}
+        self._types: Dict[str, Type] = {}
+
+    @property
+    def function(self) -> ir.FunctionIr:
+        return self._function
+
+    def _emit(self, instruction: ir.Instruction) -> None:
+        self._block.instructions.append(instruction)
+
+    def _terminate(self, terminator: ir.Terminator) -> None:
+        self._block.terminator = terminator
+        self._block = None
+
+    def visit_program(self, node: Program) -> Optional[ir.Value]:
+        raise RuntimeError("IR is built for each function")
+
+    def visit_function(self, node: Function) -> Optional[ir.Value]:
+        parameters = []
+        for index, parameter in enumerate(node.parameters):
+            temp = ir.Temp(index, parameter.name, parameter.type_id)
+            parameters.append(temp)
+            self._variables[parameter.name] = temp
+            self._types[parameter.name] = parameter.type_id
+        self._function = ir.FunctionIr(
+            node.name, parameters, node.return_type, node.context
+        )
+        self._block = self._function.new_block()
+        node.code_block.visit(self)
+        if self._block is not None:
+            self._terminate(ir.Ret(None))
+        return None
+
+    def visit_block(self, node: Block) -> Optional[ir.Value]:
+        for statement in node.statements:
+            if self._block is None:
+                break
+            statement.visit(self)
+        return None
+
+    def visit_if(self, node: If) -> Optional[ir.Value]:
+        condition = node.condition.visit(self)
+        branch_label = self._block.label
+        consequence = self._function.new_block()
+        join = self._function.new_block()
+        self._terminate(
+            ir.Branch(condition, consequence.label, join.label, node.context)
+        )
+
+        before = dict(self._variables)
+        self._block = consequence
+        node.consequence.visit(self)
+        after = self._variables
+        self._variables = before
+        if self._block is not None:
+            consequence_label = self._block.label
+            self._terminate(ir.Jump(join.label))
+            for name, value in before.items():
+                if after[name] is not value:
+                    temp = self._function.new_temp(name, self._types[name])
+                    incoming = {branch_label: value, consequence_label: after[name]}
+                    join.phis.append(ir.Phi(temp, incoming, node.context))
+                    self._variables[name] = temp
+        self._block = join
+        return None
+
+    def visit_print(self, node: Print) -> Optional[ir.Value]:
+        value = node.expression.visit(self)
+        self._emit(ir.PrintValue(value, node.context))
+        return None
+
+    def _define(self, name: str, value: ir.Value, context) -> None:
+        temp = self._function.new_temp(name, self._types[name])
+        self._emit(ir.Copy(temp, value, context))
+        self._variables[name] = temp
+
+    def visit_let(self, node: Let) -> Optional[ir.Value]:
+        value = node.rhs.visit(self)
+        self._types[node.name] = node.var_type
+        self._define(node.name, value, node.context)
+        return None
+
+    def visit_return(self, node: Return) -> Optional[ir.Value]:
+        value = node.expr.visit(self)
+        self._terminate(ir.Ret(value, node.context))
+        return None
+
+    def visit_assignment(self, node: Assignment) -> Optional[ir.Value]:
+        value = node.rhs.visit(self)
+        self._define(node.name, value, node.context)
+        return None
+
+    def _binary(self, node: Ast, operator: str) -> ir.Value:
+        lhs = node.lhs.visit(self)
+        rhs = node.rhs.visit(self)
+        if operator in ("==", "!="):
+            value_type: Type = BoolT()
+        else:
+            value_type = next(
+                (
+                    value.type
+                    for value in (lhs, rhs)
+                    if isinstance(value, ir.Temp) and value.type is not None
+                ),
+                U8(),
+            )
+        temp = self._function.new_temp(None, value_type)
+        self._emit(ir.BinaryOp(temp, operator, lhs, rhs, node.context))
+        return temp
+
+    def visit_equal(self, node: Equal) -> Optional[ir.Value]:
+        return self._binary(node, "==")
+
+    def visit_not_equal(self, node: NotEqual) -> Optional[ir.Value]:
+        return self._binary(node, "!=")
+
+    def visit_addition(self, node: Addition) -> Optional[ir.Value]:
+        return self._binary(node, "+")
+
+    def visit_subtraction(self, node: Subtraction) -> Optional[ir.Value]:
+        return self._binary(node, "-")
+
+    def visit_negation(self, node: Negation) -> Optional[ir.Value]:
+        operand = node.expression.visit(self)
+        value_type = operand.type if isinstance(operand, ir.Temp) else None
+        temp = self._function.new_temp(None, value_type or U8())
+        self._emit(ir.Negate(temp, operand, node.context))
+        return temp
+
+    def visit_function_call(self, node: FunctionCall) -> Optional[ir.Value]:
+        arguments: List[ir.Value] = [
+            argument.visit(self) for argument in node.arguments
+        ]
+        temp = self._function.new_temp(None, self._return_types[node.function_name])
+        self._emit(ir.Call(temp, node.function_name, arguments, node.context))
+        return temp
+
+    def visit_identifier(self, node: Identifier) -> Optional[ir.Value]:
+        return self._variables[node.value]
+
+    def visit_unsignedint(self, node: Unsignedint) -> Optional[ir.Value]:
+        return ir.Const(node.value)
+
+    def visit_bool(self, node: Bool) -> Optional[ir.Value]:
+        return ir.Const(int(node.value), boolean=True)
+
+
+def build_function_ir(
+    function: Function, return_types: Dict[str, Type]
+) -> ir.FunctionIr:
+    visitor = IrBuilderVisitor(return_types)
+    function.visit(visitor)
+    return visitor.function
+
+
+def build_ir(program: Program) -> ir.ProgramIr:
+    return_types = {
+        function.name: function.return_type for function in program.functions
+    }
+    functions = [
+        build_function_ir(function, return_types) for function in program.functions
+    ]
+    return ir.ProgramIr(functions, program.context)
@@ -0,0 +1,584 @@
+"""
+Dataflow analyses over control flow graphs of the IR.
+
+A dataflow problem describes facts that hold at the boundaries of basic
+blocks and how every block transforms them, and `solve` finds the fixed
+point with a worklist algorithm. Sets of facts are bit vectors, Python
+integers whose bits are indexes of the facts in a `Universe`, so the meet
+and transfer functions are a couple of integer operations per block.
+
+Liveness and reaching definitions are provided. Both are computed for all
+functions of a program by `compute_liveness` and
+`compute_reaching_definitions`, which are registered as analyses of the pass
+manager. Their facts hold only between two blocks of a topological order,
+so facts that never hold at the same time share a bit and vectors stay
+short however large the function is.
+"""
+from __future__ import annotations
+
+import abc
+import bisect
+
+from abc import ABC
+from typing import (
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from zx64c import ir
+
+T = TypeVar("T", bound=Hashable)
+
+_FEW_ITEMS = 8
+
+
+class Universe(Generic[T]):
+    """
+    Numbers facts, so that sets of facts can be represented by bit vectors.
+    """
+
+    def __init__(self, items: Iterable[T] = ()):
+        self._indexes: Dict[T, int] = {}
+        self._items: List[T] = []
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item: T) -> int:
+        """
+        Adds the item if it is not in the universe yet, returns its index.
+        """
+        index = self._indexes.get(item)
+        if index is None:
+            index = len(self._items)
+            self._indexes[item] = index
+            self._items.append(item)
+        return index
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._indexes
+
+    def bit(self, item: T) -> int:
+        return 1 << self._indexes[item]
+
+    def bits(self, items: Iterable[T]) -> int:
+        """
+        Returns the bit vector of the items. Every operation on a bit vector
+        takes time proportional to its length, so vectors of more than a few
+        items are built at once rather than one bit at a time.
+        """
+        indexes = [self._indexes[item] for item in items]
+        if len(indexes) < _FEW_ITEMS:
+            bits = 0
+            for index in indexes:
+                bits |= 1 << index
+            return bits
+        vector = bytearray((max(indexes) >> 3) + 1)
+        for index in indexes:
+            vector[index >> 3] |= 1 << (index & 7)
+        return int.from_bytes(vector, "little")
+
+    def items(self, bits: int) -> List[T]:
+        # ^^^ `bin` and `str.find` skip the zero bits in C, a loop over the
+        #     bytes of a long vector would visit each of them in Python
+        binary = bin(bits)[:1:-1]
+        items = []
+        index = binary.find("1")
+        while index >= 0:
+            items.append(self._items[index])
+            index = binary.find("1", index + 1)
+        return items
+
+
+class DataflowProblem(ABC):
+    """
+    Base of dataflow problems. Facts flow from predecessors to successors if
+    the problem is forward, and the other way round otherwise.
+
+    The default meet is the union, for which every block starts with the
+    empty set. Problems with other meets override `meet` and `initial`.
+    """
+
+    forward = True
+
+    def boundary(self) -> int:
+        """
+        Returns facts that hold at the start of the entry block of a forward
+        problem or at the end of blocks without successors of a backward one.
+        """
+        return 0
+
+    def initial(self) -> int:
+        return 0
+
+    def meet(self, values: List[int]) -> int:
+        result = 0
+        for value in values:
+            result |= value
+        return result
+
+    @abc.abstractmethod
+    def transfer(self, block: ir.BasicBlock, value: int) -> int:
+        pass
+
+    def edge(self, source: str, target: str, value: int) -> int:
+        """
+        Transforms facts flowing along the edge from the source block to the
+        target block, in the direction of the problem.
+        """
+        return value
+
+
+class GenKillProblem(DataflowProblem):
+    """
+    Problem whose transfer function of a block adds generated facts and
+    removes killed ones. Subclasses fill `gen` and `kill` by block labels.
+    """
+
+    def __init__(self):
+        self.gen: Dict[str, int] = {}
+        self.kill: Dict[str, int] = {}
+
+    def transfer(self, block: ir.BasicBlock, value: int) -> int:
+        return self.gen[block.label] | (value & ~self.kill[block.label])
+
+
+class DataflowResult:
+    """
+    Facts that hold at the start and at the end of every block, in the
+    order of execution regardless of the direction of the problem.
+    """
+
+    def __init__(self, starts: Dict[str, int], ends: Dict[str, int]):
+        self.starts = starts
+        self.ends = ends
+
+
+class _BlockOrder:
+    """
+    Blocks of a function in reverse postorder of a depth-first search from
+    the entry and then from the unreachable blocks, with the edges between
+    them. The order is topological if the control flow graph is acyclic and
+    every block is reachable, then every block comes after all blocks that
+    can reach it.
+    """
+
+    def __init__(self, function: ir.FunctionIr):
+        self.successors = {
+            label: block.successors() for label, block in function.blocks.items()
+        }
+        self.predecessors: Dict[str, List[str]] = {
+            label: [] for label in function.blocks
+        }
+        for label, targets in self.successors.items():
+            for target in targets:
+                self.predecessors[target].append(label)
+
+        visited: Set[str] = set()
+        finished: Set[str] = set()
+        postorder: List[str] = []
+        acyclic = True
+        for root in function.blocks:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.successors[root]))]
+            while stack:
+                label, successors = stack[-1]
+                successor = next(successors, None)
+                if successor is None:
+                    stack.pop()
+                    finished.add(label)
+                    postorder.append(label)
+                elif successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, iter(self.successors[successor])))
+                elif successor not in finished:
+                    acyclic = False
+        postorder.reverse()
+        self.blocks = [function.blocks[label] for label in postorder]
+        self.positions = {label: index for index, label in enumerate(postorder)}
+        self.topological = acyclic and postorder[0] == function.entry.label
+
+
+def solve(function: ir.FunctionIr, problem: DataflowProblem) -> DataflowResult:
+    """
+    Finds the fixed point of the problem with a worklist algorithm. Blocks
+    are visited in reverse postorder for forward problems and in postorder
+    for backward ones, so on the acyclic control flow graphs of the language
+    every block is transferred once.
+    """
+    return _solve(function, problem, _BlockOrder(function))
+
+
+def _solve(
+    function: ir.FunctionIr, problem: DataflowProblem, order: _BlockOrder
+) -> DataflowResult:
+    """
+    In a topological order the sources of every block are final before it is
+    visited, so every block is visited once without keeping a worklist.
+    """
+    forward = problem.forward
+    if forward:
+        sources, targets = order.predecessors, order.successors
+        worklist = order.blocks[::-1]
+    else:
+        sources, targets = order.successors, order.predecessors
+        worklist = order.blocks[:]
+
+    boundary = function.entry.label if forward else None
+    edge, meet, transfer = problem.edge, problem.meet, problem.transfer
+    if type(problem).edge is DataflowProblem.edge:
+        edge = None
+    initial = problem.initial()
+    inputs: Dict[str, int] = {}
+    outputs: Dict[str, int] = dict.fromkeys(order.positions, initial)
+
+    pending = None if order.topological else set(order.positions)
+    while worklist:
+        block = worklist.pop()
+        label = block.label
+        if edge is None:
+            values = [outputs[source] for source in sources[label]]
+        elif forward:
+            values = [edge(source, label, outputs[source]) for source in sources[label]]
+        else:
+            values = [edge(label, source, outputs[source]) for source in sources[label]]
+        if label == boundary or (not forward and not values):
+            values.append(problem.boundary())
+        value = meet(values) if values else initial
+        inputs[label] = value
+        output = transfer(block, value)
+        if pending is None:
+            outputs[label] = output
+            continue
+        pending.discard(label)
+        if output != outputs[label]:
+            outputs[label] = output
+            for target in targets[label]:
+                if target not in pending:
+                    pending.add(target)
+                    worklist.append(function.blocks[target])
+
+    if forward:
+        return DataflowResult(inputs, outputs)
+    return DataflowResult(outputs, inputs)
+
+
+class _SharedBits:
+    """
+    Numbers temporaries that are facts only at the boundaries of blocks
+    between two positions in a topological order of the blocks. Temporaries
+    whose spans of positions do not overlap share a bit, so bit vectors are
+    as long as the largest number of overlapping spans rather than the number
+    of temporaries. At a block a bit stands for the temporary whose span
+    starts last at or before the block.
+    """
+
+    def __init__(self):
+        self._starts: List[List[int]] = []
+        self._temps: List[List[ir.Temp]] = []
+        self._free: List[int] = []
+
+    def take(self) -> int:
+        """
+        Returns the index of a bit that no temporary holds.
+        """
+        if self._free:
+            return self._free.pop()
+        self._starts.append([])
+        self._temps.append([])
+        return len(self._temps) - 1
+
+    def own(self, index: int, temp: ir.Temp, start: int) -> None:
+        """
+        Records that the bit stands for the temporary from the position on.
+        Spans of every bit have to be recorded in the order of their starts,
+        or all in the reverse order followed by `reverse`.
+        """
+        self._starts[index].append(start)
+        self._temps[index].append(temp)
+
+    def claim(self, temp: ir.Temp, start: int) -> int:
+        """
+        Takes a bit and records that it stands for the temporary from the
+        position on.
+        """
+        if self._free:
+            index = self._free.pop()
+        else:
+            index = len(self._temps)
+            self._starts.append([])
+            self._temps.append([])
+        self._starts[index].append(start)
+        self._temps[index].append(temp)
+        return index
+
+    def release(self, index: int) -> None:
+        self._free.append(index)
+
+    def reverse(self) -> None:
+        for starts, temps in zip(self._starts, self._temps):
+            starts.reverse()
+            temps.reverse()
+
+    def temps(self, bits: int, position: int) -> Set[ir.Temp]:
+        temps = set()
+        while bits:
+            lowest = bits & -bits
+            index = lowest.bit_length() - 1
+            span = bisect.bisect_right(self._starts[index], position) - 1
+            temps.add(self._temps[index][span])
+            bits ^= lowest
+        return temps
+
+
+class _LivenessProblem(GenKillProblem):
+    """
+    A temporary is live at a point if its value can be used later. Uses by a
+    phi are live at the end of the predecessor block the value comes from,
+    and phi destinations are defined at the start of their block.
+
+    In SSA the uses of a value in the block defining it come after the
+    definition, so a block generates the values it uses but does not define.
+    Only temporaries used in a block other than the one defining them can be
+    live at the boundaries of blocks, so only these get a bit.
+
+    In a topological order a temporary is live only between the block
+    defining it and the last block using it. Blocks are numbered from the
+    last one, and a temporary takes a bit at its last use and releases it at
+    its definition.
+    """
+
+    forward = False
+
+    def __init__(self, function: ir.FunctionIr, order: _BlockOrder):
+        super().__init__()
+        self.bits = _SharedBits()
+        self._phi_uses: Dict[str, Dict[str, int]] = {}
+        indexes: Dict[ir.Temp, int] = {}
+        take, own, release = self.bits.take, self.bits.own, self.bits.release
+
+        for position in range(len(order.blocks) - 1, -1, -1):
+            block = order.blocks[position]
+            label = block.label
+            defined: Set[Optional[ir.Temp]] = {phi.dest for phi in block.phis}
+            used: List[ir.Value] = []
+            for instruction in block.instructions:
+                defined.add(instruction.dest)
+                used.extend(instruction.uses())
+            used.extend(block.terminator.uses())
+            gen = {value for value in used if isinstance(value, ir.Temp)}
+            gen.difference_update(defined)
+
+            bits = 0
+            for temp in gen:
+                index = indexes.get(temp)
+                if index is None:
+                    index = indexes[temp] = take()
+                bits |= 1 << index
+            self.gen[label] = bits
+            phi_uses = self._phi_uses[label] = {}
+            for successor in order.successors[label]:
+                bits = 0
+                for phi in function.blocks[successor].phis:
+                    temp = phi.incoming.get(label)
+                    if isinstance(temp, ir.Temp):
+                        index = indexes.get(temp)
+                        if index is None:
+                            index = indexes[temp] = take()
+                        bits |= 1 << index
+                phi_uses[successor] = bits
+
+            bits = 0
+            for temp in indexes.keys() & defined:
+                index = indexes[temp]
+                bits |= 1 << index
+                own(index, temp, position)
+                if order.topological:
+                    del indexes[temp]
+                    release(index)
+            self.kill[label] = bits
+
+        for temp in reversed(function.parameters):
+            if temp in indexes:
+                own(indexes[temp], temp, 0)
+        self.bits.reverse()
+
+    def edge(self, source: str, target: str, value: int) -> int:
+        return value | self._phi_uses[source][target]
+
+
+class Liveness:
+    """
+    Temporaries live at the start and at the end of every block.
+    """
+
+    def __init__(self, function: ir.FunctionIr):
+        self._order = _BlockOrder(function)
+        self._problem = _LivenessProblem(function, self._order)
+        self._result = _solve(function, self._problem, self._order)
+
+    def live_in(self, label: str) -> Set[ir.Temp]:
+        bits = self._result.starts[label]
+        return self._problem.bits.temps(bits, self._order.positions[label])
+
+    def live_out(self, label: str) -> Set[ir.Temp]:
+        bits = self._result.ends[label]
+        return self._problem.bits.temps(bits, self._order.positions[label])
+
+
+class _ReachingDefinitionsProblem(GenKillProblem):
+    """
+    Definitions are identified by the versions of variables they define, and
+    a definition of a version kills the definitions of the other versions of
+    its variable. Temporaries of intermediate values are not definitions of
+    variables and are left out, and so are versions defined again later in
+    their block.
+
+    In a topological order a version reaches only blocks between the one
+    defining it and the last block that a path from it reaches before the
+    variable is defined again. A backward walk over the blocks finds the
+    last block for every variable defined at the end of every block.
+    """
+
+    def __init__(self, function: ir.FunctionIr, order: _BlockOrder):
+        super().__init__()
+        self.bits = _SharedBits()
+        numbers = {temp.name: number for number, temp in enumerate(function.parameters)}
+        # ^^^ variables are numbered in the order of their first definitions
+        versions: List[Dict[int, ir.Temp]] = []
+        for block in order.blocks:
+            dests = [phi.dest for phi in block.phis]
+            dests.extend(instruction.dest for instruction in block.instructions)
+            versions.append(
+                {
+                    numbers.setdefault(temp.name, len(numbers)): temp
+                    for temp in dests
+                    if temp is not None and temp.name is not None
+                }
+            )
+        ends = self._ends(order, versions, len(numbers)) if order.topological else None
+
+        claim, release = self.bits.claim, self.bits.release
+        active = [0] * len(numbers)
+        # ^^^ bits of the versions of every variable that may still reach
+        released: List[List[Tuple[int, int]]] = [[] for _ in range(len(versions) + 1)]
+        # ^^^ bits released at every position, with numbers of their variables
+        self._parameters = 0
+        for number, temp in enumerate(function.parameters):
+            index = claim(temp, 0)
+            self._parameters |= 1 << index
+            active[number] = 1 << index
+            if ends is not None:
+                end = 0 if number in versions[0] else ends[0][number]
+                released[end + 1].append((number, index))
+
+        for position, block in enumerate(order.blocks):
+            for number, index in released[position]:
+                active[number] &= ~(1 << index)
+                release(index)
+            gen = kill = 0
+            for number, temp in versions[position].items():
+                index = claim(temp, position)
+                bit = 1 << index
+                kill |= active[number]
+                active[number] |= bit
+                gen |= bit
+                if ends is not None:
+                    released[ends[position][number] + 1].append((number, index))
+            self.gen[block.label] = gen
+            self.kill[block.label] = kill
+
+        if ends is None:
+            # ^^^ bits are never released, and versions defined in later
+            #     blocks can reach earlier ones around cycles
+            for block, last_versions in zip(order.blocks, versions):
+                kill = 0
+                for number in last_versions:
+                    kill |= active[number]
+                self.kill[block.label] = kill
+
+    @staticmethod
+    def _ends(
+        order: _BlockOrder, versions: List[Dict[int, ir.Temp]], variables: int
+    ) -> List[List[int]]:
+        """
+        Returns, for every block and every variable, the position of the
+        last block reached by the version of the variable at the end of the
+        block.
+        """
+        ends: List[List[int]] = [[]] * len(order.blocks)
+        entering: List[List[int]] = [[]] * len(order.blocks)
+        # ^^^ ends seen by the predecessors of every block, the versions
+        #     defined in the block end there
+        positions = order.positions
+        for position in range(len(order.blocks) - 1, -1, -1):
+            successors = order.successors[order.blocks[position].label]
+            if not successors:
+                block_ends = [position] * variables
+            else:
+                block_ends = entering[positions[successors[0]]]
+            for label in successors[1:]:
+                reached = entering[positions[label]]
+                block_ends = [a if a > b else b for a, b in zip(block_ends, reached)]
+            ends[position] = block_ends
+            if versions[position]:
+                block_ends = block_ends.copy()
+                for number in versions[position]:
+                    block_ends[number] = position
+            entering[position] = block_ends
+        return ends
+
+    def boundary(self) -> int:
+        return self._parameters
+
+
+class ReachingDefinitions:
+    """
+    Definitions of variables that reach the start and the end of every
+    block, that is, for which there is a path from the definition to that
+    point along which the variable is not defined again. Parameters are
+    defined at the start of the entry block.
+    """
+
+    def __init__(self, function: ir.FunctionIr):
+        self._order = _BlockOrder(function)
+        self._problem = _ReachingDefinitionsProblem(function, self._order)
+        self._result = _solve(function, self._problem, self._order)
+
+    def reaching_in(self, label: str) -> Set[ir.Temp]:
+        bits = self._result.starts[label]
+        return self._problem.bits.temps(bits, self._order.positions[label])
+
+    def reaching_out(self, label: str) -> Set[ir.Temp]:
+        bits = self._result.ends[label]
+        return self._problem.bits.temps(bits, self._order.positions[label])
+
+    def versions(self, name: str, label: str) -> Set[ir.Temp]:
+        """
+        Returns versions of the variable that may be its value at the start
+        of the block.
+        """
+        return {temp for temp in self.reaching_in(label) if temp.name == name}
+
+
+def compute_liveness(program: ir.ProgramIr) -> Dict[str, Liveness]:
+    return {function.name: Liveness(function) for function in program.functions}
+
+
+def compute_reaching_definitions(
+    program: ir.ProgramIr,
+) -> Dict[str, ReachingDefinitions]:
+    return {
+        function.name: ReachingDefinitions(function) for function in program.functions
+    }
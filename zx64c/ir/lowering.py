@@ -0,0 +1,429 @@
+"""
+Turns the SSA IR back into the typed AST, which the Z80 code generator
+consumes.
+
+Phis are replaced with copies at the end of their predecessor blocks. Every
+temporary then has to live in a variable, and temporaries are coalesced into
+as few variables as possible: a phi shares the variable with its copies, and
+versions of the same source variable share it as long as they do not
+interfere, that is, neither is live where the other is defined. For IR built
+from the AST and changed by passes that do not move values around, this
+gives back the original variables.
+
+Intermediate values of expressions that are used exactly once, by the
+instruction that directly follows their computation, are not given a
+variable but become a part of the expression of that instruction again.
+
+The control flow graph has to have the shape produced by
+`zx64c.ir.builder`: every branch is an `if` whose consequence rejoins the
+rest of the function at the `if_false` target or returns.
+"""
+from __future__ import annotations
+
+import itertools
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from zx64c import ir
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import Parameter, SourceContext
+from zx64c.ir.dataflow import Liveness
+from zx64c.types import Type, U8
+
+NO_CONTEXT = SourceContext(0, 0)
+
+_OPERATORS = {"==": Equal, "!=": NotEqual, "+": Addition, "-": Subtraction}
+
+
+def _insert_phi_copies(function: ir.FunctionIr) -> List[Tuple[ir.Temp, ir.Temp]]:
+    """
+    Adds copies of the values merged by phis at the end of the predecessor
+    blocks, and makes the phis merge the copies instead. Returns pairs of the
+    phi destination and each of its copies.
+    """
+    pairs = []
+    for block in function.blocks.values():
+        for phi in block.phis:
+            for label, value in phi.incoming.items():
+                copy = function.new_temp(phi.dest.name, phi.dest.type)
+                predecessor = function.blocks[label]
+                predecessor.instructions.append(ir.Copy(copy, value, phi.context))
+                phi.incoming[label] = copy
+                pairs.append((phi.dest, copy))
+    return pairs
+
+
+class _Interference:
+    """
+    Interference graph of temporaries. Two temporaries interfere if one of
+    them is live where the other one is defined, so they cannot share a
+    variable. A copy does not make its destination interfere with its
+    source, they hold the same value.
+    """
+
+    def __init__(self, function: ir.FunctionIr, liveness: Liveness):
+        """
+        :param liveness: liveness of the function before the phi copies were
+                         inserted. The copies do not change what is live at
+                         the start of blocks, and at the end of a block they
+                         take the place of the values they copy.
+        """
+        self.neighbours: Dict[ir.Temp, Set[ir.Temp]] = {}
+        self.uses: Dict[ir.Temp, int] = {}
+        for block in function.blocks.values():
+            live: Set[ir.Temp] = set()
+            for successor in block.successors():
+                live |= liveness.live_in(successor)
+                for phi in function.blocks[successor].phis:
+                    live.add(phi.incoming[block.label])
+            for instruction in reversed(block.instructions + [block.terminator]):
+                if instruction.dest is not None:
+                    excluded = None
+                    if isinstance(instruction, ir.Copy):
+                        excluded = instruction.source
+                    self._define(instruction.dest, live, excluded)
+                for value in instruction.uses():
+                    if isinstance(value, ir.Temp):
+                        live.add(value)
+                        self.uses[value] = self.uses.get(value, 0) + 1
+            for phi in block.phis:
+                self._define(phi.dest, live)
+        for parameter in function.parameters:
+            self._define(parameter, liveness.live_in(function.entry.label))
+
+    def _define(self, temp: ir.Temp, live: Set[ir.Temp], excluded=None) -> None:
+        neighbours = self.neighbours.setdefault(temp, set())
+        for other in live:
+            if other is not temp and other is not excluded:
+                neighbours.add(other)
+                self.neighbours.setdefault(other, set()).add(temp)
+        live.discard(temp)
+
+
+class _Classes:
+    """
+    Union-find of temporaries that share a variable.
+    """
+
+    def __init__(self, interference: _Interference, parameters: Iterable[ir.Temp]):
+        self._interference = interference
+        self._parent: Dict[ir.Temp, ir.Temp] = {}
+        self._members: Dict[ir.Temp, List[ir.Temp]] = {}
+        self._parameters = set(parameters)
+
+    def find(self, temp: ir.Temp) -> ir.Temp:
+        root = self._parent.get(temp, temp)
+        if root is temp:
+            self._members.setdefault(temp, [temp])
+            return temp
+        root = self.find(root)
+        self._parent[temp] = root
+        return root
+
+    def members(self, temp: ir.Temp) -> List[ir.Temp]:
+        return self._members[self.find(temp)]
+
+    def interfere(self, first: ir.Temp, second: ir.Temp) -> bool:
+        first, second = self.find(first), self.find(second)
+        for member in self._members[first]:
+            for neighbour in self._interference.neighbours.get(member, ()):
+                if self.find(neighbour) is second:
+                    return True
+        parameters = [
+            member
+            for root in (first, second)
+            for member in self._members[root]
+            if member in self._parameters
+        ]
+        return len(parameters) > 1
+
+    def union(self, first: ir.Temp, second: ir.Temp) -> None:
+        first, second = self.find(first), self.find(second)
+        if first is second:
+            return
+        self._parent[second] = first
+        self._members[first].extend(self._members.pop(second))
+
+    def try_union(self, first: ir.Temp, second: ir.Temp) -> None:
+        if not self.interfere(first, second):
+            self.union(first, second)
+
+
+class _FunctionLowering:
+    def __init__(self, function: ir.FunctionIr, liveness: Liveness):
+        self._function = function
+        phi_dests: Dict[str, List[ir.Temp]] = {
+            label: [phi.dest for phi in block.phis]
+            for label, block in function.blocks.items()
+        }
+        phi_pairs = _insert_phi_copies(function)
+        self._interference = _Interference(function, liveness)
+        for block in function.blocks.values():
+            block.phis = []
+        self._definitions: Dict[ir.Temp, ir.Instruction] = {}
+        order: List[ir.Temp] = list(function.parameters)
+        for block in function.reverse_postorder():
+            for instruction in block:
+                if instruction.dest is not None:
+                    self._definitions[instruction.dest] = instruction
+                    order.append(instruction.dest)
+        for dests in phi_dests.values():
+            order.extend(dests)
+
+        self._classes = _Classes(self._interference, function.parameters)
+        for dest, copy in phi_pairs:
+            self._classes.union(dest, copy)
+        for dest, copy in phi_pairs:
+            source = self._definitions[copy].source
+            if isinstance(source, ir.Temp):
+                self._classes.try_union(copy, source)
+        self._inlined = self._find_inlined()
+        self._names = self._name_variables(order)
+        self._declared: Set[str] = {parameter.name for parameter in function.parameters}
+
+    def _hint(self, root: ir.Temp) -> Optional[str]:
+        members = self._classes.members(root)
+        for member in members:
+            if member in self._function.parameters:
+                return member.name
+        return next((member.name for member in members if member.name), None)
+
+    def _name_variables(self, order: List[ir.Temp]) -> Dict[ir.Temp, str]:
+        roots: Dict[ir.Temp, None] = {}
+        for temp in order:
+            if temp not in self._inlined:
+                roots[self._classes.find(temp)] = None
+
+        by_hint: Dict[str, List[ir.Temp]] = {}
+        for root in roots:
+            hint = self._hint(root)
+            if hint is not None:
+                groups = by_hint.setdefault(hint, [])
+                for group in groups:
+                    if not self._classes.interfere(group, root):
+                        self._classes.union(group, root)
+                        break
+                else:
+                    groups.append(root)
+
+        names: Dict[ir.Temp, str] = {}
+        used: Set[str] = set()
+        counter = itertools.count()
+        for temp in order:
+            root = self._classes.find(temp)
+            if root in names or temp in self._inlined:
+                continue
+            name = self._hint(root)
+            if name is None or name in used:
+                base = name or "tmp"
+                name = next(
+                    f"{base}.{index}"
+                    for index in counter
+                    if f"{base}.{index}" not in used
+                )
+            used.add(name)
+            names[root] = name
+        return names
+
+    def _find_inlined(self) -> Set[ir.Temp]:
+        """
+        Finds intermediate values that are computed right before the only
+        instruction that uses them, the operands of an instruction being
+        computed in order, like the subexpressions of an expression tree.
+        """
+        inlined: Set[ir.Temp] = set()
+        for block in self._function.blocks.values():
+            pending: List[ir.Temp] = []
+            for instruction in block:
+                if self._is_coalesced_copy(instruction):
+                    continue
+                operands = [
+                    value
+                    for value in instruction.uses()
+                    if isinstance(value, ir.Temp) and self._is_inlinable(value)
+                ]
+                if operands and pending[-len(operands) :] == operands:
+                    del pending[-len(operands) :]
+                    inlined.update(operands)
+                elif operands:
+                    pending.clear()
+                dest = instruction.dest
+                if dest is not None and self._is_inlinable(dest):
+                    pending.append(dest)
+                else:
+                    pending.clear()
+                    # ^^^ values computed before a statement and used after it
+                    #     keep their variables
+        return inlined
+
+    def _is_coalesced_copy(self, instruction: ir.Instruction) -> bool:
+        """
+        Checks whether the instruction copies a value into the variable that
+        already holds it, so it generates no code.
+        """
+        return (
+            isinstance(instruction, ir.Copy)
+            and isinstance(instruction.source, ir.Temp)
+            and self._classes.find(instruction.source)
+            is self._classes.find(instruction.dest)
+        )
+
+    def _is_inlinable(self, temp: ir.Temp) -> bool:
+        return (
+            temp.name is None
+            and self._interference.uses.get(temp, 0) == 1
+            and isinstance(
+                self._definitions.get(temp), (ir.BinaryOp, ir.Negate, ir.Call)
+            )
+            and len(self._classes.members(temp)) == 1
+        )
+
+    def lower(self) -> Function:
+        function = self._function
+        parameters = [
+            Parameter(parameter.name, parameter.type)
+            for parameter in function.parameters
+        ]
+        statements = self._lower_region(function.entry.label, None)
+        context = function.context or NO_CONTEXT
+        return Function(
+            function.name,
+            parameters,
+            function.return_type,
+            Block(statements, context),
+            context,
+        )
+
+    def _lower_region(self, label: Optional[str], stop: Optional[str]) -> List[Ast]:
+        statements: List[Ast] = []
+        while label is not None and label != stop:
+            block = self._function.blocks[label]
+            for instruction in block.instructions:
+                statement = self._lower_instruction(instruction)
+                if statement is not None:
+                    statements.append(statement)
+            terminator = block.terminator
+            context = terminator.context or NO_CONTEXT
+            if isinstance(terminator, ir.Jump):
+                label = terminator.target
+            elif isinstance(terminator, ir.Branch):
+                condition = self._expression(terminator.condition, context)
+                declared = set(self._declared)
+                consequence = self._lower_region(
+                    terminator.if_true, terminator.if_false
+                )
+                self._declared = declared
+                statements.append(If(condition, Block(consequence, context), context))
+                label = terminator.if_false
+            else:
+                if terminator.value is not None:
+                    value = self._expression(terminator.value, context)
+                    statements.append(Return(value, context))
+                label = None
+        return statements
+
+    def _lower_instruction(self, instruction: ir.Instruction) -> Optional[Ast]:
+        context = instruction.context or NO_CONTEXT
+        if isinstance(instruction, ir.PrintValue):
+            return Print(self._expression(instruction.value, context), context)
+
+        dest = instruction.dest
+        if dest in self._inlined:
+            return None
+        if self._is_coalesced_copy(instruction):
+            return None
+        if isinstance(instruction, ir.Copy):
+            rhs = self._expression(instruction.source, context)
+        else:
+            rhs = self._build(instruction, context)
+            if self._interference.uses.get(dest, 0) == 0:
+                return rhs
+        return self._store(dest, rhs, context)
+
+    def _store(self, dest: ir.Temp, rhs: Ast, context: SourceContext) -> Ast:
+        root = self._classes.find(dest)
+        name = self._names[root]
+        if name in self._declared:
+            return Assignment(name, rhs, context)
+        self._declared.add(name)
+        return Let(name, self._variable_type(root), rhs, context)
+
+    def _variable_type(self, root: ir.Temp) -> Type:
+        for member in self._classes.members(root):
+            if member.type is not None:
+                return member.type
+        return U8()
+
+    def _expression(self, value: ir.Value, context: SourceContext) -> Ast:
+        if isinstance(value, ir.Const):
+            if value.boolean:
+                return Bool(bool(value.value), context)
+            return Unsignedint(value.value, context)
+        if value in self._inlined:
+            return self._build(self._definitions[value], context)
+        return Identifier(self._names[self._classes.find(value)], context)
+
+    def _build(self, instruction: ir.Instruction, context: SourceContext) -> Ast:
+        context = instruction.context or context
+        if isinstance(instruction, ir.BinaryOp):
+            lhs = self._expression(instruction.lhs, context)
+            rhs = self._expression(instruction.rhs, context)
+            return _OPERATORS[instruction.operator](lhs, rhs, context)
+        if isinstance(instruction, ir.Negate):
+            return Negation(self._expression(instruction.operand, context), context)
+        if isinstance(instruction, ir.Call):
+            arguments = [
+                self._expression(argument, context)
+                for argument in instruction.arguments
+            ]
+            return FunctionCall(instruction.function, arguments, context)
+        raise RuntimeError(f"Cannot build an expression from {instruction}")
+
+
+def lower_function(
+    function: ir.FunctionIr, liveness: Optional[Liveness] = None
+) -> Function:
+    """
+    Lowers the function into the AST. Phis of the function are replaced in
+    place, so the IR should not be used afterwards.
+
+    :param liveness: liveness of the function, computed if not given
+    """
+    if liveness is None:
+        liveness = Liveness(function)
+    return _FunctionLowering(function, liveness).lower()
+
+
+def lower_ir(
+    program: ir.ProgramIr, liveness: Optional[Dict[str, Liveness]] = None
+) -> Program:
+    """
+    :param liveness: liveness of every function by its name, computed if not
+                     given
+    """
+    functions = [
+        lower_function(
+            function, liveness[function.name] if liveness is not None else None
+        )
+        for function in program.functions
+    ]
+    return Program(functions, program.context or NO_CONTEXT)
@@ -0,0 +1,185 @@
+"""
+Optimisation passes over the SSA IR. Passes change functions in place.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from zx64c import ir
+from zx64c.ir.dataflow import Liveness
+
+
+def _replace_uses(function: ir.FunctionIr, replacements: Dict[ir.Temp, ir.Value]):
+    for instruction in function.instructions():
+        instruction.replace_uses(replacements)
+
+
+def _remove_edge(function: ir.FunctionIr, source: str, target: str) -> None:
+    for phi in function.blocks[target].phis:
+        phi.incoming.pop(source, None)
+
+
+def _fold_branches(function: ir.FunctionIr) -> bool:
+    changed = False
+    for block in function.blocks.values():
+        terminator = block.terminator
+        if isinstance(terminator, ir.Branch) and isinstance(
+            terminator.condition, ir.Const
+        ):
+            if terminator.condition.value:
+                taken, skipped = terminator.if_true, terminator.if_false
+            else:
+                taken, skipped = terminator.if_false, terminator.if_true
+            block.terminator = ir.Jump(taken, terminator.context)
+            _remove_edge(function, block.label, skipped)
+            changed = True
+    return changed
+
+
+def _remove_unreachable_blocks(function: ir.FunctionIr) -> bool:
+    reachable = {block.label for block in function.reverse_postorder()}
+    unreachable = [label for label in function.blocks if label not in reachable]
+    for label in unreachable:
+        for successor in function.blocks[label].successors():
+            if successor in reachable:
+                _remove_edge(function, label, successor)
+        del function.blocks[label]
+    return bool(unreachable)
+
+
+def _remove_trivial_phis(function: ir.FunctionIr) -> bool:
+    """
+    Removes phis that merge a single value.
+    """
+    replacements: Dict[ir.Temp, ir.Value] = {}
+    for block in function.blocks.values():
+        kept: List[ir.Phi] = []
+        for phi in block.phis:
+            values = [value for value in phi.incoming.values() if value is not phi.dest]
+            if values and all(value == values[0] for value in values):
+                replacements[phi.dest] = values[0]
+            else:
+                kept.append(phi)
+        block.phis = kept
+    if not replacements:
+        return False
+    for temp, value in replacements.items():
+        while isinstance(value, ir.Temp) and value in replacements:
+            value = replacements[value]
+        replacements[temp] = value
+    _replace_uses(function, replacements)
+    return True
+
+
+def _merge_blocks(function: ir.FunctionIr) -> bool:
+    """
+    Merges every block into its predecessor if it is the only successor of
+    the predecessor and the predecessor is its only predecessor.
+    """
+    changed = False
+    predecessors = function.predecessors()
+    for block in list(function.blocks.values()):
+        if block.label not in function.blocks:
+            continue
+        while isinstance(block.terminator, ir.Jump):
+            target = block.terminator.target
+            merged = function.blocks[target]
+            if predecessors[target] != [block.label] or merged.phis:
+                break
+            del function.blocks[target]
+            block.instructions.extend(merged.instructions)
+            block.terminator = merged.terminator
+            for successor in merged.successors():
+                predecessors[successor] = [
+                    block.label if label == target else label
+                    for label in predecessors[successor]
+                ]
+                for phi in function.blocks[successor].phis:
+                    phi.incoming = {
+                        block.label if label == target else label: value
+                        for label, value in phi.incoming.items()
+                    }
+            changed = True
+    return changed
+
+
+def simplify_cfg(function: ir.FunctionIr) -> None:
+    """
+    Replaces branches on constant conditions with jumps, removes blocks that
+    cannot be reached and phis left with a single value, and merges blocks
+    that always execute one after another.
+    """
+    changed = True
+    while changed:
+        changed = _fold_branches(function)
+        changed |= _remove_unreachable_blocks(function)
+        changed |= _remove_trivial_phis(function)
+        changed |= _merge_blocks(function)
+
+
+def _temps(values: List[ir.Value]) -> List[ir.Temp]:
+    return [value for value in values if isinstance(value, ir.Temp)]
+
+
+def eliminate_dead_values(
+    function: ir.FunctionIr, liveness: Optional[Liveness] = None
+) -> None:
+    """
+    Removes instructions without side effects whose values are not live
+    after them. Calls are kept even if their values are unused. Values used
+    only by removed instructions may die with them, so the liveness is
+    computed again until nothing is removed.
+
+    Blocks that cannot be reached are expected to have been removed by
+    `simplify_cfg`, uses in them do not keep values alive.
+
+    :param liveness: liveness of the function, computed if not given
+    """
+    while True:
+        if liveness is None:
+            liveness = Liveness(function)
+        changed = False
+        for block in function.blocks.values():
+            live = liveness.live_out(block.label)
+            live.update(_temps(block.terminator.uses()))
+            instructions: List[ir.Instruction] = []
+            for instruction in reversed(block.instructions):
+                dest = instruction.dest
+                if (
+                    dest is not None
+                    and dest not in live
+                    and not instruction.has_side_effects
+                ):
+                    changed = True
+                    continue
+                live.discard(dest)
+                live.update(_temps(instruction.uses()))
+                instructions.append(instruction)
+            instructions.reverse()
+            phis = [phi for phi in block.phis if phi.dest in live]
+            changed |= len(phis) != len(block.phis)
+            block.phis = phis
+            block.instructions = instructions
+        if not changed:
+            return
+        liveness = None
+
+
+def simplify_cfg_in_program(program: ir.ProgramIr) -> ir.ProgramIr:
+    for function in program.functions:
+        simplify_cfg(function)
+    return program
+
+
+def eliminate_dead_values_in_program(
+    program: ir.ProgramIr, liveness: Optional[Dict[str, Liveness]] = None
+) -> ir.ProgramIr:
+    """
+    :param liveness: liveness of every function by its name, computed if not
+                     given
+    """
+    for function in program.functions:
+        eliminate_dead_values(
+            function, liveness[function.name] if liveness is not None else None
+        )
+    return program
@@ -1,41 +1,290 @@
+import cProfile
+
+from typing import List, Optional
+
 import click
 
-from zx64c.codegen import Environment, Z80CodegenVisitor, SjasmplusSnapshotVisitor
+from zx64c.ast import Program
+
+from zx64c.codegen import (
+    CodegenOptions,
+    Z80CodegenVisitor,
+    SjasmplusSnapshotVisitor,
+    frameless_savings,
+)
+from zx64c.codegen.cost import estimate_costs
+from zx64c.codegen.z80 import Item, render
+from zx64c.ir.builder import build_ir
+from zx64c.ir.dataflow import compute_liveness, compute_reaching_definitions
+from zx64c.ir.lowering import lower_ir
+from zx64c.ir.passes import eliminate_dead_values_in_program, simplify_cfg_in_program
+from zx64c.optimizer.constant_folding import fold_constants
+from zx64c.optimizer.cse import eliminate_common_subexpressions
+from zx64c.optimizer.dead_code import eliminate_dead_code
+from zx64c.optimizer.inlining import InliningPolicy, InliningReport, inline_functions
+from zx64c.optimizer.pass_manager import ALL_ANALYSES, Analysis, Pass, PassManager
+from zx64c.optimizer.peephole import optimize_peephole
+from zx64c.optimizer.propagation import propagate_values
 from zx64c.parser import Parser, ParseError
+from zx64c.phases import PhaseRecorder
 from zx64c.scanner import Scanner, ScanError
 from zx64c.typechecker import TypecheckerVisitor, TypecheckError
 
 
-@click.command()
-@click.argument("source", type=str)
-def z64c(source: str):
-    with open(source, "r") as file:
-        source_text = file.read()
+def build_pass_manager(
+    optimization_level: int,
+    snapshot_name: str,
+    jobs: int = 1,
+    inline_max_size: int = InliningPolicy.max_size,
+    inline_report: bool = False,
+    frame_report: bool = False,
+    cost_report: Optional[str] = None,
+) -> PassManager:
+    """
+    Returns passes that compile a typechecked program into Z80 code at the
+    given optimization level. Reports are printed to the standard error.
+
+    :param snapshot_name: name of the snapshot file saved by sjasmplus,
+                          without the extension
+    :param cost_report: format of the cost report, "text" or "json", None
+                        disables the report
+    """
+    manager = PassManager(
+        [
+            Analysis("liveness", compute_liveness),
+            Analysis("reaching-definitions", compute_reaching_definitions),
+        ]
+    )
+    manager.add(Pass("fold-constants", fold_constants))
+    if optimization_level >= 2:
+
+        def inline(ast: Program) -> Program:
+            report = InliningReport()
+            policy = InliningPolicy(max_size=inline_max_size)
+            ast = inline_functions(ast, policy, report)
+            if inline_report:
+                click.echo(str(report), err=True)
+            return ast
+
+        manager.add(Pass("inline", inline))
+    if optimization_level >= 1:
+        manager.add(Pass("propagate-values", propagate_values))
+        manager.add(Pass("eliminate-dead-code", eliminate_dead_code))
+        manager.add(Pass("cse", eliminate_common_subexpressions))
+    if optimization_level >= 3:
+        manager.add(Pass("build-ir", build_ir))
+        manager.add(
+            Pass("simplify-cfg", simplify_cfg_in_program, requires=("build-ir",))
+        )
+        manager.add(
+            Pass(
+                "eliminate-dead-values",
+                eliminate_dead_values_in_program,
+                requires=("build-ir", "liveness"),
+            )
+        )
+        manager.add(Pass("lower-ir", lower_ir, requires=("build-ir", "liveness")))
+
+    options = CodegenOptions(
+        tail_calls=optimization_level >= 1,
+        frameless_leaves=optimization_level >= 1,
+        source_lines=cost_report is not None,
+    )
+    if options.frameless_leaves and frame_report:
+
+        def print_frame_report(ast: Program) -> Program:
+            for savings in frameless_savings(ast):
+                click.echo(str(savings), err=True)
+            return ast
+
+        manager.add(Pass("frame-report", print_frame_report, preserves=ALL_ANALYSES))
+
+    def generate_code(ast: Program) -> List[Item]:
+        codegen = Z80CodegenVisitor(jobs=jobs, options=options)
+        sjasmplus_codegen = SjasmplusSnapshotVisitor(codegen, snapshot_name)
+        ast.visit(sjasmplus_codegen)
+        return sjasmplus_codegen.code
+
+    manager.add(Pass("codegen", generate_code))
+    if optimization_level >= 1:
+        manager.add(Pass("peephole", optimize_peephole, requires=("codegen",)))
+    if cost_report is not None:
 
+        def print_cost_report(code: List[Item]) -> List[Item]:
+            report = estimate_costs(code)
+            if cost_report == "json":
+                click.echo(report.to_json(), err=True)
+            else:
+                click.echo(str(report), err=True)
+            return code
+
+        manager.add(
+            Pass(
+                "cost-report",
+                print_cost_report,
+                requires=("codegen",),
+                preserves=ALL_ANALYSES,
+            )
+        )
+
+    return manager
+
+
+def compile_source(
+    source_text: str, manager: PassManager, recorder: PhaseRecorder
+) -> Optional[str]:
+    """
+    Compiles the program running every phase through the recorder. Returns
+    the assembly, or None if the program has errors, which are printed.
+    """
     scanner = Scanner(source_text)
     try:
-        tokens = scanner.scan()
+        tokens = recorder.run("scanner", scanner.scan)
     except ScanError as e:
         print(e.make_error_message())
-        return
+        return None
 
     parser = Parser(tokens)
     try:
-        ast = parser.parse()
+        ast = recorder.run("parser", parser.parse)
     except ParseError as e:
         print(e.make_error_message())
-        return
+        return None
 
     typechecker = TypecheckerVisitor()
     try:
-        ast.visit(typechecker)
+        recorder.run("typechecker", ast.visit, typechecker)
     except TypecheckError as e:
         print(e.make_error_message())
+        return None
+
+    code = recorder.run("codegen", manager.run, ast)
+    return recorder.run("render", render, code)
+
+
+@click.command()
+@click.argument("source", type=str)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to generate code for functions.",
+)
+@click.option(
+    "-O",
+    "optimization_level",
+    type=click.IntRange(0, 3),
+    default=0,
+    help=(
+        "Optimization level, 1 enables constant and copy propagation, dead code"
+        " elimination, common subexpression elimination, tail calls, frameless"
+        " leaf functions and the peephole optimizer, 2 also inlines small"
+        " functions, 3 also optimizes functions in the SSA form."
+    ),
+)
+@click.option(
+    "--inline-max-size",
+    type=click.IntRange(min=0),
+    default=InliningPolicy.max_size,
+    help="Size in AST nodes up to which functions are inlined at every call.",
+)
+@click.option(
+    "--inline-report",
+    is_flag=True,
+    help="Print inlining decisions to the standard error.",
+)
+@click.option(
+    "--frame-report",
+    is_flag=True,
+    help="Print functions generated without a frame to the standard error.",
+)
+@click.option(
+    "--time-passes",
+    is_flag=True,
+    help="Print the time taken by every compilation pass to the standard error.",
+)
+@click.option(
+    "--time-phases",
+    is_flag=True,
+    help=(
+        "Print the time taken by the scanner, the parser, the typechecker, the"
+        " code generator with all passes and the rendering to the standard"
+        " error."
+    ),
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    help=(
+        "Like --time-phases, and also print the peak memory, the number of"
+        " tokens, AST nodes and instructions of every phase. Tracing memory"
+        " slows the compilation down."
+    ),
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Profile the compilation with cProfile and save the stats to the file.",
+)
+@click.option(
+    "--cost-report",
+    is_flag=True,
+    help=(
+        "Print the size and the best and worst case T-states of every function"
+        " and source line to the standard error."
+    ),
+)
+@click.option(
+    "--cost-report-format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    help="Format of the cost report.",
+)
+def z64c(
+    source: str,
+    jobs: int,
+    optimization_level: int,
+    inline_max_size: int,
+    inline_report: bool,
+    frame_report: bool,
+    time_passes: bool,
+    time_phases: bool,
+    stats: bool,
+    profile: Optional[str],
+    cost_report: bool,
+    cost_report_format: str,
+):
+    with open(source, "r") as file:
+        source_text = file.read()
+
+    manager = build_pass_manager(
+        optimization_level,
+        source.rstrip(".zx64c"),
+        jobs=jobs,
+        inline_max_size=inline_max_size,
+        inline_report=inline_report,
+        frame_report=frame_report,
+        cost_report=cost_report_format if cost_report else None,
+    )
+    recorder = PhaseRecorder(detailed=stats)
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        output = compile_source(source_text, manager, recorder)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+    if output is None:
         return
 
-    codegen = Z80CodegenVisitor(Environment())
-    sjasmplus_codegen = SjasmplusSnapshotVisitor(codegen, source.rstrip(".zx64c"))
-    ast.visit(sjasmplus_codegen)
+    if time_phases or stats:
+        click.echo(recorder.report(), err=True)
+    if time_passes:
+        click.echo(manager.report(), err=True)
+    print(output)
 
 
 def main():
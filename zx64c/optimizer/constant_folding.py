@@ -0,0 +1,116 @@
+"""
+Constant folding pass. It runs on the typechecked AST and replaces operations
+on literals with their results, so they are computed at compile time instead
+of at run time. Results wrap around to 8 bits, which is correct for both `u8`
+and `i8` since they share the two's complement representation.
+
+Besides folding it simplifies identities (`x + 0`, `x - 0`, `-(-x)`) and
+removes `if` statements with a constant condition.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from zx64c.ast import (
+    Ast,
+    Program,
+    Block,
+    If,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import AstTransformer
+
+BYTE_MASK = 0xFF
+
+
+def _is_zero(node: Ast) -> bool:
+    return isinstance(node, Unsignedint) and node.value & BYTE_MASK == 0
+
+
+def _literal_value(node: Ast) -> Optional[int]:
+    if isinstance(node, Unsignedint):
+        return node.value & BYTE_MASK
+    if isinstance(node, Bool):
+        return int(node.value)
+    return None
+
+
+def _are_same_kind_literals(lhs: Ast, rhs: Ast) -> bool:
+    return (isinstance(lhs, Unsignedint) and isinstance(rhs, Unsignedint)) or (
+        isinstance(lhs, Bool) and isinstance(rhs, Bool)
+    )
+
+
+class ConstantFoldingVisitor(AstTransformer):
+    def visit_block(self, node: Block) -> Ast:
+        statements = []
+        for statement in node.statements:
+            folded = statement.visit(self)
+            if folded is not None:
+                statements.append(folded)
+        return Block(statements, node.context)
+
+    def visit_if(self, node: If) -> Optional[Ast]:
+        """
+        Returns `None` if the `if` statement can be removed from the enclosing
+        block.
+        """
+        condition = node.condition.visit(self)
+        consequence = node.consequence.visit(self)
+        if isinstance(condition, Bool):
+            return consequence if condition.value else None
+        return If(condition, consequence, node.context)
+
+    def visit_equal(self, node: Equal) -> Ast:
+        lhs = node.lhs.visit(self)
+        rhs = node.rhs.visit(self)
+        if _are_same_kind_literals(lhs, rhs):
+            return Bool(_literal_value(lhs) == _literal_value(rhs), node.context)
+        return Equal(lhs, rhs, node.context)
+
+    def visit_not_equal(self, node: NotEqual) -> Ast:
+        lhs = node.lhs.visit(self)
+        rhs = node.rhs.visit(self)
+        if _are_same_kind_literals(lhs, rhs):
+            return Bool(_literal_value(lhs) != _literal_value(rhs), node.context)
+        return NotEqual(lhs, rhs, node.context)
+
+    def visit_addition(self, node: Addition) -> Ast:
+        lhs = node.lhs.visit(self)
+        rhs = node.rhs.visit(self)
+        if isinstance(lhs, Unsignedint) and isinstance(rhs, Unsignedint):
+            return Unsignedint((lhs.value + rhs.value) & BYTE_MASK, node.context)
+        if _is_zero(rhs):
+            return lhs
+        if _is_zero(lhs):
+            return rhs
+        return Addition(lhs, rhs, node.context)
+
+    def visit_subtraction(self, node: Subtraction) -> Ast:
+        lhs = node.lhs.visit(self)
+        rhs = node.rhs.visit(self)
+        if isinstance(lhs, Unsignedint) and isinstance(rhs, Unsignedint):
+            return Unsignedint((lhs.value - rhs.value) & BYTE_MASK, node.context)
+        if _is_zero(rhs):
+            return lhs
+        if _is_zero(lhs):
+            return Negation(rhs, node.context).visit(self)
+        return Subtraction(lhs, rhs, node.context)
+
+    def visit_negation(self, node: Negation) -> Ast:
+        expression = node.expression.visit(self)
+        if isinstance(expression, Unsignedint):
+            return Unsignedint(-expression.value & BYTE_MASK, node.context)
+        if isinstance(expression, Negation):
+            return expression.expression
+        return Negation(expression, node.context)
+
+
+def fold_constants(program: Program) -> Program:
+    return program.visit(ConstantFoldingVisitor())
@@ -0,0 +1,381 @@
+"""
+Common subexpression elimination pass. It runs on the typechecked AST and
+computes every value at most once within a block of statements.
+
+Expressions are numbered with local value numbering. Two expressions get the
+same value number if they apply the same operator to operands with the same
+value numbers, so `x + y` and `y + x` are recognised as the same value, while
+`x + y` before and after `x = 1` are not. Variables take the value number of
+the expression assigned to them.
+
+An expression whose value is already held by a variable is replaced by that
+variable. An expression that is computed more than once within a block is
+computed into a new local variable at its first occurrence and read from it
+afterwards. Such variables are named with a dot (`cse.0`), so they cannot
+clash with variables from the source, and the register allocator usually
+keeps them in spare registers. Expressions that call functions are never
+reused.
+"""
+from __future__ import annotations
+
+import itertools
+
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import AstTransformer, AstVisitor
+from zx64c.codegen.registers import SAVE_COST
+from zx64c.types import Type, U8
+from zx64c.types import Bool as BoolT
+
+BYTE_MASK = 0xFF
+
+LITERAL_COST = 7
+# ^^^ T-states of `ld a, n`
+VARIABLE_COST = 19
+# ^^^ T-states of `ld a, (ix + d)`, variables kept in registers are cheaper
+OPERATION_COST = 8
+# ^^^ T-states of `ld b, a` and `add a, b`, or of `neg`
+KEEP_COST = 4
+# ^^^ T-states of `ld r, a` or `ld a, r`, to keep a value in a register and to
+#     read it back
+
+
+class _Variables:
+    """
+    Value numbers of variables visible at a point of a function together with
+    variables that hold each value.
+    """
+
+    __slots__ = ("numbers", "types", "holders")
+
+    def __init__(self):
+        self.numbers: Dict[str, int] = {}
+        self.types: Dict[str, Type] = {}
+        self.holders: Dict[int, List[str]] = {}
+
+    def copy(self) -> _Variables:
+        variables = _Variables()
+        variables.numbers = dict(self.numbers)
+        variables.types = dict(self.types)
+        variables.holders = {
+            number: list(names) for number, names in self.holders.items()
+        }
+        return variables
+
+    def assign(self, name: str, number: int) -> None:
+        self.numbers[name] = number
+        self.holders.setdefault(number, []).append(name)
+
+    def get_holder(self, number: int) -> Optional[str]:
+        for name in reversed(self.holders.get(number, ())):
+            if self.numbers.get(name) == number:
+                return name
+        return None
+
+
+class _Occurrences:
+    """
+    Number of times a value is computed in a block and the number of clobber
+    sites (calls and prints) before its first and its last computation.
+    """
+
+    __slots__ = ("count", "first_clobber", "last_clobber")
+
+    def __init__(self, clobber: int):
+        self.count = 0
+        self.first_clobber = clobber
+        self.last_clobber = clobber
+
+    def add(self, clobber: int) -> None:
+        self.count += 1
+        self.last_clobber = clobber
+
+
+class ValueNumberingVisitor(AstVisitor[int]):
+    """
+    Assigns value numbers to expressions of a single function and counts how
+    many times every value is computed in each block. An occurrence of a
+    value counts only if it is not held by a variable already, and operands
+    count only for the first occurrence, because later occurrences reuse the
+    value instead of computing it. A value computed more than once is reused
+    if recomputing it costs more T-states than keeping it in a register,
+    which has to be saved around calls and prints.
+
+    Results of comparisons are only reused if a variable already holds them.
+    Comparisons in `if` conditions branch on the flags, which is cheaper than
+    keeping the result in a variable.
+    """
+
+    def __init__(self):
+        self._table: Dict[Tuple[Hashable, ...], int] = {}
+        self._next_number = itertools.count()
+        self._variables = _Variables()
+        self._counting = True
+        self._occurrences: Dict[int, _Occurrences] = {}
+        self._clobbers = 0
+        self.numbers: Dict[int, int] = {}
+        # ^^^ value number of every expression, by the `id` of its node
+        self.holders: Dict[int, str] = {}
+        # ^^^ variables that already hold values of expressions, by node `id`
+        self.types: Dict[int, Optional[Type]] = {}
+        # ^^^ type of every value, `None` for number literals
+        self.costs: Dict[int, int] = {}
+        # ^^^ estimated T-states needed to compute every value
+        self.reused: Dict[int, Set[int]] = {}
+        # ^^^ values worth reusing in every block, by the `id` of the block
+
+    def _fresh(self, value_type: Optional[Type] = None, cost: int = 0) -> int:
+        number = next(self._next_number)
+        self.types[number] = value_type
+        self.costs[number] = cost
+        return number
+
+    def _number(
+        self, key: Tuple[Hashable, ...], value_type: Optional[Type], cost: int
+    ) -> int:
+        number = self._table.get(key)
+        if number is None:
+            number = self._fresh(value_type, cost)
+            self._table[key] = number
+        return number
+
+    def _is_worth_reusing(self, number: int, occurrences: _Occurrences) -> bool:
+        saved = self.costs[number] * (occurrences.count - 1)
+        clobbers = occurrences.last_clobber - occurrences.first_clobber
+        kept = KEEP_COST * occurrences.count + SAVE_COST * clobbers
+        return occurrences.count > 1 and saved > kept
+
+    def visit_program(self, node: Program) -> int:
+        raise RuntimeError("Values are numbered for each function")
+
+    def visit_function(self, node: Function) -> int:
+        for parameter in node.parameters:
+            self._variables.types[parameter.name] = parameter.type_id
+            number = self._fresh(parameter.type_id, VARIABLE_COST)
+            self._variables.assign(parameter.name, number)
+        return node.code_block.visit(self)
+
+    def visit_block(self, node: Block) -> int:
+        enclosing_occurrences = self._occurrences
+        self._occurrences = {}
+        for statement in node.statements:
+            statement.visit(self)
+        self.reused[id(node)] = {
+            number
+            for number, occurrences in self._occurrences.items()
+            if self._is_worth_reusing(number, occurrences)
+        }
+        self._occurrences = enclosing_occurrences
+        return -1
+
+    def visit_if(self, node: If) -> int:
+        node.condition.visit(self)
+        before = self._variables
+        self._variables = before.copy()
+        node.consequence.visit(self)
+        after = self._variables
+        self._variables = before
+        for name, number in before.numbers.items():
+            if after.numbers[name] != number:
+                # The consequence may or may not have been executed
+                number = self._fresh(before.types[name], VARIABLE_COST)
+                self._variables.assign(name, number)
+        return -1
+
+    def visit_print(self, node: Print) -> int:
+        node.expression.visit(self)
+        self._clobbers += 1
+        return -1
+
+    def visit_let(self, node: Let) -> int:
+        self._variables.types[node.name] = node.var_type
+        self._variables.assign(node.name, node.rhs.visit(self))
+        return -1
+
+    def visit_return(self, node: Return) -> int:
+        node.expr.visit(self)
+        return -1
+
+    def visit_assignment(self, node: Assignment) -> int:
+        self._variables.assign(node.name, node.rhs.visit(self))
+        return -1
+
+    def _visit_operation(
+        self,
+        node: Ast,
+        operator: str,
+        operands: List[Ast],
+        commutative: bool = False,
+        reusable: bool = True,
+    ) -> int:
+        counting = self._counting
+        self._counting = False
+        numbers = [operand.visit(self) for operand in operands]
+        self._counting = counting
+        if commutative:
+            numbers.sort()
+
+        if operator in ("==", "!="):
+            value_type: Optional[Type] = BoolT()
+        else:
+            operand_types = [self.types[number] for number in numbers]
+            value_type = next((t for t in operand_types if t is not None), U8())
+        cost = OPERATION_COST + sum(self.costs[number] for number in numbers)
+        number = self._number((operator, *numbers), value_type, cost)
+        self.numbers[id(node)] = number
+        if not counting:
+            return number
+
+        holder = self._variables.get_holder(number)
+        if holder is not None:
+            self.holders[id(node)] = holder
+            return number
+        occurrences = self._occurrences.get(number)
+        if reusable and occurrences is None:
+            occurrences = _Occurrences(self._clobbers)
+            self._occurrences[number] = occurrences
+        if reusable and occurrences.count > 0:
+            occurrences.add(self._clobbers)
+            return number
+        for operand in operands:
+            operand.visit(self)
+        if reusable:
+            occurrences.add(self._clobbers)
+        return number
+
+    def visit_equal(self, node: Equal) -> int:
+        return self._visit_operation(node, "==", [node.lhs, node.rhs], True, False)
+
+    def visit_not_equal(self, node: NotEqual) -> int:
+        return self._visit_operation(node, "!=", [node.lhs, node.rhs], True, False)
+
+    def visit_addition(self, node: Addition) -> int:
+        return self._visit_operation(node, "+", [node.lhs, node.rhs], True)
+
+    def visit_subtraction(self, node: Subtraction) -> int:
+        return self._visit_operation(node, "-", [node.lhs, node.rhs])
+
+    def visit_negation(self, node: Negation) -> int:
+        return self._visit_operation(node, "neg", [node.expression])
+
+    def visit_function_call(self, node: FunctionCall) -> int:
+        for argument in node.arguments:
+            argument.visit(self)
+        if self._counting:
+            self._clobbers += 1
+        number = self.numbers.get(id(node))
+        if number is None:
+            # Every call may compute a different value
+            number = self._fresh()
+            self.numbers[id(node)] = number
+        return number
+
+    def visit_identifier(self, node: Identifier) -> int:
+        number = self._variables.numbers.get(node.value)
+        if number is None:
+            number = self._fresh(self._variables.types.get(node.value), VARIABLE_COST)
+            self._variables.assign(node.value, number)
+        return number
+
+    def visit_unsignedint(self, node: Unsignedint) -> int:
+        return self._number(("u8", node.value & BYTE_MASK), None, LITERAL_COST)
+
+    def visit_bool(self, node: Bool) -> int:
+        return self._number(("bool", node.value), BoolT(), LITERAL_COST)
+
+
+class CommonSubexpressionVisitor(AstTransformer):
+    """
+    Rewrites a single function with values numbered by
+    `ValueNumberingVisitor`.
+    """
+
+    def __init__(self, values: ValueNumberingVisitor):
+        self._values = values
+        self._temporaries = itertools.count()
+        self._reused: Set[int] = set()
+        self._computed: Dict[int, str] = {}
+        self._pending: List[Ast] = []
+
+    def visit_block(self, node: Block) -> Ast:
+        enclosing = (self._reused, self._computed, self._pending)
+        self._reused = self._values.reused[id(node)]
+        self._computed = {}
+        self._pending = []
+
+        statements: List[Ast] = []
+        for statement in node.statements:
+            transformed = statement.visit(self)
+            statements.extend(self._pending)
+            self._pending.clear()
+            statements.append(transformed)
+
+        self._reused, self._computed, self._pending = enclosing
+        return Block(statements, node.context)
+
+    def _reuse(self, node: Ast, rebuild: Callable[[Ast], Ast]) -> Ast:
+        holder = self._values.holders.get(id(node))
+        if holder is not None:
+            return Identifier(holder, node.context)
+
+        number = self._values.numbers[id(node)]
+        temporary = self._computed.get(number)
+        if temporary is not None:
+            return Identifier(temporary, node.context)
+        if number not in self._reused:
+            return rebuild(node)
+
+        temporary = f"cse.{next(self._temporaries)}"
+        value_type = self._values.types[number]
+        self._pending.append(Let(temporary, value_type, rebuild(node), node.context))
+        self._computed[number] = temporary
+        return Identifier(temporary, node.context)
+
+    def visit_equal(self, node: Equal) -> Ast:
+        return self._reuse(node, super().visit_equal)
+
+    def visit_not_equal(self, node: NotEqual) -> Ast:
+        return self._reuse(node, super().visit_not_equal)
+
+    def visit_addition(self, node: Addition) -> Ast:
+        return self._reuse(node, super().visit_addition)
+
+    def visit_subtraction(self, node: Subtraction) -> Ast:
+        return self._reuse(node, super().visit_subtraction)
+
+    def visit_negation(self, node: Negation) -> Ast:
+        return self._reuse(node, super().visit_negation)
+
+
+def eliminate_common_subexpressions_in_function(function: Function) -> Function:
+    values = ValueNumberingVisitor()
+    function.visit(values)
+    return function.visit(CommonSubexpressionVisitor(values))
+
+
+def eliminate_common_subexpressions(program: Program) -> Program:
+    functions = [
+        eliminate_common_subexpressions_in_function(function)
+        for function in program.functions
+    ]
+    return Program(functions, program.context)
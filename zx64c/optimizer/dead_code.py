@@ -0,0 +1,154 @@
+"""
+Dead code elimination pass. It runs on the typechecked AST and removes code
+that cannot affect the output of the program:
+
+- functions that cannot be reached through calls starting from `main`,
+- statements that follow a `return` in the same block,
+- `if` statements whose condition is constant false, or whose consequence
+  is empty and condition has no side effects,
+- `let` variables that are never read, together with assignments to them.
+  Right-hand sides that call functions are kept as expression statements,
+  because the called function may print.
+"""
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Let,
+    Return,
+    Assignment,
+    Identifier,
+    FunctionCall,
+    Bool,
+)
+from zx64c.ast import AstTransformer, AstWalker
+
+ENTRY_POINT = "main"
+
+
+class UsageVisitor(AstWalker):
+    """
+    Collects names of called functions, read variables and declared `let`
+    variables.
+    """
+
+    def __init__(self):
+        self.calls: Set[str] = set()
+        self.reads: Set[str] = set()
+        self.lets: Set[str] = set()
+
+    def visit_let(self, node: Let) -> None:
+        self.lets.add(node.name)
+        super().visit_let(node)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        self.calls.add(node.function_name)
+        super().visit_function_call(node)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self.reads.add(node.value)
+
+
+def collect_usage(node: Ast) -> UsageVisitor:
+    usage = UsageVisitor()
+    node.visit(usage)
+    return usage
+
+
+def has_side_effects(node: Ast) -> bool:
+    return bool(collect_usage(node).calls)
+
+
+def reachable_functions(program: Program, entry: str = ENTRY_POINT) -> Set[str]:
+    """
+    Returns names of functions reachable through calls from the entry point.
+    """
+    calls: Dict[str, Set[str]] = {
+        function.name: collect_usage(function).calls for function in program.functions
+    }
+    reachable = set()
+    worklist = [entry]
+    while worklist:
+        name = worklist.pop()
+        if name in reachable or name not in calls:
+            continue
+        reachable.add(name)
+        worklist.extend(calls[name])
+    return reachable
+
+
+class DeadCodeEliminationVisitor(AstTransformer):
+    """
+    Removes dead statements of a single function.
+
+    :param unused: `let` variables that are never read
+    """
+
+    def __init__(self, unused: Iterable[str] = ()):
+        self._unused: FrozenSet[str] = frozenset(unused)
+        self.changed = False
+
+    def visit_block(self, node: Block) -> Ast:
+        statements = []
+        for index, statement in enumerate(node.statements):
+            transformed = statement.visit(self)
+            if transformed is not None:
+                statements.append(transformed)
+            if isinstance(statement, Return):
+                self.changed |= index < len(node.statements) - 1
+                break
+        return Block(statements, node.context)
+
+    def visit_if(self, node: If) -> Optional[Ast]:
+        condition = node.condition
+        if isinstance(condition, Bool):
+            self.changed = True
+            return node.consequence.visit(self) if condition.value else None
+        consequence = node.consequence.visit(self)
+        if not consequence.statements and not has_side_effects(condition):
+            self.changed = True
+            return None
+        return If(condition.visit(self), consequence, node.context)
+
+    def visit_let(self, node: Let) -> Optional[Ast]:
+        if node.name not in self._unused:
+            return super().visit_let(node)
+        return self._remove_store(node.rhs)
+
+    def visit_assignment(self, node: Assignment) -> Optional[Ast]:
+        if node.name not in self._unused:
+            return super().visit_assignment(node)
+        return self._remove_store(node.rhs)
+
+    def _remove_store(self, rhs: Ast) -> Optional[Ast]:
+        self.changed = True
+        if has_side_effects(rhs):
+            return rhs.visit(self)
+        return None
+
+
+def eliminate_dead_code_in_function(function: Function) -> Function:
+    while True:
+        usage = collect_usage(function)
+        visitor = DeadCodeEliminationVisitor(usage.lets - usage.reads)
+        function = function.visit(visitor)
+        if not visitor.changed:
+            return function
+
+
+def eliminate_dead_code(program: Program) -> Program:
+    if ENTRY_POINT not in {function.name for function in program.functions}:
+        return program
+    reachable = reachable_functions(program)
+    functions: List[Function] = [
+        eliminate_dead_code_in_function(function)
+        for function in program.functions
+        if function.name in reachable
+    ]
+    return Program(functions, program.context)
@@ -0,0 +1,398 @@
+"""
+Function inlining pass. It runs on the typechecked AST and replaces calls to
+small functions with their bodies, which saves the argument pushes, the
+`call` and the prologue and epilogue of the callee.
+
+Statements cannot be nested in expressions, so only calls that form the
+whole right-hand side of a statement are inlined, e.g. `f(x)`,
+`let y: u8 = f(x)`, `y = f(x)`, `print(f(x))` or `return f(x)`. Parameters
+of the callee become local variables of the caller initialised with the
+arguments. Local variables of the callee are renamed, so they cannot clash
+with variables of the caller. The callee must not be recursive and may only
+return at the end of its body.
+
+Whether a call is inlined is decided by `InliningPolicy`, which weighs the
+size of the callee body against the number of its call sites. Every
+decision is recorded in `InliningReport`.
+"""
+from __future__ import annotations
+
+import collections
+import itertools
+
+from dataclasses import dataclass
+from typing import Callable, Counter, Dict, List, Optional, Set
+
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    Identifier,
+    FunctionCall,
+    Unsignedint,
+    Bool,
+)
+from zx64c.ast import AstTransformer, AstWalker
+from zx64c.optimizer.dead_code import collect_usage
+
+
+@dataclass(frozen=True)
+class InliningPolicy:
+    """
+    Thresholds of the inlining cost model. Sizes are counted in AST nodes.
+
+    :param max_size: functions up to this size are inlined at every call site
+    :param max_single_call_size: functions called from a single place are
+                                 inlined up to this size, the call is the only
+                                 use of the function, so its code goes away
+    :param max_caller_size: calls are not inlined into functions that have
+                            already grown beyond this size
+    """
+
+    max_size: int = 16
+    max_single_call_size: int = 64
+    max_caller_size: int = 512
+
+
+@dataclass(frozen=True)
+class InliningDecision:
+    caller: str
+    callee: str
+    inlined: bool
+    reason: str
+
+    def __str__(self):
+        verdict = "inlined" if self.inlined else "not inlined"
+        return f"{self.caller} -> {self.callee}: {verdict} ({self.reason})"
+
+
+class InliningReport:
+    def __init__(self):
+        self.decisions: List[InliningDecision] = []
+
+    def record(self, caller: str, callee: str, inlined: bool, reason: str) -> None:
+        self.decisions.append(InliningDecision(caller, callee, inlined, reason))
+
+    @property
+    def inlined(self) -> List[InliningDecision]:
+        return [decision for decision in self.decisions if decision.inlined]
+
+    def __str__(self):
+        return "\n".join(str(decision) for decision in self.decisions)
+
+
+class SizeVisitor(AstWalker):
+    """
+    Counts AST nodes of the visited tree, blocks excluded, and calls to every
+    function.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.calls: Counter[str] = collections.Counter()
+
+    def visit_if(self, node: If) -> None:
+        self.size += 1
+        super().visit_if(node)
+
+    def visit_print(self, node: Print) -> None:
+        self.size += 1
+        super().visit_print(node)
+
+    def visit_let(self, node: Let) -> None:
+        self.size += 1
+        super().visit_let(node)
+
+    def visit_return(self, node: Return) -> None:
+        self.size += 1
+        super().visit_return(node)
+
+    def visit_assignment(self, node: Assignment) -> None:
+        self.size += 1
+        super().visit_assignment(node)
+
+    def visit_equal(self, node: Equal) -> None:
+        self.size += 1
+        super().visit_equal(node)
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        self.size += 1
+        super().visit_not_equal(node)
+
+    def visit_addition(self, node: Addition) -> None:
+        self.size += 1
+        super().visit_addition(node)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        self.size += 1
+        super().visit_subtraction(node)
+
+    def visit_negation(self, node: Negation) -> None:
+        self.size += 1
+        super().visit_negation(node)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        self.size += 1
+        self.calls[node.function_name] += 1
+        super().visit_function_call(node)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self.size += 1
+
+    def visit_unsignedint(self, node: Unsignedint) -> None:
+        self.size += 1
+
+    def visit_bool(self, node: Bool) -> None:
+        self.size += 1
+
+
+def _measure(node: Ast) -> SizeVisitor:
+    visitor = SizeVisitor()
+    node.visit(visitor)
+    return visitor
+
+
+class _ReturnCounter(AstWalker):
+    def __init__(self):
+        self.returns = 0
+
+    def visit_return(self, node: Return) -> None:
+        self.returns += 1
+
+
+def _has_single_exit(function: Function) -> bool:
+    """
+    Checks that the function can only return at the end of its body.
+    """
+    counter = _ReturnCounter()
+    function.visit(counter)
+    statements = function.code_block.statements
+    ends_with_return = bool(statements) and isinstance(statements[-1], Return)
+    return counter.returns == int(ends_with_return)
+
+
+def recursive_functions(program: Program) -> Set[str]:
+    """
+    Returns names of functions that can call themselves, directly or through
+    other functions.
+    """
+    calls = {
+        function.name: set(_measure(function).calls) for function in program.functions
+    }
+    recursive = set()
+    for name in calls:
+        visited: Set[str] = set()
+        worklist = list(calls[name])
+        while worklist:
+            callee = worklist.pop()
+            if callee == name:
+                recursive.add(name)
+                break
+            if callee in visited or callee not in calls:
+                continue
+            visited.add(callee)
+            worklist.extend(calls[callee])
+    return recursive
+
+
+def _discard(value: Ast) -> Optional[Ast]:
+    """
+    Keeps the result of an inlined call, whose value is not used, only if it
+    has side effects.
+    """
+    return value if _measure(value).calls else None
+
+
+class _Renamer(AstTransformer):
+    def __init__(self, names: Dict[str, str]):
+        self._names = names
+
+    def visit_let(self, node: Let) -> Ast:
+        return Let(
+            self._names.get(node.name, node.name),
+            node.var_type,
+            node.rhs.visit(self),
+            node.context,
+        )
+
+    def visit_assignment(self, node: Assignment) -> Ast:
+        return Assignment(
+            self._names.get(node.name, node.name), node.rhs.visit(self), node.context
+        )
+
+    def visit_identifier(self, node: Identifier) -> Ast:
+        return Identifier(self._names.get(node.value, node.value), node.context)
+
+
+class InliningVisitor(AstTransformer):
+    """
+    Inlines calls within a single caller function.
+
+    :param functions: functions that may be inlined, by name
+    :param calls: number of call sites of every function in the program
+    :param recursive: names of recursive functions, these are never inlined
+    """
+
+    def __init__(
+        self,
+        functions: Dict[str, Function],
+        calls: Counter[str],
+        recursive: Set[str],
+        policy: InliningPolicy,
+        report: InliningReport,
+    ):
+        self._functions = functions
+        self._calls = calls
+        self._recursive = recursive
+        self._policy = policy
+        self._report = report
+        self._caller = ""
+        self._caller_size = 0
+        self._instances = itertools.count()
+
+    def visit_function(self, node: Function) -> Ast:
+        self._caller = node.name
+        self._caller_size = _measure(node).size
+        return super().visit_function(node)
+
+    def visit_block(self, node: Block) -> Ast:
+        statements: List[Ast] = []
+        for statement in node.statements:
+            inlined = self._inline_statement(statement)
+            if inlined is None:
+                statements.append(statement.visit(self))
+            else:
+                statements.extend(inlined)
+        return Block(statements, node.context)
+
+    def _inline_statement(self, statement: Ast) -> Optional[List[Ast]]:
+        """
+        Returns statements replacing the given one or None if it does not
+        consist of a call that can be inlined.
+        """
+        if isinstance(statement, FunctionCall):
+            call, rebuild = statement, _discard
+        elif isinstance(statement, Let):
+            call = statement.rhs
+
+            def rebuild(value: Ast) -> Ast:
+                return Let(statement.name, statement.var_type, value, statement.context)
+
+        elif isinstance(statement, Assignment):
+            call = statement.rhs
+
+            def rebuild(value: Ast) -> Ast:
+                return Assignment(statement.name, value, statement.context)
+
+        elif isinstance(statement, Print):
+            call = statement.expression
+
+            def rebuild(value: Ast) -> Ast:
+                return Print(value, statement.context)
+
+        elif isinstance(statement, Return):
+            call = statement.expr
+
+            def rebuild(value: Ast) -> Ast:
+                return Return(value, statement.context)
+
+        else:
+            return None
+
+        if not isinstance(call, FunctionCall) or not self._should_inline(call):
+            return None
+        return self._expand(call, rebuild)
+
+    def _should_inline(self, call: FunctionCall) -> bool:
+        name = call.function_name
+        callee = self._functions.get(name)
+        if callee is None:
+            return False
+
+        reason = None
+        size = _measure(callee.code_block).size
+        if name in self._recursive:
+            reason = "recursive"
+        elif not _has_single_exit(callee):
+            reason = "returns before the end of its body"
+        elif self._caller_size > self._policy.max_caller_size:
+            reason = f"caller size {self._caller_size} over limit"
+        elif size > self._policy.max_single_call_size or (
+            size > self._policy.max_size and self._calls[name] > 1
+        ):
+            reason = f"size {size}, {self._calls[name]} call site(s)"
+
+        if reason is not None:
+            self._report.record(self._caller, name, False, reason)
+            return False
+        self._report.record(
+            self._caller, name, True, f"size {size}, {self._calls[name]} call site(s)"
+        )
+        self._caller_size += size
+        return True
+
+    def _expand(
+        self, call: FunctionCall, rebuild: Callable[[Ast], Optional[Ast]]
+    ) -> List[Ast]:
+        callee = self._functions[call.function_name]
+        instance = next(self._instances)
+        usage = collect_usage(callee)
+        local_names = [parameter.name for parameter in callee.parameters]
+        local_names.extend(sorted(usage.lets))
+        names = {name: f"{callee.name}.{instance}.{name}" for name in local_names}
+        # ^^^ names with a dot cannot be written in the source, so they cannot
+        #     clash with variables of the caller
+
+        statements: List[Ast] = [
+            Let(names[parameter.name], parameter.type_id, argument, call.context)
+            for parameter, argument in zip(callee.parameters, call.arguments)
+        ]
+        body = callee.code_block.visit(_Renamer(names)).statements
+        result = None
+        if body and isinstance(body[-1], Return):
+            result = body[-1].expr
+            body = body[:-1]
+        statements.extend(body)
+        if result is not None:
+            replacement = rebuild(result)
+            if replacement is not None:
+                statements.append(replacement)
+        return statements
+
+
+def inline_functions(
+    program: Program,
+    policy: Optional[InliningPolicy] = None,
+    report: Optional[InliningReport] = None,
+) -> Program:
+    if policy is None:
+        policy = InliningPolicy()
+    if report is None:
+        report = InliningReport()
+
+    calls: Counter[str] = collections.Counter()
+    for function in program.functions:
+        calls.update(_measure(function).calls)
+    recursive = recursive_functions(program)
+
+    inlined: Dict[str, Function] = {}
+    functions = []
+    for function in program.functions:
+        # Functions can only call functions defined before them, so callees
+        # are already processed and their own calls are inlined
+        visitor = InliningVisitor(inlined, calls, recursive, policy, report)
+        function = function.visit(visitor)
+        inlined[function.name] = function
+        functions.append(function)
+    return Program(functions, program.context)
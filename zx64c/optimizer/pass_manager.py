@@ -0,0 +1,131 @@
+"""
+Pass manager. It runs a pipeline of passes over a program, checks that
+every pass runs after the passes it depends on, caches results of analyses
+until a pass that does not preserve them runs, and measures the time taken
+by every pass and analysis.
+
+A pass takes the program and returns the transformed one, which does not
+have to be of the same kind: passes turn the AST into the IR, the IR back
+into the AST and the AST into Z80 code.
+"""
+from __future__ import annotations
+
+import time
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+ALL_ANALYSES = ("*",)
+# ^^^ `preserves` of passes that do not change the program
+
+
+@dataclass(frozen=True)
+class Analysis:
+    """
+    Computes facts about a program without changing it.
+    """
+
+    name: str
+    compute: Callable[[Any], Any]
+
+
+@dataclass(frozen=True)
+class Pass:
+    """
+    :param name: name used in dependencies of other passes and in timings
+    :param run: transforms the program, it gets results of the required
+                analyses as additional arguments, in the order of `requires`
+    :param requires: names of passes that have to run before this one and of
+                     analyses needed by `run`
+    :param preserves: names of analyses that stay valid after the pass, all
+                      other results are invalidated
+    """
+
+    name: str
+    run: Callable[..., Any]
+    requires: Tuple[str, ...] = ()
+    preserves: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class PassTiming:
+    name: str
+    seconds: float
+    analysis: bool = False
+
+    def __str__(self):
+        kind = " (analysis)" if self.analysis else ""
+        return f"{self.name}{kind}: {self.seconds * 1000:.3f} ms"
+
+
+class PassManager:
+    def __init__(self, analyses: List[Analysis] = ()):
+        self._analyses: Dict[str, Analysis] = {
+            analysis.name: analysis for analysis in analyses
+        }
+        self._passes: List[Pass] = []
+        self._results: Dict[str, Any] = {}
+        self.timings: List[PassTiming] = []
+
+    @property
+    def passes(self) -> List[str]:
+        return [pass_.name for pass_ in self._passes]
+
+    def add(self, pass_: Pass) -> None:
+        """
+        Appends the pass to the pipeline.
+
+        :raises ValueError: if a required pass is not in the pipeline yet or
+                            a required analysis is not registered
+        """
+        scheduled = set(self.passes)
+        for name in pass_.requires:
+            if name not in scheduled and name not in self._analyses:
+                raise ValueError(
+                    f"Pass {pass_.name} requires {name}, which is neither an"
+                    " earlier pass nor a registered analysis"
+                )
+        self._passes.append(pass_)
+
+    def get_analysis(self, name: str, program: Any) -> Any:
+        """
+        Returns the result of the analysis of the program, computing it only
+        if it has been invalidated since it was last computed.
+        """
+        if name not in self._results:
+            start = time.perf_counter()
+            self._results[name] = self._analyses[name].compute(program)
+            seconds = time.perf_counter() - start
+            self.timings.append(PassTiming(name, seconds, analysis=True))
+        return self._results[name]
+
+    def run(self, program: Any) -> Any:
+        self._results.clear()
+        self.timings = []
+        for pass_ in self._passes:
+            results = [
+                self.get_analysis(name, program)
+                for name in pass_.requires
+                if name in self._analyses
+            ]
+            start = time.perf_counter()
+            program = pass_.run(program, *results)
+            self.timings.append(PassTiming(pass_.name, time.perf_counter() - start))
+            self._invalidate(pass_.preserves)
+        return program
+
+    def _invalidate(self, preserves: Tuple[str, ...]) -> None:
+        if preserves == ALL_ANALYSES:
+            return
+        for name in list(self._results):
+            if name not in preserves:
+                del self._results[name]
+
+    def report(self) -> str:
+        """
+        Returns timings of the last run, one pass or analysis per line.
+        """
+        lines = [str(timing) for timing in self.timings]
+        total = sum(timing.seconds for timing in self.timings)
+        lines.append(f"total: {total * 1000:.3f} ms")
+        return "\n".join(lines)
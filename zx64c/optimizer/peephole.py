@@ -0,0 +1,478 @@
+"""
+Peephole optimizer working on the generated Z80 code.
+
+The optimizer slides a small window over the instructions of every function
+and rewrites sequences that match one of the `RULES`. A rule is declared as a
+pattern of instruction templates together with its replacement. Templates
+may use `Wildcard` operands, which bind to the operand found in the code and
+are substituted into the replacement. Some rewrites are only valid when the
+registers or flags they change are not used afterwards, rules list those
+locations in `dead` and the optimizer checks them by following the control
+flow of the function. Rewriting is repeated until no rule applies anymore.
+
+"""
+
+from __future__ import annotations
+
+import collections
+
+from dataclasses import dataclass, field
+from typing import (
+    Callable,
+    Counter,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from zx64c.codegen.z80 import (
+    FLAGS,
+    Item,
+    Instruction,
+    Label,
+    Directive,
+    Comment,
+    Location,
+    Opcode,
+    Operand,
+    Register,
+    Condition,
+    Immediate,
+    LabelRef,
+    Indirect,
+    Indexed,
+    split_functions,
+)
+
+_HIGH_LOW = {
+    Register.BC: (Register.B, Register.C),
+    Register.DE: (Register.D, Register.E),
+    Register.HL: (Register.H, Register.L),
+}
+
+
+@dataclass(frozen=True)
+class Wildcard:
+    """
+    Placeholder operand of a rule pattern. All occurrences of a wildcard with
+    the same name within a pattern must match the same operand.
+    """
+
+    name: str
+    accepts: Callable[[Operand], bool] = field(compare=False, default=lambda _: True)
+
+
+Bindings = Dict[str, Operand]
+Replacement = Union[
+    Tuple[Instruction, ...], Callable[[Bindings], Tuple[Instruction, ...]]
+]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    :param replacement: instruction templates replacing the matched sequence
+                        or a function building them from the bindings
+    :param dead: locations that must not be read after the matched sequence
+                 before they are written again, a wildcard stands for the
+                 register bound to it
+    :param guard: additional condition that must hold for the rewrite
+    """
+
+    name: str
+    pattern: Tuple[Instruction, ...]
+    replacement: Replacement
+    dead: FrozenSet[Union[Location, Wildcard]] = frozenset()
+    guard: Optional[Callable[[Match], bool]] = None
+
+
+def _is_8bit_register(operand: Operand) -> bool:
+    return isinstance(operand, Register) and operand.is_8bit
+
+
+def _is_alu_source(operand: Operand) -> bool:
+    """
+    Operands that can be used both in `ld a, ...` and in 8-bit arithmetic.
+    """
+    return (
+        _is_8bit_register(operand)
+        or isinstance(operand, (Immediate, Indexed))
+        or operand == Indirect(Register.HL)
+    )
+
+
+def _is_16bit_register(operand: Operand) -> bool:
+    return operand in (Register.AF, Register.BC, Register.DE, Register.HL)
+
+
+def _is_register_pair(operand: Operand) -> bool:
+    """
+    16-bit registers whose halves can be loaded separately.
+    """
+    return operand in _HIGH_LOW
+
+
+def _is_label(operand: Operand) -> bool:
+    return isinstance(operand, LabelRef)
+
+
+def _is_condition(operand: Operand) -> bool:
+    return isinstance(operand, Condition)
+
+
+R = Wildcard("r", _is_8bit_register)
+R1 = Wildcard("r1", _is_8bit_register)
+R2 = Wildcard("r2", _is_8bit_register)
+RR = Wildcard("rr", _is_16bit_register)
+PAIR1 = Wildcard("pair1", _is_register_pair)
+PAIR2 = Wildcard("pair2", _is_register_pair)
+ANY = Wildcard("any")
+VARIABLE = Wildcard("variable", lambda operand: isinstance(operand, Indexed))
+RHS = Wildcard("rhs", lambda operand: _is_alu_source(operand) and operand != Register.B)
+TARGET = Wildcard("target", _is_label)
+CONDITION = Wildcard("condition", _is_condition)
+
+
+def _ld(dst: Operand, src: Operand) -> Instruction:
+    return Instruction(Opcode.LD, dst, src)
+
+
+def _jumps_to_next_label(match: Match) -> bool:
+    return match.falls_through_to(match.bindings["target"])
+
+
+def _different_pairs(match: Match) -> bool:
+    return match.bindings["pair1"] != match.bindings["pair2"]
+
+
+def _copy_pair(bindings: Bindings) -> Tuple[Instruction, ...]:
+    dst_high, dst_low = _HIGH_LOW[bindings["pair2"]]
+    src_high, src_low = _HIGH_LOW[bindings["pair1"]]
+    return (_ld(dst_high, src_high), _ld(dst_low, src_low))
+
+
+RULES: Tuple[Rule, ...] = (
+    Rule(
+        "reload-after-store",
+        (_ld(VARIABLE, Register.A), _ld(Register.A, VARIABLE)),
+        (_ld(VARIABLE, Register.A),),
+    ),
+    Rule(
+        "store-after-load",
+        (_ld(Register.A, VARIABLE), _ld(VARIABLE, Register.A)),
+        (_ld(Register.A, VARIABLE),),
+    ),
+    Rule(
+        "add-operand-directly",
+        (
+            _ld(Register.B, Register.A),
+            _ld(Register.A, RHS),
+            Instruction(Opcode.ADD, Register.A, Register.B),
+        ),
+        (Instruction(Opcode.ADD, Register.A, RHS),),
+        dead=frozenset([Location.B]),
+    ),
+    Rule(
+        "subtract-operand-directly",
+        (
+            _ld(Register.B, Register.A),
+            _ld(Register.A, RHS),
+            Instruction(Opcode.NEG),
+            Instruction(Opcode.ADD, Register.A, Register.B),
+        ),
+        (Instruction(Opcode.SUB, RHS),),
+        dead=frozenset([Location.B, Location.CARRY_FLAG, Location.OTHER_FLAGS]),
+    ),
+    Rule(
+        "compare-operand-directly",
+        (
+            _ld(Register.B, Register.A),
+            _ld(Register.A, RHS),
+            Instruction(Opcode.CP, Register.B),
+        ),
+        (Instruction(Opcode.CP, RHS),),
+        dead=frozenset(
+            [Location.A, Location.B, Location.CARRY_FLAG, Location.OTHER_FLAGS]
+        ),
+    ),
+    Rule(
+        "push-pop-same-register",
+        (Instruction(Opcode.PUSH, RR), Instruction(Opcode.POP, RR)),
+        (),
+    ),
+    Rule(
+        "push-pop-into-other-register",
+        (Instruction(Opcode.PUSH, PAIR1), Instruction(Opcode.POP, PAIR2)),
+        _copy_pair,
+        guard=_different_pairs,
+    ),
+    Rule(
+        "copy-back",
+        (_ld(R1, R2), _ld(R2, R1)),
+        (_ld(R1, R2),),
+    ),
+    Rule(
+        "zero-with-xor",
+        (_ld(Register.A, Immediate(0)),),
+        (Instruction(Opcode.XOR, Register.A),),
+        dead=FLAGS,
+    ),
+    Rule(
+        "dead-load",
+        (_ld(R, ANY),),
+        (),
+        dead=frozenset([R]),
+    ),
+    Rule(
+        "jump-to-next-label",
+        (Instruction(Opcode.JP, TARGET),),
+        (),
+        guard=_jumps_to_next_label,
+    ),
+    Rule(
+        "relative-jump-to-next-label",
+        (Instruction(Opcode.JR, TARGET),),
+        (),
+        guard=_jumps_to_next_label,
+    ),
+    Rule(
+        "conditional-jump-to-next-label",
+        (Instruction(Opcode.JP, CONDITION, TARGET),),
+        (),
+        guard=_jumps_to_next_label,
+    ),
+    Rule(
+        "conditional-relative-jump-to-next-label",
+        (Instruction(Opcode.JR, CONDITION, TARGET),),
+        (),
+        guard=_jumps_to_next_label,
+    ),
+)
+
+
+class Match:
+    """
+    Sequence of instructions in a function matched by a rule pattern.
+    """
+
+    def __init__(
+        self, function: _Function, positions: Sequence[int], bindings: Bindings
+    ):
+        self.function = function
+        self.positions = positions
+        self.bindings = bindings
+
+    def is_dead(self, locations: FrozenSet[Location]) -> bool:
+        return self.function.is_dead(self.positions[-1] + 1, locations)
+
+    def falls_through_to(self, target: LabelRef) -> bool:
+        return self.function.falls_through_to(self.positions[-1] + 1, target.name)
+
+
+class _Function:
+    """
+    Code of a single function, i.e. items from its global label up to the
+    next global label. Local labels are only visible within the function.
+    """
+
+    def __init__(self, items: List[Item]):
+        self.items = items
+
+    def label_position(self, name: str) -> Optional[int]:
+        for position, item in enumerate(self.items):
+            if isinstance(item, Label) and item.name == name:
+                return position
+        return None
+
+    def is_dead(self, start: int, locations: Iterable[Location]) -> bool:
+        """
+        Checks that none of the locations is read on any path starting at
+        `start` before being written. Paths that leave the function
+        other than by `ret` are assumed to read everything.
+        """
+        worklist = [(start, frozenset(locations))]
+        visited = set()
+        while worklist:
+            state = worklist.pop()
+            position, live = state
+            while live:
+                if (position, live) in visited:
+                    break
+                visited.add((position, live))
+                if position >= len(self.items):
+                    return False
+                item = self.items[position]
+                position += 1
+                if isinstance(item, (Label, Comment)):
+                    continue
+                if isinstance(item, Directive):
+                    return False
+                if item.reads & live:
+                    return False
+                if item.opcode in (Opcode.JP, Opcode.JR, Opcode.DJNZ):
+                    target = self._jump_target(item)
+                    if target is None:
+                        return False
+                    if len(item.operands) == 1 and item.opcode is not Opcode.DJNZ:
+                        position = target
+                        continue
+                    worklist.append((target, live - item.writes))
+                elif item.opcode is Opcode.RET:
+                    if not item.operands:
+                        break
+                live = live - item.writes
+        return True
+
+    def _jump_target(self, instruction: Instruction) -> Optional[int]:
+        target = instruction.operands[-1]
+        if not isinstance(target, LabelRef) or not target.name.startswith("."):
+            return None
+        return self.label_position(target.name)
+
+    def falls_through_to(self, start: int, name: str) -> bool:
+        for item in self.items[start:]:
+            if isinstance(item, Comment):
+                continue
+            if not isinstance(item, Label):
+                return False
+            if item.name == name:
+                return True
+        return False
+
+
+def _match_operand(template: Operand, operand: Operand, bindings: Bindings) -> bool:
+    if not isinstance(template, Wildcard):
+        return template == operand
+    if template.name in bindings:
+        return bindings[template.name] == operand
+    if not template.accepts(operand):
+        return False
+    bindings[template.name] = operand
+    return True
+
+
+def _match_instruction(
+    template: Instruction, instruction: Instruction, bindings: Bindings
+) -> bool:
+    return (
+        template.opcode is instruction.opcode
+        and len(template.operands) == len(instruction.operands)
+        and all(
+            _match_operand(expected, operand, bindings)
+            for expected, operand in zip(template.operands, instruction.operands)
+        )
+    )
+
+
+def _substitute(template: Instruction, bindings: Bindings) -> Instruction:
+    operands = [
+        bindings[operand.name] if isinstance(operand, Wildcard) else operand
+        for operand in template.operands
+    ]
+    return Instruction(template.opcode, *operands)
+
+
+class PeepholeOptimizer:
+    """
+    Applies `rules` to the code until none of them matches. The number of
+    rewrites done by each rule is counted in `hits`.
+    """
+
+    def __init__(self, rules: Sequence[Rule] = RULES):
+        self._rules = rules
+        self._window = max(len(rule.pattern) for rule in rules)
+        self.hits: Counter[str] = collections.Counter()
+
+    def optimize(self, code: Iterable[Item]) -> List[Item]:
+        optimized: List[Item] = []
+        for function in split_functions(code):
+            optimized.extend(self._optimize_function(_Function(function)))
+        return optimized
+
+    def _optimize_function(self, function: _Function) -> List[Item]:
+        items = function.items
+        position = 0
+        while position < len(items):
+            if self._rewrite(function, position):
+                position = max(0, position - self._window)
+            else:
+                position += 1
+        return items
+
+    def _rewrite(self, function: _Function, position: int) -> bool:
+        if not isinstance(function.items[position], Instruction):
+            return False
+        positions = self._window_positions(function.items, position)
+        for rule in self._rules:
+            match = self._match(rule, function, positions)
+            if match is None:
+                continue
+            if rule.dead and not match.is_dead(self._dead(rule, match.bindings)):
+                continue
+            if rule.guard is not None and not rule.guard(match):
+                continue
+            self._replace(function, match, self._replacement(rule, match.bindings))
+            self.hits[rule.name] += 1
+            return True
+        return False
+
+    def _window_positions(self, items: List[Item], position: int) -> List[int]:
+        positions = []
+        for index in range(position, len(items)):
+            if len(positions) == self._window:
+                break
+            item = items[index]
+            if isinstance(item, Comment):
+                continue
+            if not isinstance(item, Instruction):
+                break
+            positions.append(index)
+        return positions
+
+    @staticmethod
+    def _match(
+        rule: Rule, function: _Function, positions: List[int]
+    ) -> Optional[Match]:
+        if len(rule.pattern) > len(positions):
+            return None
+        bindings: Bindings = {}
+        for template, index in zip(rule.pattern, positions):
+            if not _match_instruction(template, function.items[index], bindings):
+                return None
+        return Match(function, positions[: len(rule.pattern)], bindings)
+
+    @staticmethod
+    def _dead(rule: Rule, bindings: Bindings) -> FrozenSet[Location]:
+        locations = set()
+        for location in rule.dead:
+            if isinstance(location, Wildcard):
+                register = bindings[location.name]
+                locations.add(Location[register.name])
+            else:
+                locations.add(location)
+        return frozenset(locations)
+
+    @staticmethod
+    def _replacement(rule: Rule, bindings: Bindings) -> Tuple[Instruction, ...]:
+        if callable(rule.replacement):
+            return rule.replacement(bindings)
+        return tuple(_substitute(template, bindings) for template in rule.replacement)
+
+    @staticmethod
+    def _replace(
+        function: _Function, match: Match, replacement: Tuple[Instruction, ...]
+    ) -> None:
+        first, last = match.positions[0], match.positions[-1]
+        comments = [
+            item for item in function.items[first:last] if isinstance(item, Comment)
+        ]
+        function.items[first : last + 1] = list(replacement) + comments
+
+
+def optimize_peephole(code: Iterable[Item]) -> List[Item]:
+    return PeepholeOptimizer().optimize(code)
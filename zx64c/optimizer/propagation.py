@@ -0,0 +1,191 @@
+"""
+Constant and copy propagation pass. It runs on the typechecked AST and
+substitutes values of variables that are known at compile time into the
+expressions that read them:
+
+- a variable assigned a literal is replaced with the literal, so
+  `let shift: u8 = 48` followed by `digit + shift` becomes `digit + 48`, and
+  the addition is generated with an immediate operand,
+- a variable assigned another variable is replaced with that variable, as
+  long as neither is assigned again.
+
+Substituted expressions are folded right away, so constants propagate
+through chains of variables and `if` statements with a condition known at
+compile time are removed.
+
+Afterwards stores whose values are never read are removed. Variables that
+are not read at all any more are left to the dead code elimination pass.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Set, Tuple
+
+from zx64c.ast import (
+    Ast,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Identifier,
+    Unsignedint,
+    Bool,
+)
+from zx64c.optimizer.constant_folding import BYTE_MASK, ConstantFoldingVisitor
+from zx64c.optimizer.dead_code import collect_usage, has_side_effects
+
+Value = Tuple[str, object]
+# ^^^ known value of a variable: ("u8", number), ("bool", flag) or
+#     ("copy", name of the variable holding the same value)
+
+
+def _value_of(node: Ast) -> Optional[Value]:
+    if isinstance(node, Unsignedint):
+        return ("u8", node.value & BYTE_MASK)
+    if isinstance(node, Bool):
+        return ("bool", node.value)
+    if isinstance(node, Identifier):
+        return ("copy", node.value)
+    return None
+
+
+def _always_returns(block: Block) -> bool:
+    return any(isinstance(statement, Return) for statement in block.statements)
+
+
+class PropagationVisitor(ConstantFoldingVisitor):
+    """
+    Propagates values of variables within a single function.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Value] = {}
+
+    def _assign(self, name: str, rhs: Ast) -> None:
+        self._values.pop(name, None)
+        copies = [
+            variable
+            for variable, value in self._values.items()
+            if value == ("copy", name)
+        ]
+        for variable in copies:
+            del self._values[variable]
+        value = _value_of(rhs)
+        if value is not None and value != ("copy", name):
+            self._values[name] = value
+
+    def visit_function(self, node: Function) -> Ast:
+        self._values = {}
+        return super().visit_function(node)
+
+    def visit_if(self, node: If) -> Optional[Ast]:
+        condition = node.condition.visit(self)
+        if isinstance(condition, Bool):
+            return node.consequence.visit(self) if condition.value else None
+
+        before = dict(self._values)
+        consequence = node.consequence.visit(self)
+        if _always_returns(consequence):
+            self._values = before
+        else:
+            # The consequence may or may not have been executed
+            self._values = {
+                name: value
+                for name, value in before.items()
+                if self._values.get(name) == value
+            }
+        return If(condition, consequence, node.context)
+
+    def visit_let(self, node: Let) -> Ast:
+        rhs = node.rhs.visit(self)
+        self._assign(node.name, rhs)
+        return Let(node.name, node.var_type, rhs, node.context)
+
+    def visit_assignment(self, node: Assignment) -> Ast:
+        rhs = node.rhs.visit(self)
+        self._assign(node.name, rhs)
+        return Assignment(node.name, rhs, node.context)
+
+    def visit_identifier(self, node: Identifier) -> Ast:
+        value = self._values.get(node.value)
+        if value is None:
+            return node
+        kind, content = value
+        if kind == "u8":
+            return Unsignedint(content, node.context)
+        if kind == "bool":
+            return Bool(content, node.context)
+        return Identifier(content, node.context)
+
+
+def _reads(node: Ast) -> Set[str]:
+    return collect_usage(node).reads
+
+
+class _DeadStoreElimination:
+    """
+    Removes assignments whose values are never read, walking statements
+    backwards with the set of variables that are read later.
+    """
+
+    def __init__(self):
+        self.changed = False
+
+    def block(self, node: Block, live: Set[str]) -> Tuple[Block, Set[str]]:
+        statements = []
+        for statement in reversed(node.statements):
+            statement, live = self.statement(statement, live)
+            if statement is not None:
+                statements.append(statement)
+        return Block(statements[::-1], node.context), live
+
+    def statement(self, node: Ast, live: Set[str]) -> Tuple[Optional[Ast], Set[str]]:
+        if isinstance(node, Block):
+            return self.block(node, live)
+        if isinstance(node, If):
+            consequence, consequence_live = self.block(
+                node.consequence, set() if _always_returns(node.consequence) else live
+            )
+            live = live | consequence_live | _reads(node.condition)
+            return If(node.condition, consequence, node.context), live
+        if isinstance(node, Return):
+            return node, _reads(node.expr)
+        if isinstance(node, Assignment) and node.name not in live:
+            self.changed = True
+            if has_side_effects(node.rhs):
+                return node.rhs, live | _reads(node.rhs)
+            return None, live
+        if isinstance(node, (Let, Assignment)):
+            return node, (live - {node.name}) | _reads(node.rhs)
+        if isinstance(node, Print):
+            return node, live | _reads(node.expression)
+        return node, live | _reads(node)
+
+
+def remove_dead_stores(function: Function) -> Function:
+    elimination = _DeadStoreElimination()
+    code_block, _ = elimination.block(function.code_block, set())
+    if not elimination.changed:
+        return function
+    return Function(
+        function.name,
+        function.parameters,
+        function.return_type,
+        code_block,
+        function.context,
+    )
+
+
+def propagate_values_in_function(function: Function) -> Function:
+    function = function.visit(PropagationVisitor())
+    return remove_dead_stores(function)
+
+
+def propagate_values(program: Program) -> Program:
+    functions = [
+        propagate_values_in_function(function) for function in program.functions
+    ]
+    return Program(functions, program.context)
@@ -0,0 +1,193 @@
+"""
+Measures the phases of a single compilation: the wall time of every phase
+and, in detail, the peak memory allocated during it and the size of its
+result, that is tokens of the scanner, AST nodes of the parser and
+instructions of the code generator.
+
+Memory is traced with `tracemalloc`, which slows Python down, so times
+measured in detail are only good for comparing phases with each other.
+Memory allocated by worker processes of the code generator is not traced.
+"""
+from __future__ import annotations
+
+import time
+import tracemalloc
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from zx64c.ast import (
+    Ast,
+    AstWalker,
+    Program,
+    Function,
+    Block,
+    If,
+    Print,
+    Let,
+    Return,
+    Assignment,
+    Equal,
+    NotEqual,
+    Addition,
+    Subtraction,
+    Negation,
+    FunctionCall,
+    Identifier,
+    Unsignedint,
+    Bool,
+)
+from zx64c.codegen.z80 import Instruction
+from zx64c.scanner import Token
+
+
+class NodeCountVisitor(AstWalker):
+    """
+    Counts all AST nodes of the visited tree.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def visit_program(self, node: Program) -> None:
+        self.count += 1
+        super().visit_program(node)
+
+    def visit_function(self, node: Function) -> None:
+        self.count += 1
+        super().visit_function(node)
+
+    def visit_block(self, node: Block) -> None:
+        self.count += 1
+        super().visit_block(node)
+
+    def visit_if(self, node: If) -> None:
+        self.count += 1
+        super().visit_if(node)
+
+    def visit_print(self, node: Print) -> None:
+        self.count += 1
+        super().visit_print(node)
+
+    def visit_let(self, node: Let) -> None:
+        self.count += 1
+        super().visit_let(node)
+
+    def visit_return(self, node: Return) -> None:
+        self.count += 1
+        super().visit_return(node)
+
+    def visit_assignment(self, node: Assignment) -> None:
+        self.count += 1
+        super().visit_assignment(node)
+
+    def visit_equal(self, node: Equal) -> None:
+        self.count += 1
+        super().visit_equal(node)
+
+    def visit_not_equal(self, node: NotEqual) -> None:
+        self.count += 1
+        super().visit_not_equal(node)
+
+    def visit_addition(self, node: Addition) -> None:
+        self.count += 1
+        super().visit_addition(node)
+
+    def visit_subtraction(self, node: Subtraction) -> None:
+        self.count += 1
+        super().visit_subtraction(node)
+
+    def visit_negation(self, node: Negation) -> None:
+        self.count += 1
+        super().visit_negation(node)
+
+    def visit_function_call(self, node: FunctionCall) -> None:
+        self.count += 1
+        super().visit_function_call(node)
+
+    def visit_identifier(self, node: Identifier) -> None:
+        self.count += 1
+
+    def visit_unsignedint(self, node: Unsignedint) -> None:
+        self.count += 1
+
+    def visit_bool(self, node: Bool) -> None:
+        self.count += 1
+
+
+def count_nodes(ast: Ast) -> int:
+    counter = NodeCountVisitor()
+    ast.visit(counter)
+    return counter.count
+
+
+def _count_result(result: Any) -> Dict[str, int]:
+    if isinstance(result, Ast):
+        return {"nodes": count_nodes(result)}
+    if isinstance(result, list) and result and isinstance(result[0], Token):
+        return {"tokens": len(result)}
+    if isinstance(result, list):
+        instructions = sum(isinstance(item, Instruction) for item in result)
+        return {"instructions": instructions}
+    return {}
+
+
+@dataclass
+class PhaseStats:
+    name: str
+    seconds: float
+    peak_memory: Optional[int] = None
+    # ^^^ bytes, None when memory was not traced
+    tokens: Optional[int] = None
+    nodes: Optional[int] = None
+    instructions: Optional[int] = None
+
+    def __str__(self):
+        parts = [f"{self.name}: {self.seconds * 1000:.3f} ms"]
+        if self.peak_memory is not None:
+            parts.append(f"peak {self.peak_memory / 1024:.1f} KiB")
+        for count in ("tokens", "nodes", "instructions"):
+            if getattr(self, count) is not None:
+                parts.append(f"{getattr(self, count)} {count}")
+        return ", ".join(parts)
+
+
+class PhaseRecorder:
+    """
+    Runs phases of the compilation and keeps their stats.
+
+    :param detailed: trace memory and count the results of phases
+    """
+
+    def __init__(self, detailed: bool = False):
+        self.detailed = detailed
+        self.phases: List[PhaseStats] = []
+
+    def run(self, name: str, phase: Callable[..., Any], *args: Any) -> Any:
+        if self.detailed:
+            tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            result = phase(*args)
+            seconds = time.perf_counter() - start
+            if self.detailed:
+                _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            if self.detailed:
+                tracemalloc.stop()
+
+        if self.detailed:
+            stats = PhaseStats(name, seconds, peak_memory, **_count_result(result))
+        else:
+            stats = PhaseStats(name, seconds)
+        self.phases.append(stats)
+        return result
+
+    def report(self) -> str:
+        """
+        Returns stats of the phases, one phase per line.
+        """
+        lines = [str(phase) for phase in self.phases]
+        total = sum(phase.seconds for phase in self.phases)
+        lines.append(f"total: {total * 1000:.3f} ms")
+        return "\n".join(lines)